@@ -3,6 +3,7 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_jwt_extended import JWTManager
 from flask_cors import CORS
 from flask_mail import Mail
+from werkzeug.middleware.proxy_fix import ProxyFix
 from dotenv import load_dotenv
 import os
 
@@ -18,11 +19,64 @@ def create_app(config=None):
     """Create and configure the Flask application"""
     app = Flask(__name__)
     
+    # Requests resolve the authenticated user once, from the token claims
+    from app.utils.auth import init_auth
+    init_auth(app)
+    
+    # Local caches drop the entries other workers changed before each request
+    from app.utils.coherence import init_coherence
+    init_coherence(app)
+    
     # Configure the app
     app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY')
     app.config['JWT_SECRET_KEY'] = os.environ.get('SECRET_KEY')
     app.config['JWT_ACCESS_TOKEN_EXPIRES'] = 60 * 60 * 6  # 6 hours
     app.config['JWT_REFRESH_TOKEN_EXPIRES'] = 60 * 60 * 24  # 24 hours
+    app.config['ROLE_VERSION_CACHE_SECONDS'] = float(os.environ.get('ROLE_VERSION_CACHE_SECONDS', 30))
+    app.config['AUTH_DEBUG_COUNTERS'] = os.environ.get('AUTH_DEBUG_COUNTERS', 'False').lower() in ('true', '1', 't')
+    
+    # Password hashing configuration
+    app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000')
+    app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS', 0))  # 0: one per CPU core
+    app.config['PASSWORD_HASH_QUEUE_SIZE'] = int(os.environ.get('PASSWORD_HASH_QUEUE_SIZE', 0))  # 0: four per worker
+    app.config['PASSWORD_HASH_TIMEOUT'] = float(os.environ.get('PASSWORD_HASH_TIMEOUT', 10))
+    app.config['PASSWORD_HASH_RETRY_AFTER'] = int(os.environ.get('PASSWORD_HASH_RETRY_AFTER', 2))
+    app.config['PASSWORD_HASH_BULK_WORKERS'] = int(os.environ.get('PASSWORD_HASH_BULK_WORKERS', 0))  # 0: half the CPU cores
+    
+    # OTP storage and send throttling
+    app.config['OTP_TTL'] = int(os.environ.get('OTP_TTL', 60 * 10))  # 10 minutes
+    app.config['OTP_STORE'] = os.environ.get('OTP_STORE', 'sqlite')  # 'sqlite', or 'memory' for a single process
+    app.config['OTP_STORE_PATH'] = os.environ.get('OTP_STORE_PATH', os.path.join(app.instance_path, 'otp_store.sqlite'))
+    app.config['OTP_SEND_EMAIL_BURST'] = int(os.environ.get('OTP_SEND_EMAIL_BURST', 3))
+    app.config['OTP_SEND_EMAIL_REFILL_SECONDS'] = float(os.environ.get('OTP_SEND_EMAIL_REFILL_SECONDS', 60))
+    app.config['OTP_SEND_IP_BURST'] = int(os.environ.get('OTP_SEND_IP_BURST', 0))  # 0: no per-IP bucket
+    app.config['OTP_SEND_IP_REFILL_SECONDS'] = float(os.environ.get('OTP_SEND_IP_REFILL_SECONDS', 10))
+    
+    # Number of proxies in front of the app whose X-Forwarded-For entry is trusted as the client IP
+    app.config['PROXY_FIX_X_FOR'] = int(os.environ.get('PROXY_FIX_X_FOR', 0))
+    
+    # Rate limits per route, as "count/seconds" per client IP and per email; empty disables a limit
+    app.config['RATE_LIMIT_BACKEND'] = os.environ.get('RATE_LIMIT_BACKEND', 'sqlite')  # 'sqlite', or 'memory' for a single process
+    app.config['RATE_LIMIT_PATH'] = os.environ.get('RATE_LIMIT_PATH', os.path.join(app.instance_path, 'rate_limit.sqlite'))
+    app.config['RATE_LIMIT_LOGIN_IP'] = os.environ.get('RATE_LIMIT_LOGIN_IP', '')
+    app.config['RATE_LIMIT_LOGIN_EMAIL'] = os.environ.get('RATE_LIMIT_LOGIN_EMAIL', '10/300')
+    app.config['RATE_LIMIT_VERIFY_OTP_IP'] = os.environ.get('RATE_LIMIT_VERIFY_OTP_IP', '')
+    app.config['RATE_LIMIT_VERIFY_OTP_EMAIL'] = os.environ.get('RATE_LIMIT_VERIFY_OTP_EMAIL', '5/300')
+    app.config['RATE_LIMIT_GET_PASS_IP'] = os.environ.get('RATE_LIMIT_GET_PASS_IP', '')
+    app.config['RATE_LIMIT_GET_PASS_EMAIL'] = os.environ.get('RATE_LIMIT_GET_PASS_EMAIL', '5/300')
+    
+    # Seconds a worker keeps its user directory before reloading it from the database
+    app.config['USER_DIRECTORY_MAX_AGE'] = float(os.environ.get('USER_DIRECTORY_MAX_AGE', 60))
+    
+    # Seconds a worker serves cached teacher scorecards before recomputing them
+    app.config['SCORECARD_MAX_AGE'] = float(os.environ.get('SCORECARD_MAX_AGE', 300))
+    
+    # Number of list responses (batches, subjects, forms, teacher emails) a worker keeps cached
+    app.config['RESPONSE_CACHE_SIZE'] = int(os.environ.get('RESPONSE_CACHE_SIZE', 512))
+    
+    # Cache changes shared between the workers on this host; 'none' for a single process
+    app.config['CACHE_COHERENCE_BACKEND'] = os.environ.get('CACHE_COHERENCE_BACKEND', 'sqlite')  # 'sqlite' or 'none'
+    app.config['CACHE_COHERENCE_PATH'] = os.environ.get('CACHE_COHERENCE_PATH', os.path.join(app.instance_path, 'cache_coherence.sqlite'))
     
     # Database configuration
     app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('MONGODB_URI', 'sqlite:///feedback_portal.db')
@@ -35,12 +89,27 @@ def create_app(config=None):
     app.config['MAIL_USERNAME'] = os.environ.get('EMAIL_HOST_USER')
     app.config['MAIL_PASSWORD'] = os.environ.get('EMAIL_HOST_PASSWORD')
     app.config['MAIL_DEFAULT_SENDER'] = os.environ.get('EMAIL_HOST_USER')
+    app.config['MAIL_POOL_SIZE'] = int(os.environ.get('MAIL_POOL_SIZE', 2))
+    app.config['MAIL_POOL_IDLE_TIMEOUT'] = float(os.environ.get('MAIL_POOL_IDLE_TIMEOUT', 60))
+    app.config['MAIL_MAX_MESSAGES_PER_CONNECTION'] = int(os.environ.get('MAIL_MAX_MESSAGES_PER_CONNECTION', 100))
+    app.config['MAIL_TIMEOUT'] = float(os.environ.get('MAIL_TIMEOUT', 30))
+    
+    # Background job configuration
+    app.config['JOB_POLL_INTERVAL'] = float(os.environ.get('JOB_POLL_INTERVAL', 2))
+    app.config['JOB_MAX_ATTEMPTS'] = int(os.environ.get('JOB_MAX_ATTEMPTS', 5))
+    app.config['JOB_BACKOFF_SECONDS'] = float(os.environ.get('JOB_BACKOFF_SECONDS', 30))
+    app.config['JOB_MAX_BACKOFF_SECONDS'] = float(os.environ.get('JOB_MAX_BACKOFF_SECONDS', 60 * 30))
+    app.config['JOB_LOCK_TIMEOUT'] = float(os.environ.get('JOB_LOCK_TIMEOUT', 60 * 10))
     
     # Initialize extensions with app
     db.init_app(app)
     jwt.init_app(app)
     mail.init_app(app)
     
+    # Client IPs come from X-Forwarded-For only when the number of proxies setting it is known
+    if app.config['PROXY_FIX_X_FOR']:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_FIX_X_FOR'])
+    
     # Enable CORS
     CORS(app, supports_credentials=True)
     
@@ -59,6 +128,10 @@ def create_app(config=None):
     app.register_blueprint(user_bp, url_prefix='/api')
     app.register_blueprint(instance_bp, url_prefix='/api')
     
+    # Compile email templates once at startup
+    from app.utils.email import init_email_templates
+    init_email_templates(app)
+    
     # Create a route for the root path
     @app.route('/')
     def welcome():
@@ -1,6 +1,6 @@
 from app.models.user import User, MyUser
-from app.models.feedback import FeedbackForm, FeedbackUserConnector
+from app.models.feedback import FeedbackForm, FeedbackUserConnector, FeedbackOptionCount, FeedbackQuestionStat
 from app.models.instance import FeedbackInstance, MetaInfo
 from app.models.batch import Batch
 from app.models.subject import Subject, SubjectTheory, SubjectPractical
-from app.models.otp import Otp 
\ No newline at end of file
+from app.models.job import Job
\ No newline at end of file
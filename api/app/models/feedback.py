@@ -3,6 +3,12 @@ from sqlalchemy.dialects.postgresql import JSON
 from sqlalchemy.ext.mutable import MutableDict
 from datetime import datetime
 
+# Batches targeted by each feedback form, mirroring FeedbackForm.batch_list
+form_batch = db.Table('form_batch',
+    db.Column('form_id', db.Integer, db.ForeignKey('feedback_form.id'), primary_key=True),
+    db.Column('batch_id', db.Integer, db.ForeignKey('batch.id'), primary_key=True, index=True)
+)
+
 class FeedbackForm(db.Model):
     """Feedback form model"""
     id = db.Column(db.Integer, primary_key=True)
@@ -18,6 +24,7 @@ class FeedbackForm(db.Model):
     batch_list = db.Column(MutableDict.as_mutable(JSON), nullable=True)
     is_theory = db.Column(db.Boolean, default=True)
     is_alive = db.Column(db.Boolean, default=True)
+    batches = db.relationship('Batch', secondary=form_batch, viewonly=True)
     
     def __repr__(self):
         return f'{self.id}'
@@ -29,8 +36,31 @@ class FeedbackUserConnector(db.Model):
     student = db.relationship('User', backref='feedback_connectors')
     is_filled = db.Column(db.Boolean, default=False)
     user_feedback = db.Column(MutableDict.as_mutable(JSON), nullable=True)  # to store feedback user data
-    form_id = db.Column(db.Integer, db.ForeignKey('feedback_form.id'), nullable=False)
+    # Whether user_feedback is counted in the form's aggregate tables
+    is_counted = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
+    form_id = db.Column(db.Integer, db.ForeignKey('feedback_form.id'), nullable=False, index=True)
     form = db.relationship('FeedbackForm', backref='user_connectors')
     
     def __repr__(self):
-        return f'{self.id}-> id || {self.student.email}->Student' 
\ No newline at end of file
+        return f'{self.id}-> id || {self.student.email}->Student' 
+
+class FeedbackOptionCount(db.Model):
+    """Number of submissions that picked an option for a question of a form"""
+    form_id = db.Column(db.Integer, db.ForeignKey('feedback_form.id'), primary_key=True)
+    question = db.Column(db.String(255), primary_key=True)
+    option = db.Column(db.String(255), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'{self.form_id} form || {self.question}={self.option} x{self.count}'
+
+class FeedbackQuestionStat(db.Model):
+    """Running totals of the answers to a question of a form"""
+    form_id = db.Column(db.Integer, db.ForeignKey('feedback_form.id'), primary_key=True)
+    question = db.Column(db.String(255), primary_key=True)
+    responses = db.Column(db.Integer, nullable=False, default=0)
+    numeric_count = db.Column(db.Integer, nullable=False, default=0)
+    numeric_sum = db.Column(db.Float, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'{self.form_id} form || {self.question} {self.responses} responses'
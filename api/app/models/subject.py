@@ -4,6 +4,9 @@ from sqlalchemy.ext.mutable import MutableDict
 
 class Subject(db.Model):
     """Subject model"""
+    # One subject per name within an instance, so concurrent imports cannot both create it
+    __table_args__ = (db.Index('ix_subject_instance_id_subject_name', 'instance_id', 'subject_name', unique=True),)
+    
     id = db.Column(db.Integer, primary_key=True)
     subject_name = db.Column(db.String(200), nullable=False)
     instance_id = db.Column(db.Integer, db.ForeignKey('feedback_instance.id'), nullable=True)
@@ -1,5 +1,6 @@
 from app import db
 from werkzeug.security import generate_password_hash, check_password_hash
+from app.utils.hashing import configured_hash_method
 
 class User(db.Model):
     """User model equivalent to Django's User model"""
@@ -9,9 +10,11 @@ class User(db.Model):
     password_hash = db.Column(db.String(255), nullable=False)
     is_staff = db.Column(db.Boolean, default=False)
     is_superuser = db.Column(db.Boolean, default=False)
+    # Bumped when the user's permissions change; access tokens issued with an older value are rejected
+    role_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = generate_password_hash(password, method=configured_hash_method())
         
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
@@ -22,7 +25,7 @@ class User(db.Model):
 class MyUser(db.Model):
     """Extension of the User model with additional fields"""
     email = db.Column(db.String(255), primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     user = db.relationship('User', backref=db.backref('myuser', uselist=False))
     name = db.Column(db.String(200), nullable=False)
     age = db.Column(db.Integer, nullable=True)
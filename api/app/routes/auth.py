@@ -1,21 +1,23 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import create_access_token, create_refresh_token, jwt_required, get_jwt_identity
 from werkzeug.security import generate_password_hash, check_password_hash
 import pyotp
 import string
 import random
-from datetime import datetime, timedelta
 from app import db
 from app.models.user import User, MyUser
-from app.models.otp import Otp
-from app.utils.auth import basic_auth, teacher_auth, superuser_auth
+from app.utils.auth import basic_auth, teacher_auth, superuser_auth, get_access_claims
 from app.utils.email import send_otp_email, send_reset_password_email
+from app.utils.hashing import HashingOverloaded, verify_password, hash_password, needs_rehash
+from app.utils.otp_store import get_otp_store
+from app.utils.ratelimit import get_rate_limit_backend, rate_limit, rate_limited_response
+from app.utils.cache import cached_response
 
 auth_bp = Blueprint('auth', __name__)
 
 def get_tokens_for_user(user):
     """Generate access and refresh tokens for the user"""
-    access_token = create_access_token(identity=user.id)
+    access_token = create_access_token(identity=user.id, additional_claims=get_access_claims(user))
     refresh_token = create_refresh_token(identity=user.id)
     
     return {
@@ -23,11 +25,18 @@ def get_tokens_for_user(user):
         'refresh': refresh_token
     }
 
+def overloaded_response(error):
+    """503 response asking the client to retry once the hashing queue drains"""
+    response = jsonify({"status_code": 503, "status_msg": "Server busy, please try again shortly"})
+    response.headers['Retry-After'] = str(int(error.retry_after))
+    return response, 503
+
 def id_generator(size=6, chars=string.ascii_uppercase + string.digits):
     """Generate a random string of fixed length"""
     return ''.join(random.choice(chars) for _ in range(size))
 
 @auth_bp.route('/login', methods=['POST'])
+@rate_limit('login')
 def login():
     """Login a user with email and password"""
     if not request.is_json:
@@ -45,9 +54,22 @@ def login():
     if user is None:
         return jsonify({"status_code": 401, "status_msg": "Invalid email or password"}), 401
 
-    if not user.check_password(password):
+    try:
+        password_ok = verify_password(user.password_hash, password)
+    except HashingOverloaded as e:
+        return overloaded_response(e)
+
+    if not password_ok:
         return jsonify({"status_code": 401, "status_msg": "Invalid email or password"}), 401
 
+    # Upgrade hashes made with an older method or cost while the password is known
+    if needs_rehash(user.password_hash):
+        try:
+            user.password_hash = hash_password(password)
+            db.session.commit()
+        except HashingOverloaded:
+            pass
+
     try:
         my_user = MyUser.query.filter_by(email=email).first()
         
@@ -100,6 +122,16 @@ def send_otp():
     if not email:
         return jsonify({"status_code": 400, "status_msg": "Missing email"}), 400
 
+    # Throttle repeated sends before touching the database or the mail server
+    config = current_app.config
+    buckets = [(f'otp_send:email:{email.lower()}', config['OTP_SEND_EMAIL_BURST'], config['OTP_SEND_EMAIL_REFILL_SECONDS'])]
+    if config['OTP_SEND_IP_BURST']:
+        buckets.append((f'otp_send:ip:{request.remote_addr}', config['OTP_SEND_IP_BURST'], config['OTP_SEND_IP_REFILL_SECONDS']))
+    # All buckets are checked before any is drawn from, so a throttled email does not use up the IP's sends
+    retry_after = get_rate_limit_backend().take_tokens(buckets)
+    if retry_after:
+        return rate_limited_response(retry_after)
+
     user = User.query.filter_by(email=email).first()
     
     if user is None:
@@ -110,16 +142,8 @@ def send_otp():
         totp = pyotp.TOTP(pyotp.random_base32())
         otp = totp.now()
         
-        # Store the OTP in the database
-        existing_otp = Otp.query.filter_by(LoginUser=user).first()
-        if existing_otp:
-            existing_otp.Otp = otp
-            existing_otp.timeOfGeneration = datetime.utcnow()
-        else:
-            new_otp = Otp(Otp=otp, LoginUser=user)
-            db.session.add(new_otp)
-        
-        db.session.commit()
+        # Keep the OTP until it expires; a new one replaces the previous
+        get_otp_store().put(email, otp, config['OTP_TTL'])
         
         # Send the OTP via email
         send_otp_email(email, otp)
@@ -130,6 +154,7 @@ def send_otp():
         return jsonify({"status_code": 500, "status_msg": str(e)}), 500
 
 @auth_bp.route('/verifyOtp', methods=['POST'])
+@rate_limit('verify_otp')
 def verify_otp():
     """Verify OTP entered by the user"""
     if not request.is_json:
@@ -148,20 +173,20 @@ def verify_otp():
         return jsonify({"status_code": 404, "status_msg": "User not found"}), 404
     
     try:
-        stored_otp = Otp.query.filter_by(LoginUser=user).first()
+        store = get_otp_store()
+        stored_otp = store.get(email)
         
+        # Expired OTPs are dropped by the store
         if not stored_otp:
-            return jsonify({"status_code": 404, "status_msg": "OTP not found"}), 404
-        
-        # Check if OTP is expired (10 minutes validity)
-        time_diff = datetime.utcnow() - stored_otp.timeOfGeneration
-        if time_diff > timedelta(minutes=10):
-            return jsonify({"status_code": 400, "status_msg": "OTP expired"}), 400
+            return jsonify({"status_code": 404, "status_msg": "OTP not found or expired"}), 404
         
         # Verify OTP
-        if stored_otp.Otp != otp:
+        if stored_otp != otp:
             return jsonify({"status_code": 400, "status_msg": "Invalid OTP"}), 400
         
+        # An OTP can only be used once
+        store.delete(email)
+        
         # Mark user as verified
         my_user = MyUser.query.filter_by(email=email).first()
         my_user.isVerified = True
@@ -233,6 +258,7 @@ def reset_password_mail():
         return jsonify({"status_code": 500, "status_msg": str(e)}), 500
 
 @auth_bp.route('/getPass', methods=['POST'])
+@rate_limit('get_pass')
 def get_pass():
     """Verify reset password token"""
     if not request.is_json:
@@ -297,7 +323,7 @@ def refresh_token():
         return jsonify({"status_code": 404, "status_msg": "User not found"}), 404
     
     # Generate new access token
-    access_token = create_access_token(identity=current_user_id)
+    access_token = create_access_token(identity=current_user_id, additional_claims=get_access_claims(user))
     
     return jsonify({"access": access_token}), 200
 
@@ -354,6 +380,7 @@ def create_teacher():
 
 @auth_bp.route('/getAllTeacherMails', methods=['GET'])
 @basic_auth
+@cached_response
 def get_all_staff_emails():
     """Get a list of all teacher emails"""
     users = User.query.filter_by(is_staff=True).all()
@@ -1,14 +1,18 @@
 from flask import Blueprint, request, jsonify
+from sqlalchemy import func, select, delete
 from app import db
-from app.models.batch import Batch
-from app.models.user import User, MyUser
+from app.models.batch import Batch, batch_student_association
+from app.models.feedback import FeedbackForm, form_batch
 from app.models.instance import FeedbackInstance
 from app.utils.auth import basic_auth, teacher_auth, superuser_auth
+from app.utils.membership import set_batch_members
+from app.utils.cache import cached_response, bump_data_version
 
 batch_bp = Blueprint('batch', __name__)
 
 @batch_bp.route('/getBatches', methods=['GET'])
 @basic_auth
+@cached_response
 def get_batches():
     """Get all batches with optional instance filtering"""
     instance_id = request.args.get('instance_id')
@@ -40,6 +44,7 @@ def get_batches():
 
 @batch_bp.route('/getYrBatches', methods=['GET'])
 @basic_auth
+@cached_response
 def get_yr_batches():
     """Get batches for a specific year"""
     year = request.args.get('year')
@@ -80,34 +85,30 @@ def get_year_batches():
     instance_id = request.args.get('instance_id')
     
     try:
-        query = Batch.query
+        # Batches with their student counts, in one grouped query
+        student_count = func.count(batch_student_association.c.myuser_email)
+        query = db.session.query(
+            Batch.year, Batch.id, Batch.batch_name, Batch.batch_division, student_count
+        ).outerjoin(
+            batch_student_association, batch_student_association.c.batch_id == Batch.id
+        )
         
         if instance_id:
-            query = query.filter_by(instance_id=instance_id)
+            query = query.filter(Batch.instance_id == instance_id)
         
-        # Get distinct years
-        years = db.session.query(Batch.year).distinct().all()
-        years = [year[0] for year in years]
+        rows = query.group_by(Batch.id).order_by(Batch.year, Batch.id).all()
         
         result = []
-        for year in years:
-            year_batches = query.filter_by(year=year).all()
-            
-            batches_data = []
-            for batch in year_batches:
-                batch_data = {
-                    "id": batch.id,
-                    "batch_name": batch.batch_name,
-                    "batch_division": batch.batch_division,
-                    "student_count": len(batch.student_email_mtm)
-                }
-                batches_data.append(batch_data)
+        for year, batch_id, batch_name, batch_division, count in rows:
+            if not result or result[-1]["year"] != year:
+                result.append({"year": year, "batches": []})
             
-            year_data = {
-                "year": year,
-                "batches": batches_data
-            }
-            result.append(year_data)
+            result[-1]["batches"].append({
+                "id": batch_id,
+                "batch_name": batch_name,
+                "batch_division": batch_division,
+                "student_count": count
+            })
         
         return jsonify({
             "status_code": 200,
@@ -159,20 +160,17 @@ def create_batch():
         db.session.flush()  # To get the batch ID
         
         # Add students to batch
-        if student_emails:
-            for email in student_emails:
-                user = User.query.filter_by(email=email).first()
-                if user:
-                    my_user = MyUser.query.filter_by(email=email).first()
-                    if my_user:
-                        new_batch.student_email_mtm.append(my_user)
+        added, _, not_found = set_batch_members(new_batch.id, student_emails)
         
         db.session.commit()
+        bump_data_version(new_batch.instance_id)
         
         return jsonify({
             "status_code": 200,
             "status_msg": "Batch created successfully",
-            "batch_id": new_batch.id
+            "batch_id": new_batch.id,
+            "added": len(added),
+            "not_found": not_found
         }), 200
     
     except Exception as e:
@@ -199,6 +197,8 @@ def update_batch():
         if not batch:
             return jsonify({"status_code": 404, "status_msg": "Batch not found"}), 404
         
+        old_instance_id = batch.instance_id
+        
         # Update batch fields
         if 'batch_name' in data:
             batch.batch_name = data['batch_name']
@@ -214,23 +214,20 @@ def update_batch():
             if instance:
                 batch.instance = instance
         
+        added, removed, not_found = set(), set(), []
         if 'student_emails' in data:
-            # Clear existing students
-            batch.student_email_mtm.clear()
-            
-            # Add new students
-            for email in data['student_emails']:
-                user = User.query.filter_by(email=email).first()
-                if user:
-                    my_user = MyUser.query.filter_by(email=email).first()
-                    if my_user:
-                        batch.student_email_mtm.append(my_user)
+            # Apply only the membership changes
+            added, removed, not_found = set_batch_members(batch.id, data['student_emails'])
         
         db.session.commit()
+        bump_data_version(old_instance_id, batch.instance_id)
         
         return jsonify({
             "status_code": 200,
-            "status_msg": "Batch updated successfully"
+            "status_msg": "Batch updated successfully",
+            "added": len(added),
+            "removed": len(removed),
+            "not_found": not_found
         }), 200
     
     except Exception as e:
@@ -257,9 +254,20 @@ def delete_batch():
         if not batch:
             return jsonify({"status_code": 404, "status_msg": "Batch not found"}), 404
         
+        # Drop the batch from the forms that target it
+        form_ids = db.session.execute(
+            select(form_batch.c.form_id).where(form_batch.c.batch_id == batch.id)
+        ).scalars().all()
+        for form in FeedbackForm.query.filter(FeedbackForm.id.in_(form_ids)):
+            if form.batch_list:
+                form.batch_list.pop(str(batch.id), None)
+        db.session.execute(delete(form_batch).where(form_batch.c.batch_id == batch.id))
+        
         # Delete the batch
         db.session.delete(batch)
         db.session.commit()
+        # Forms of any instance may have listed the batch
+        bump_data_version()
         
         return jsonify({
             "status_code": 200,
@@ -1,21 +1,33 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 from datetime import datetime
+from sqlalchemy.orm import joinedload
 from app import db
-from app.models.feedback import FeedbackForm, FeedbackUserConnector
+from app.models.feedback import FeedbackForm, FeedbackUserConnector, form_batch
 from app.models.user import User, MyUser
 from app.models.subject import Subject
 from app.models.batch import Batch
 from app.models.instance import FeedbackInstance
-from app.utils.auth import basic_auth, teacher_auth
-from app.utils.email import send_feedback_reminder
+from app.models.job import Job
+from app.utils.auth import basic_auth, teacher_auth, superuser_auth
+from app.utils.connectors import create_form_connectors, sync_form_connectors, set_form_batches
+from app.utils.export import generate_csv, generate_ndjson
+from app.utils.aggregates import apply_feedback_change, clear_form_aggregates, rebuild_form_aggregates, form_summary
+from app.utils.scorecard import get_instance_scorecards, invalidate_scorecards
+from app.utils.cache import cached_response, bump_data_version
+from app.utils.jobs import job_status
+from app.utils.reminders import queue_feedback_reminder
 
 feedback_bp = Blueprint('feedback', __name__)
 
+# Page size bounds for getFeedbackData
+FEEDBACK_DATA_PAGE_SIZE = 500
+FEEDBACK_DATA_MAX_PAGE_SIZE = 1000
+
 @feedback_bp.route('/createFeedbackForm', methods=['POST'])
 @basic_auth
 def create_feedback_form():
     """Create a new feedback form"""
-    if not request.current_user.is_staff:
+    if not request.identity.is_staff:
         return jsonify({"status_code": 403, "status_msg": "Permission denied"}), 403
     
     if not request.is_json:
@@ -58,7 +70,7 @@ def create_feedback_form():
         # Create feedback form
         new_form = FeedbackForm(
             form_field=form_field,
-            teacher=request.current_user,
+            teacher_id=request.identity.user_id,
             subject=subject,
             instance=instance,
             due_date=due_date,
@@ -72,26 +84,18 @@ def create_feedback_form():
         db.session.flush()  # To get the form ID
         
         # Create connectors for students in the batches
-        if batch_list:
-            for batch_id in batch_list:
-                batch = Batch.query.get(batch_id)
-                if batch:
-                    for student in batch.student_email_mtm:
-                        user = User.query.filter_by(email=student.email).first()
-                        if user:
-                            connector = FeedbackUserConnector(
-                                student=user,
-                                is_filled=False,
-                                form=new_form
-                            )
-                            db.session.add(connector)
+        set_form_batches(new_form.id, batch_list)
+        connector_count = create_form_connectors(new_form.id, batch_list)
         
         db.session.commit()
+        invalidate_scorecards(new_form.instance_id)
+        bump_data_version(new_form.instance_id)
         
         return jsonify({
             "status_code": 200,
             "status_msg": "Feedback form created successfully",
-            "form_id": new_form.id
+            "form_id": new_form.id,
+            "connector_count": connector_count
         }), 200
     
     except Exception as e:
@@ -102,7 +106,7 @@ def create_feedback_form():
 @basic_auth
 def update_feedback_form():
     """Update an existing feedback form"""
-    if not request.current_user.is_staff:
+    if not request.identity.is_staff:
         return jsonify({"status_code": 403, "status_msg": "Permission denied"}), 403
     
     if not request.is_json:
@@ -120,6 +124,8 @@ def update_feedback_form():
         if not form:
             return jsonify({"status_code": 404, "status_msg": "Feedback form not found"}), 404
         
+        old_instance_id = form.instance_id
+        
         # Update form fields
         if 'form_field' in data:
             form.form_field = data['form_field']
@@ -144,45 +150,11 @@ def update_feedback_form():
             form.year = data['year']
         
         if 'batch_list' in data:
-            old_batch_list = form.batch_list or []
-            new_batch_list = data['batch_list']
-            form.batch_list = new_batch_list
-            
-            # Add new connectors for new batches
-            for batch_id in new_batch_list:
-                if batch_id not in old_batch_list:
-                    batch = Batch.query.get(batch_id)
-                    if batch:
-                        for student in batch.student_email_mtm:
-                            user = User.query.filter_by(email=student.email).first()
-                            if user:
-                                # Check if connector already exists
-                                existing = FeedbackUserConnector.query.filter_by(
-                                    student=user, form=form
-                                ).first()
-                                
-                                if not existing:
-                                    connector = FeedbackUserConnector(
-                                        student=user,
-                                        is_filled=False,
-                                        form=form
-                                    )
-                                    db.session.add(connector)
+            form.batch_list = data['batch_list']
+            set_form_batches(form.id, data['batch_list'])
             
-            # Remove connectors for removed batches
-            for batch_id in old_batch_list:
-                if batch_id not in new_batch_list:
-                    batch = Batch.query.get(batch_id)
-                    if batch:
-                        for student in batch.student_email_mtm:
-                            user = User.query.filter_by(email=student.email).first()
-                            if user:
-                                connector = FeedbackUserConnector.query.filter_by(
-                                    student=user, form=form
-                                ).first()
-                                
-                                if connector:
-                                    db.session.delete(connector)
+            # Add and remove only the connectors that differ
+            sync_form_connectors(form.id, data['batch_list'])
         
         if 'is_theory' in data:
             form.is_theory = data['is_theory']
@@ -191,6 +163,9 @@ def update_feedback_form():
             form.is_alive = data['is_alive']
         
         db.session.commit()
+        invalidate_scorecards(old_instance_id)
+        invalidate_scorecards(form.instance_id)
+        bump_data_version(old_instance_id, form.instance_id)
         
         return jsonify({
             "status_code": 200,
@@ -205,7 +180,7 @@ def update_feedback_form():
 @basic_auth
 def delete_feedback_form():
     """Delete a feedback form"""
-    if not request.current_user.is_staff:
+    if not request.identity.is_staff:
         return jsonify({"status_code": 403, "status_msg": "Permission denied"}), 403
     
     if not request.is_json:
@@ -223,12 +198,17 @@ def delete_feedback_form():
         if not form:
             return jsonify({"status_code": 404, "status_msg": "Feedback form not found"}), 404
         
-        # Delete all connectors first
+        # Delete all connectors, aggregates and batch links first
         FeedbackUserConnector.query.filter_by(form=form).delete()
+        clear_form_aggregates(form.id)
+        set_form_batches(form.id, [])
         
         # Delete the form
+        instance_id = form.instance_id
         db.session.delete(form)
         db.session.commit()
+        invalidate_scorecards(instance_id)
+        bump_data_version(instance_id)
         
         return jsonify({
             "status_code": 200,
@@ -241,9 +221,11 @@ def delete_feedback_form():
 
 @feedback_bp.route('/getFeedbackForm', methods=['GET'])
 @basic_auth
+@cached_response
 def get_feedback_form():
     """Get feedback forms with optional filtering"""
     instance_id = request.args.get('instance_id')
+    batch_id = request.args.get('batch_id', type=int)
     
     try:
         query = FeedbackForm.query
@@ -251,6 +233,9 @@ def get_feedback_form():
         if instance_id:
             query = query.filter_by(instance_id=instance_id)
         
+        if batch_id:
+            query = query.join(form_batch, form_batch.c.form_id == FeedbackForm.id).filter(form_batch.c.batch_id == batch_id)
+        
         forms = query.all()
         
         result = []
@@ -278,46 +263,186 @@ def get_feedback_form():
 @feedback_bp.route('/getFeedbackData', methods=['GET'])
 @basic_auth
 def get_feedback_data():
-    """Get detailed feedback data for a specific form"""
-    form_id = request.args.get('form_id')
+    """Get detailed feedback data for a specific form, one page of students at a time"""
+    form_id = request.args.get('form_id', type=int)
+    after_id = request.args.get('after_id', 0, type=int)
+    limit = request.args.get('limit', FEEDBACK_DATA_PAGE_SIZE, type=int)
     
     if not form_id:
         return jsonify({"status_code": 400, "status_msg": "Missing form ID"}), 400
     
+    limit = max(1, min(limit, FEEDBACK_DATA_MAX_PAGE_SIZE))
+    
     try:
-        form = FeedbackForm.query.get(form_id)
+        form = FeedbackForm.query.options(
+            joinedload(FeedbackForm.teacher).joinedload(User.myuser),
+            joinedload(FeedbackForm.subject)
+        ).filter_by(id=form_id).first()
         
         if not form:
             return jsonify({"status_code": 404, "status_msg": "Feedback form not found"}), 404
         
-        connectors = FeedbackUserConnector.query.filter_by(form=form).all()
+        # Students and their profiles in a single keyset-paginated query
+        rows = db.session.query(
+            FeedbackUserConnector.id,
+            FeedbackUserConnector.is_filled,
+            FeedbackUserConnector.user_feedback,
+            User.username,
+            MyUser.name
+        ).join(
+            User, User.id == FeedbackUserConnector.student_id
+        ).join(
+            MyUser, MyUser.user_id == User.id
+        ).filter(
+            FeedbackUserConnector.form_id == form.id,
+            FeedbackUserConnector.id > after_id
+        ).order_by(FeedbackUserConnector.id).limit(limit + 1).all()
+        
+        has_more = len(rows) > limit
+        rows = rows[:limit]
         
         result = []
-        for connector in connectors:
-            student = connector.student
-            my_user = MyUser.query.filter_by(user=student).first()
-            
-            if my_user:
-                connector_data = {
-                    "student": student.username,
-                    "student_name": my_user.name,
-                    "is_filled": connector.is_filled,
-                    "user_feedback": connector.user_feedback,
-                    "teacher_name": form.teacher.myuser.name,
-                    "teacher_email": form.teacher.username,
-                    "subject": form.subject.subject_name,
-                    "due_date": form.due_date.isoformat(),
-                    "year": form.year,
-                    "is_theory": form.is_theory,
-                    "is_alive": form.is_alive,
-                    "subject_id": form.subject.id,
-                    "form_id": form.id
-                }
-                result.append(connector_data)
+        for connector_id, is_filled, user_feedback, username, name in rows:
+            result.append({
+                "id": connector_id,
+                "student": username,
+                "student_name": name,
+                "is_filled": is_filled,
+                "user_feedback": user_feedback
+            })
+        
+        teacher_profile = form.teacher.myuser
+        form_data = {
+            "form_id": form.id,
+            "teacher_name": teacher_profile.name if teacher_profile else None,
+            "teacher_email": form.teacher.username,
+            "subject": form.subject.subject_name,
+            "subject_id": form.subject.id,
+            "due_date": form.due_date.isoformat(),
+            "year": form.year,
+            "is_theory": form.is_theory,
+            "is_alive": form.is_alive
+        }
         
         return jsonify({
             "status_code": 200,
-            "data": result
+            "form": form_data,
+            "data": result,
+            "next_after_id": result[-1]["id"] if has_more else None
+        }), 200
+    
+    except Exception as e:
+        return jsonify({"status_code": 500, "status_msg": str(e)}), 500
+
+@feedback_bp.route('/exportFeedbackData', methods=['GET'])
+@basic_auth
+@teacher_auth
+def export_feedback_data():
+    """Stream feedback results of a form or a whole instance as CSV or NDJSON"""
+    form_id = request.args.get('form_id', type=int)
+    instance_id = request.args.get('instance_id', type=int)
+    export_format = request.args.get('format', 'csv').lower()
+    
+    if not form_id and not instance_id:
+        return jsonify({"status_code": 400, "status_msg": "Missing form ID or instance ID"}), 400
+    
+    if export_format not in ('csv', 'ndjson'):
+        return jsonify({"status_code": 400, "status_msg": "Unsupported export format"}), 400
+    
+    try:
+        query = FeedbackForm.query.options(
+            joinedload(FeedbackForm.teacher),
+            joinedload(FeedbackForm.subject)
+        )
+        
+        if form_id:
+            query = query.filter_by(id=form_id)
+        else:
+            query = query.filter_by(instance_id=instance_id)
+        
+        forms = query.order_by(FeedbackForm.id).all()
+        
+        if not forms:
+            return jsonify({"status_code": 404, "status_msg": "Feedback form not found"}), 404
+        
+        filename = f"feedback_form_{form_id}" if form_id else f"feedback_instance_{instance_id}"
+        
+        if export_format == 'csv':
+            body = generate_csv(forms)
+            mimetype = 'text/csv'
+        else:
+            body = generate_ndjson(forms)
+            mimetype = 'application/x-ndjson'
+        
+        return Response(
+            stream_with_context(body),
+            mimetype=mimetype,
+            headers={"Content-Disposition": f"attachment; filename={filename}.{export_format}"}
+        )
+    
+    except Exception as e:
+        return jsonify({"status_code": 500, "status_msg": str(e)}), 500
+
+@feedback_bp.route('/getFeedbackSummary', methods=['GET'])
+@basic_auth
+def get_feedback_summary():
+    """Get per-question answer counts and averages for a form"""
+    form_id = request.args.get('form_id', type=int)
+    rebuild = request.args.get('rebuild', 'false').lower() in ('true', '1')
+    
+    if not form_id:
+        return jsonify({"status_code": 400, "status_msg": "Missing form ID"}), 400
+    
+    try:
+        form = FeedbackForm.query.get(form_id)
+        
+        if not form:
+            return jsonify({"status_code": 404, "status_msg": "Feedback form not found"}), 404
+        
+        # Recompute from stored submissions, e.g. for forms filled before aggregates existed
+        if rebuild:
+            if not request.identity.is_staff:
+                return jsonify({"status_code": 403, "status_msg": "Permission denied"}), 403
+            rebuild_form_aggregates(form.id)
+            db.session.commit()
+        
+        filled_count = FeedbackUserConnector.query.filter_by(form_id=form.id, is_filled=True).count()
+        
+        return jsonify({
+            "status_code": 200,
+            "form_id": form.id,
+            "filled_count": filled_count,
+            "data": form_summary(form.id)
+        }), 200
+    
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"status_code": 500, "status_msg": str(e)}), 500
+
+@feedback_bp.route('/getTeacherScorecard', methods=['GET'])
+@basic_auth
+@superuser_auth
+def get_teacher_scorecard():
+    """Get feedback scorecards of every teacher in an instance"""
+    instance_id = request.args.get('instance_id', type=int)
+    
+    if not instance_id:
+        return jsonify({"status_code": 400, "status_msg": "Missing instance ID"}), 400
+    
+    try:
+        instance = FeedbackInstance.query.get(instance_id)
+        
+        if not instance:
+            return jsonify({"status_code": 404, "status_msg": "Instance not found"}), 404
+        
+        scorecards, computed_at = get_instance_scorecards(instance.id)
+        
+        return jsonify({
+            "status_code": 200,
+            "instance_id": instance.id,
+            "computed_at": computed_at.isoformat(),
+            "percentile_scope": "instance",
+            "data": scorecards
         }), 200
     
     except Exception as e:
@@ -340,15 +465,20 @@ def save_feedback_form_result():
     try:
         # Find the connector
         connector = FeedbackUserConnector.query.filter_by(
-            form_id=form_id, student=request.current_user
+            form_id=form_id, student_id=request.identity.user_id
         ).first()
         
         if not connector:
             return jsonify({"status_code": 404, "status_msg": "Feedback form not found for this user"}), 404
         
+        # Replace this student's previous answers in the form aggregates
+        old_feedback = connector.user_feedback if connector.is_counted else None
+        apply_feedback_change(connector.form_id, old_feedback, feedback_data)
+        
         # Save the feedback data
         connector.user_feedback = feedback_data
         connector.is_filled = True
+        connector.is_counted = True
         
         db.session.commit()
         
@@ -365,7 +495,7 @@ def save_feedback_form_result():
 @basic_auth
 @teacher_auth
 def send_reminder():
-    """Send reminder emails to students who haven't filled the feedback form"""
+    """Queue reminder emails to students who haven't filled the feedback form"""
     if not request.is_json:
         return jsonify({"status_code": 400, "status_msg": "Missing JSON in request"}), 400
     
@@ -381,26 +511,50 @@ def send_reminder():
         if not form:
             return jsonify({"status_code": 404, "status_msg": "Feedback form not found"}), 404
         
-        # Get connectors for students who haven't filled the form
-        unfilled_connectors = FeedbackUserConnector.query.filter_by(
+        # Check whether any student still has to fill the form
+        unfilled_count = FeedbackUserConnector.query.filter_by(
             form=form, is_filled=False
-        ).all()
+        ).count()
         
-        if not unfilled_connectors:
+        if not unfilled_count:
             return jsonify({
                 "status_code": 200,
                 "status_msg": "No reminders needed, all students have filled the form"
             }), 200
         
-        # Get the list of email addresses
-        email_list = [connector.student.email for connector in unfilled_connectors]
+        # Emails are sent by the background worker
+        job = queue_feedback_reminder(form)
+        db.session.commit()
+        
+        return jsonify({
+            "status_code": 202,
+            "status_msg": "Reminder emails queued",
+            "job_id": job.id
+        }), 202
+    
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"status_code": 500, "status_msg": str(e)}), 500
+
+@feedback_bp.route('/getJobStatus', methods=['GET'])
+@basic_auth
+@teacher_auth
+def get_job_status():
+    """Get the progress of a background job"""
+    job_id = request.args.get('job_id', type=int)
+    
+    if not job_id:
+        return jsonify({"status_code": 400, "status_msg": "Missing job ID"}), 400
+    
+    try:
+        job = Job.query.get(job_id)
         
-        # Send reminder emails
-        send_feedback_reminder(email_list, form)
+        if not job:
+            return jsonify({"status_code": 404, "status_msg": "Job not found"}), 404
         
         return jsonify({
             "status_code": 200,
-            "status_msg": "Reminder emails sent successfully"
+            "data": job_status(job)
         }), 200
     
     except Exception as e:
@@ -413,7 +567,7 @@ def get_s_dash_data():
     try:
         # Get active forms for the current student
         connectors = FeedbackUserConnector.query.filter_by(
-            student=request.current_user, is_filled=False
+            student_id=request.identity.user_id, is_filled=False
         ).join(FeedbackForm).filter_by(is_alive=True).all()
         
         result = []
@@ -447,7 +601,7 @@ def get_s_dash_data_filled():
     try:
         # Get forms filled by the current student
         connectors = FeedbackUserConnector.query.filter_by(
-            student=request.current_user, is_filled=True
+            student_id=request.identity.user_id, is_filled=True
         ).all()
         
         result = []
@@ -492,7 +646,7 @@ def get_s_dash_data_form():
         
         # Get the connector for the current student
         connector = FeedbackUserConnector.query.filter_by(
-            form=form, student=request.current_user
+            form=form, student_id=request.identity.user_id
         ).first()
         
         if not connector:
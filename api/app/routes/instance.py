@@ -4,6 +4,10 @@ import random
 from app import db
 from app.models.instance import FeedbackInstance, MetaInfo
 from app.utils.auth import basic_auth, teacher_auth, superuser_auth
+from app.utils.mailer import get_smtp_pool
+from app.utils.rollover import clone_instance
+from app.utils.cache import bump_data_version, get_response_cache, teacher_name_cache
+from app.utils.coherence import get_coherence_store
 
 instance_bp = Blueprint('instance', __name__)
 
@@ -21,16 +25,25 @@ def create_new_instance():
     
     data = request.json
     instance_name = data.get('instance_name')
+    clone_from = data.get('clone_from')
+    max_year = data.get('max_year')
     
     if not instance_name:
         return jsonify({"status_code": 400, "status_msg": "Missing instance name"}), 400
     
+    if max_year is not None and not isinstance(max_year, int):
+        return jsonify({"status_code": 400, "status_msg": "Invalid max year"}), 400
+    
     try:
         # Check if an instance with the same name already exists
         existing_instance = FeedbackInstance.query.filter_by(instance_name=instance_name).first()
         if existing_instance:
             return jsonify({"status_code": 400, "status_msg": "Instance with this name already exists"}), 400
         
+        # Check if the instance to copy from exists if provided
+        if clone_from and not FeedbackInstance.query.get(clone_from):
+            return jsonify({"status_code": 404, "status_msg": "Instance to clone not found"}), 404
+        
         # Get the current latest instance
         latest_instance = FeedbackInstance.query.filter_by(is_latest=True).first()
         
@@ -51,12 +64,21 @@ def create_new_instance():
             if latest_instance.is_selected:
                 latest_instance.is_selected = False
         
+        # Roll the batches, subjects and allocations of an earlier instance over
+        mapping = None
+        if clone_from:
+            db.session.flush()  # To get the instance ID
+            mapping = clone_instance(clone_from, new_instance.id, bool(data.get('promote_years')), max_year)
+        
         db.session.commit()
+        # The selected instance changed, which shows on forms of every instance
+        bump_data_version()
         
         return jsonify({
             "status_code": 200,
             "status_msg": "Instance created successfully",
-            "instance_id": new_instance.id
+            "instance_id": new_instance.id,
+            "mapping": mapping
         }), 200
     
     except Exception as e:
@@ -90,4 +112,29 @@ def generate_secret_code():
     
     except Exception as e:
         db.session.rollback()
-        return jsonify({"status_code": 500, "status_msg": str(e)}), 500 
\ No newline at end of file
+        return jsonify({"status_code": 500, "status_msg": str(e)}), 500 
+
+@instance_bp.route('/mailStats', methods=['GET'])
+@basic_auth
+@superuser_auth
+def mail_stats():
+    """Get connection reuse and latency counters of the outbound mail pool"""
+    return jsonify({
+        "status_code": 200,
+        "data": get_smtp_pool().stats()
+    }), 200
+
+@instance_bp.route('/cacheStats', methods=['GET'])
+@basic_auth
+@superuser_auth
+def cache_stats():
+    """Get hit and miss counters of the caches and the latency of changes from other workers"""
+    store = get_coherence_store()
+    return jsonify({
+        "status_code": 200,
+        "data": {
+            "responses": get_response_cache().stats(),
+            "teacher_names": teacher_name_cache.stats(),
+            "coherence": store.stats() if store else {"backend": "none"}
+        }
+    }), 200
@@ -1,42 +1,52 @@
 from flask import Blueprint, request, jsonify
+from sqlalchemy.orm import joinedload, selectinload
 from app import db
 from app.models.subject import Subject, SubjectTheory, SubjectPractical
 from app.models.instance import FeedbackInstance
 from app.models.batch import Batch
-from app.models.user import User, MyUser
 from app.utils.auth import basic_auth, teacher_auth, superuser_auth
+from app.utils.cache import teacher_names, cached_response, bump_data_version
+from app.utils.timetable import import_timetable
 
 subject_bp = Blueprint('subject', __name__)
 
 @subject_bp.route('/getallsubjects', methods=['GET'])
 @basic_auth
+@cached_response
 def get_all_subjects():
     """Get all subjects with optional instance filtering"""
     instance_id = request.args.get('instance_id')
     
     try:
-        query = Subject.query
+        # Subjects with their theory and practical rows and batches, in a fixed number of queries
+        query = Subject.query.options(
+            joinedload(Subject.instance),
+            selectinload(Subject.theory_subjects).joinedload(SubjectTheory.batch),
+            selectinload(Subject.practical_subjects).joinedload(SubjectPractical.batch)
+        )
         
         if instance_id:
             query = query.filter_by(instance_id=instance_id)
         
         subjects = query.all()
         
+        # Resolve every teacher named on the page at once
+        teacher_ids = set()
+        for subject in subjects:
+            for theory in subject.theory_subjects:
+                teacher_ids.update(theory.sub_teacher_email or ())
+            for practical in subject.practical_subjects:
+                teacher_ids.update(practical.prac_teacher_email or ())
+        names = teacher_names(teacher_ids)
+        
         result = []
         for subject in subjects:
             # Get theory subjects
-            theory_subjects = SubjectTheory.query.filter_by(subject=subject).all()
             theory_data = []
             
-            for theory in theory_subjects:
+            for theory in sorted(subject.theory_subjects, key=lambda row: row.id):
                 batch = theory.batch
-                teacher_ids = theory.sub_teacher_email
-                teachers = []
-                
-                for teacher_id in teacher_ids:
-                    user = User.query.get(teacher_id)
-                    if user and hasattr(user, 'myuser'):
-                        teachers.append(user.myuser.name)
+                teachers = [names[int(teacher_id)] for teacher_id in theory.sub_teacher_email if int(teacher_id) in names]
                 
                 theory_data.append({
                     "id": theory.id,
@@ -48,18 +58,11 @@ def get_all_subjects():
                 })
             
             # Get practical subjects
-            practical_subjects = SubjectPractical.query.filter_by(subject=subject).all()
             practical_data = []
             
-            for practical in practical_subjects:
+            for practical in sorted(subject.practical_subjects, key=lambda row: row.id):
                 batch = practical.batch
-                teacher_ids = practical.prac_teacher_email
-                teachers = []
-                
-                for teacher_id in teacher_ids:
-                    user = User.query.get(teacher_id)
-                    if user and hasattr(user, 'myuser'):
-                        teachers.append(user.myuser.name)
+                teachers = [names[int(teacher_id)] for teacher_id in practical.prac_teacher_email if int(teacher_id) in names]
                 
                 practical_data.append({
                     "id": practical.id,
@@ -107,8 +110,10 @@ def delete_subject(subject_id):
         SubjectPractical.query.filter_by(subject=subject).delete()
         
         # Delete the subject
+        instance_id = subject.instance_id
         db.session.delete(subject)
         db.session.commit()
+        bump_data_version(instance_id)
         
         return jsonify({
             "status_code": 200,
@@ -168,6 +173,7 @@ def add_theory_subject():
         
         db.session.add(theory_subject)
         db.session.commit()
+        bump_data_version(subject.instance_id)
         
         return jsonify({
             "status_code": 200,
@@ -229,6 +235,7 @@ def add_practical_subject():
         
         db.session.add(practical_subject)
         db.session.commit()
+        bump_data_version(subject.instance_id)
         
         return jsonify({
             "status_code": 200,
@@ -239,4 +246,43 @@ def add_practical_subject():
     
     except Exception as e:
         db.session.rollback()
-        return jsonify({"status_code": 500, "status_msg": str(e)}), 500 
\ No newline at end of file
+        return jsonify({"status_code": 500, "status_msg": str(e)}), 500
+
+@subject_bp.route('/importTimetable', methods=['POST'])
+@basic_auth
+@teacher_auth
+def import_timetable_route():
+    """Add the theory and practical allocations of a whole timetable at once"""
+    if not request.is_json:
+        return jsonify({"status_code": 400, "status_msg": "Missing JSON in request"}), 400
+    
+    data = request.json
+    allocations = data.get('allocations')
+    instance_id = data.get('instance_id')
+    
+    if not isinstance(allocations, list):
+        return jsonify({"status_code": 400, "status_msg": "Missing allocations"}), 400
+    
+    try:
+        # Check if instance exists if provided
+        if instance_id and not FeedbackInstance.query.get(instance_id):
+            return jsonify({"status_code": 404, "status_msg": "Instance not found"}), 404
+        
+        rows = [row if isinstance(row, dict) else {} for row in allocations]
+        created_subjects, theory_count, practical_count, errors = import_timetable(rows, instance_id or None)
+        db.session.commit()
+        bump_data_version(instance_id)
+        
+        return jsonify({
+            "status_code": 200,
+            "status_msg": "Timetable imported",
+            "total": len(rows),
+            "created_subjects": created_subjects,
+            "theory_created": theory_count,
+            "practical_created": practical_count,
+            "errors": errors
+        }), 200
+    
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"status_code": 500, "status_msg": str(e)}), 500
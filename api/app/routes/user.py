@@ -1,16 +1,23 @@
+import csv
 from flask import Blueprint, request, jsonify
 from app import db
 from app.models.user import User, MyUser
 from app.utils.auth import basic_auth, teacher_auth, superuser_auth
+from app.utils.provisioning import parse_roster, queue_provisioning
+from app.utils.directory import get_user_directory, encode_cursor, decode_cursor
 
 user_bp = Blueprint('user', __name__)
 
+# Page size bounds for userDirectory
+USER_DIRECTORY_PAGE_SIZE = 20
+USER_DIRECTORY_MAX_PAGE_SIZE = 200
+
 @user_bp.route('/getProfile', methods=['GET'])
 @basic_auth
 def get_profile():
     """Get the current user's profile"""
     try:
-        my_user = MyUser.query.filter_by(user=request.current_user).first()
+        my_user = MyUser.query.filter_by(user_id=request.identity.user_id).first()
         
         if not my_user:
             return jsonify({"status_code": 404, "status_msg": "User profile not found"}), 404
@@ -23,8 +30,8 @@ def get_profile():
             "sapId": my_user.sapId,
             "mobile": my_user.mobile,
             "year": my_user.year,
-            "is_staff": request.current_user.is_staff,
-            "is_superuser": request.current_user.is_superuser,
+            "is_staff": request.identity.is_staff,
+            "is_superuser": request.identity.is_superuser,
             "canCreateBatch": my_user.canCreateBatch,
             "canCreateSubject": my_user.canCreateSubject,
             "canCreateFeedbackForm": my_user.canCreateFeedbackForm
@@ -48,7 +55,7 @@ def save_profile():
     data = request.json
     
     try:
-        my_user = MyUser.query.filter_by(user=request.current_user).first()
+        my_user = MyUser.query.filter_by(user_id=request.identity.user_id).first()
         
         if not my_user:
             return jsonify({"status_code": 404, "status_msg": "User profile not found"}), 404
@@ -124,20 +131,17 @@ def get_t_users_bac(username):
 def get_users_list():
     """Get a list of all users"""
     try:
-        users = User.query.all()
+        rows = db.session.query(User, MyUser).join(MyUser, MyUser.user_id == User.id).all()
         
         result = []
-        for user in users:
-            my_user = MyUser.query.filter_by(user=user).first()
-            
-            if my_user:
-                user_data = {
-                    "email": my_user.email,
-                    "id": user.id,
-                    "is_staff": user.is_staff,
-                    "name": my_user.name
-                }
-                result.append(user_data)
+        for user, my_user in rows:
+            user_data = {
+                "email": my_user.email,
+                "id": user.id,
+                "is_staff": user.is_staff,
+                "name": my_user.name
+            }
+            result.append(user_data)
         
         return jsonify({
             "status_code": 200,
@@ -147,6 +151,39 @@ def get_users_list():
     except Exception as e:
         return jsonify({"status_code": 500, "status_msg": str(e)}), 500
 
+@user_bp.route('/userDirectory', methods=['GET'])
+@basic_auth
+def user_directory():
+    """Search users by name, email or SAP ID prefix, one page at a time"""
+    query = request.args.get('q', '').strip()
+    is_staff = request.args.get('is_staff')
+    cursor = request.args.get('cursor')
+    limit = request.args.get('limit', USER_DIRECTORY_PAGE_SIZE, type=int)
+    
+    if limit is None or limit < 1 or limit > USER_DIRECTORY_MAX_PAGE_SIZE:
+        return jsonify({"status_code": 400, "status_msg": f"limit must be between 1 and {USER_DIRECTORY_MAX_PAGE_SIZE}"}), 400
+    
+    after = None
+    if cursor:
+        after = decode_cursor(cursor)
+        if after is None:
+            return jsonify({"status_code": 400, "status_msg": "Invalid cursor"}), 400
+    
+    if is_staff is not None:
+        is_staff = is_staff.lower() in ('true', '1', 't')
+    
+    try:
+        users, next_key = get_user_directory().search(query or None, is_staff, after, limit)
+        
+        return jsonify({
+            "status_code": 200,
+            "data": users,
+            "next_cursor": encode_cursor(next_key)
+        }), 200
+    
+    except Exception as e:
+        return jsonify({"status_code": 500, "status_msg": str(e)}), 500
+
 @user_bp.route('/tSettings', methods=['POST'])
 @basic_auth
 @superuser_auth
@@ -191,4 +228,45 @@ def t_settings():
     
     except Exception as e:
         db.session.rollback()
-        return jsonify({"status_code": 500, "status_msg": str(e)}), 500 
\ No newline at end of file
+        return jsonify({"status_code": 500, "status_msg": str(e)}), 500
+
+@user_bp.route('/provisionStudents', methods=['POST'])
+@basic_auth
+@superuser_auth
+def provision_students_route():
+    """Queue the creation of student accounts in bulk from a CSV or JSON roster"""
+    # The roster is a CSV upload, a CSV body or JSON with a "students" list
+    try:
+        if 'file' in request.files:
+            rows = parse_roster(request.files['file'].read().decode('utf-8'))
+            options = request.form
+        elif request.mimetype == 'text/csv':
+            rows = parse_roster(request.get_data(as_text=True))
+            options = request.args
+        elif request.is_json and isinstance(request.json.get('students'), list):
+            rows = [row for row in request.json['students'] if isinstance(row, dict)]
+            options = request.json
+        else:
+            return jsonify({"status_code": 400, "status_msg": "Missing roster"}), 400
+    except (UnicodeDecodeError, csv.Error):
+        return jsonify({"status_code": 400, "status_msg": "Roster must be a UTF-8 encoded CSV file"}), 400
+    
+    try:
+        # Hashing and inserting run in the background worker
+        job = queue_provisioning(
+            rows,
+            instance_id=options.get('instance_id'),
+            default_password=options.get('default_password')
+        )
+        db.session.commit()
+        
+        return jsonify({
+            "status_code": 202,
+            "status_msg": "Student provisioning queued",
+            "job_id": job.id,
+            "total": len(rows)
+        }), 202
+    
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"status_code": 500, "status_msg": str(e)}), 500
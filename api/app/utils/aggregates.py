@@ -0,0 +1,177 @@
+import json
+from collections import defaultdict
+from sqlalchemy import select, update, insert, delete
+from sqlalchemy.dialects import postgresql, sqlite
+from app import db
+from app.models.feedback import FeedbackUserConnector, FeedbackOptionCount, FeedbackQuestionStat
+
+# Longest question key / option value stored in the aggregate tables
+MAX_KEY_LENGTH = 255
+
+def _option_values(answer):
+    """Split an answer into the option values it counts towards"""
+    if answer is None or answer == '':
+        return []
+    if isinstance(answer, list):
+        return [value for item in answer for value in _option_values(item)]
+    if isinstance(answer, dict):
+        answer = json.dumps(answer, sort_keys=True)
+    return [str(answer)[:MAX_KEY_LENGTH]]
+
+def _numeric_value(answer):
+    """Return the answer as a number when it is a numeric rating"""
+    if isinstance(answer, bool):
+        return None
+    if isinstance(answer, (int, float)):
+        return float(answer)
+    if isinstance(answer, str):
+        try:
+            return float(answer)
+        except ValueError:
+            return None
+    return None
+
+def _collect(feedback, sign, option_deltas, stat_deltas):
+    """Add the contribution of one submission, times sign, to the delta maps"""
+    for question, answer in (feedback or {}).items():
+        question = str(question)[:MAX_KEY_LENGTH]
+        values = _option_values(answer)
+        if not values:
+            continue
+
+        for value in values:
+            option_deltas[(question, value)] += sign
+
+        stat = stat_deltas[question]
+        stat["responses"] += sign
+        number = _numeric_value(answer)
+        if number is not None:
+            stat["numeric_count"] += sign
+            stat["numeric_sum"] += sign * number
+
+def _upsert(model, key_columns, rows):
+    """Add the counter columns of each row to the stored totals, creating rows as needed"""
+    if not rows:
+        return
+
+    table = model.__table__
+    counter_columns = [column for column in rows[0] if column not in key_columns]
+    dialect = db.session.get_bind().dialect.name
+
+    if dialect in ('postgresql', 'sqlite'):
+        dialect_insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+        stmt = dialect_insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=key_columns,
+            set_={column: table.c[column] + stmt.excluded[column] for column in counter_columns}
+        )
+        db.session.execute(stmt, rows)
+        return
+
+    # Portable fallback: increment in place, insert the rows that did not exist yet
+    for row in rows:
+        result = db.session.execute(
+            update(table).where(
+                *[table.c[column] == row[column] for column in key_columns]
+            ).values({column: table.c[column] + row[column] for column in counter_columns})
+        )
+        if result.rowcount == 0:
+            db.session.execute(insert(table), [row])
+
+def apply_feedback_change(form_id, old_feedback=None, new_feedback=None):
+    """Update a form's aggregates when a submission is added, replaced or removed"""
+    option_deltas = defaultdict(int)
+    stat_deltas = defaultdict(lambda: {"responses": 0, "numeric_count": 0, "numeric_sum": 0.0})
+
+    _collect(old_feedback, -1, option_deltas, stat_deltas)
+    _collect(new_feedback, 1, option_deltas, stat_deltas)
+
+    _upsert(FeedbackOptionCount, ["form_id", "question", "option"], [
+        {"form_id": form_id, "question": question, "option": option, "count": delta}
+        for (question, option), delta in option_deltas.items() if delta
+    ])
+    _upsert(FeedbackQuestionStat, ["form_id", "question"], [
+        dict(form_id=form_id, question=question, **stat)
+        for question, stat in stat_deltas.items()
+        if stat["responses"] or stat["numeric_count"] or stat["numeric_sum"]
+    ])
+
+    # Drop the rows a replaced or removed submission emptied
+    if any(delta < 0 for delta in option_deltas.values()):
+        db.session.execute(delete(FeedbackOptionCount.__table__).where(
+            FeedbackOptionCount.form_id == form_id, FeedbackOptionCount.count == 0
+        ))
+    if any(stat["responses"] < 0 for stat in stat_deltas.values()):
+        db.session.execute(delete(FeedbackQuestionStat.__table__).where(
+            FeedbackQuestionStat.form_id == form_id, FeedbackQuestionStat.responses == 0
+        ))
+
+def clear_form_aggregates(form_id):
+    """Delete every aggregate row of a form"""
+    db.session.execute(delete(FeedbackOptionCount.__table__).where(FeedbackOptionCount.form_id == form_id))
+    db.session.execute(delete(FeedbackQuestionStat.__table__).where(FeedbackQuestionStat.form_id == form_id))
+
+def rebuild_form_aggregates(form_id):
+    """Recompute a form's aggregates from the stored submissions"""
+    clear_form_aggregates(form_id)
+    db.session.execute(
+        update(FeedbackUserConnector.__table__).where(
+            FeedbackUserConnector.form_id == form_id
+        ).values(is_counted=FeedbackUserConnector.is_filled)
+    )
+
+    option_deltas = defaultdict(int)
+    stat_deltas = defaultdict(lambda: {"responses": 0, "numeric_count": 0, "numeric_sum": 0.0})
+
+    submissions = db.session.execute(
+        select(FeedbackUserConnector.user_feedback).where(
+            FeedbackUserConnector.form_id == form_id,
+            FeedbackUserConnector.is_filled == True
+        ).execution_options(yield_per=500)
+    ).scalars()
+    for feedback in submissions:
+        _collect(feedback, 1, option_deltas, stat_deltas)
+
+    if option_deltas:
+        db.session.execute(insert(FeedbackOptionCount.__table__), [
+            {"form_id": form_id, "question": question, "option": option, "count": count}
+            for (question, option), count in option_deltas.items()
+        ])
+    if stat_deltas:
+        db.session.execute(insert(FeedbackQuestionStat.__table__), [
+            dict(form_id=form_id, question=question, **stat)
+            for question, stat in stat_deltas.items()
+        ])
+
+def backfill_form_aggregates():
+    """Rebuild the aggregates of forms with submissions they do not count yet; safe to run on every start"""
+    form_ids = db.session.execute(
+        select(FeedbackUserConnector.form_id).where(
+            FeedbackUserConnector.is_filled == True,
+            FeedbackUserConnector.is_counted == False
+        ).distinct()
+    ).scalars().all()
+    for form_id in form_ids:
+        rebuild_form_aggregates(form_id)
+    db.session.commit()
+
+def form_summary(form_id):
+    """Read a form's per-question summary from the aggregate tables"""
+    stats = FeedbackQuestionStat.query.filter(
+        FeedbackQuestionStat.form_id == form_id
+    ).order_by(FeedbackQuestionStat.question).all()
+
+    options = defaultdict(dict)
+    for row in FeedbackOptionCount.query.filter(FeedbackOptionCount.form_id == form_id):
+        options[row.question][row.option] = row.count
+
+    result = []
+    for stat in stats:
+        result.append({
+            "question": stat.question,
+            "responses": stat.responses,
+            "option_counts": options.get(stat.question, {}),
+            "numeric_count": stat.numeric_count,
+            "mean": stat.numeric_sum / stat.numeric_count if stat.numeric_count else None
+        })
+    return result
@@ -1,28 +1,168 @@
 from functools import wraps
-from flask import request, jsonify
-from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
+from collections import namedtuple
+import threading
+import time
+from flask import Request, current_app, request, jsonify, g
+from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity, get_jwt
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from app import db
 from app.models.user import User
+from app.utils.coherence import register_cache, publish_change
 import os
 
+# Identity of the authenticated user, taken from the access token claims
+AuthIdentity = namedtuple('AuthIdentity', ['user_id', 'is_staff', 'is_superuser'])
+
+# Role versions read from the user table, per user, as (version, time read)
+_role_versions = {}
+_role_versions_lock = threading.Lock()
+
+def _expire_role_version(user_id):
+    with _role_versions_lock:
+        if user_id is None:
+            _role_versions.clear()
+        else:
+            _role_versions.pop(user_id, None)
+
+register_cache('role_version', lambda key, generation: _expire_role_version(None if key is None else int(key)))
+
+def get_role_version(user_id):
+    """Current role version of a user, cached for ROLE_VERSION_CACHE_SECONDS"""
+    now = time.monotonic()
+    with _role_versions_lock:
+        cached = _role_versions.get(user_id)
+    if cached is not None and now - cached[1] < current_app.config['ROLE_VERSION_CACHE_SECONDS']:
+        return cached[0]
+
+    # Load the whole row, so a handler needing the user does not query it again
+    user = g.get('current_user') or _load_user(user_id)
+    if user is None:
+        return None
+    g.current_user = user
+    with _role_versions_lock:
+        _role_versions[user_id] = (user.role_version, now)
+    return user.role_version
+
+# Access tokens carry is_staff and is_superuser; changing either rejects the tokens already issued
+@event.listens_for(User, 'before_update')
+def _bump_role_version(mapper, connection, target):
+    attrs = inspect(target).attrs
+    if attrs.is_staff.history.has_changes() or attrs.is_superuser.history.has_changes():
+        target.role_version = User.role_version + 1
+        inspect(target).session.info.setdefault('changed_role_versions', set()).add(target.id)
+
+@event.listens_for(Session, 'after_commit')
+def _publish_role_versions(session):
+    for user_id in session.info.pop('changed_role_versions', ()):
+        _expire_role_version(user_id)
+        # Workers not reached by the publish reread it within ROLE_VERSION_CACHE_SECONDS
+        publish_change('role_version', user_id)
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_role_versions(session):
+    session.info.pop('changed_role_versions', None)
+
+def get_access_claims(user):
+    """Role claims embedded in the access tokens of a user"""
+    return {
+        "is_staff": bool(user.is_staff),
+        "is_superuser": bool(user.is_superuser),
+        "rv": user.role_version or 0
+    }
+
+def _auth_counters():
+    """Per-request counters of JWT decodes and identity queries"""
+    if 'auth_counters' not in g:
+        g.auth_counters = {"jwt_decodes": 0, "identity_queries": 0}
+    return g.auth_counters
+
+def get_auth_counters():
+    """JWT decodes and identity queries made so far by the current request"""
+    return dict(_auth_counters())
+
+def _load_user(user_id):
+    """Load the User row of the authenticated user, counting the query"""
+    _auth_counters()["identity_queries"] += 1
+    return db.session.get(User, user_id)
+
+class AuthRequest(Request):
+    """Request that loads the authenticated User row only when a handler needs it"""
+
+    @property
+    def identity(self):
+        return g.get('auth_identity')
+
+    @property
+    def current_user(self):
+        if g.get('current_user') is None and self.identity is not None:
+            g.current_user = _load_user(self.identity.user_id)
+        return g.get('current_user')
+
+    @current_user.setter
+    def current_user(self, user):
+        g.current_user = user
+
+    @property
+    def current_teacher(self):
+        return self.current_user if self.identity is not None and self.identity.is_staff else None
+
+    @property
+    def current_admin(self):
+        return self.current_user if self.identity is not None and self.identity.is_superuser else None
+
 def check_authorization():
-    """Check if the request has a valid JWT token"""
+    """Check if the request has a valid JWT token and return the identity it carries"""
     try:
+        _auth_counters()["jwt_decodes"] += 1
         verify_jwt_in_request()
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
-        if user:
-            return user
-        return None
+        claims = get_jwt()
+
+        # Tokens issued before role claims existed fall back to the database
+        if 'is_staff' not in claims:
+            user = _load_user(user_id)
+            if not user:
+                return None
+            g.current_user = user
+            return AuthIdentity(user.id, bool(user.is_staff), bool(user.is_superuser))
+
+        role_version = get_role_version(user_id)
+        if role_version is None or claims.get('rv', 0) < role_version:
+            return None
+        return AuthIdentity(user_id, claims['is_staff'], claims['is_superuser'])
     except Exception:
         return None
 
+def resolve_identity():
+    """Authenticate the request once and reuse the result for every decorator"""
+    if 'auth_resolved' not in g:
+        g.auth_identity = check_authorization()
+        g.auth_resolved = True
+    return g.auth_identity
+
+def init_auth(app):
+    """Install the auth request class and the optional per-request counter headers"""
+    app.request_class = AuthRequest
+
+    @app.before_request
+    def reset_auth_context():
+        # g outlives the request when an app context was already pushed, e.g. in tests
+        for key in ('auth_resolved', 'auth_identity', 'auth_counters', 'current_user'):
+            g.pop(key, None)
+
+    @app.after_request
+    def add_auth_counters(response):
+        if app.config.get('AUTH_DEBUG_COUNTERS') and 'auth_counters' in g:
+            response.headers['X-Auth-JWT-Decodes'] = str(g.auth_counters["jwt_decodes"])
+            response.headers['X-Auth-Identity-Queries'] = str(g.auth_counters["identity_queries"])
+        return response
+
 def basic_auth(f):
     """Decorator to check for basic authentication"""
     @wraps(f)
     def decorated(*args, **kwargs):
-        user = check_authorization()
-        if user:
-            request.current_user = user
+        if resolve_identity():
             return f(*args, **kwargs)
         return jsonify({"status_code": 403, "status_msg": "Access denied, Authentication header not found or invalid token"}), 403
     return decorated
@@ -32,8 +172,7 @@ def superuser_auth(f):
     @wraps(f)
     @basic_auth
     def decorated(*args, **kwargs):
-        if request.current_user.is_superuser:
-            request.current_admin = request.current_user
+        if request.identity.is_superuser:
             return f(*args, **kwargs)
         return jsonify({"status_code": 400, "status_msg": "User is not authorized to perform this action"}), 400
     return decorated
@@ -43,8 +182,7 @@ def teacher_auth(f):
     @wraps(f)
     @basic_auth
     def decorated(*args, **kwargs):
-        if request.current_user.is_staff:
-            request.current_teacher = request.current_user
+        if request.identity.is_staff:
             return f(*args, **kwargs)
         return jsonify({"status_code": 400, "status_msg": "User is not authorized to perform this action"}), 400
-    return decorated 
\ No newline at end of file
+    return decorated
@@ -0,0 +1,193 @@
+import threading
+from collections import OrderedDict
+from functools import wraps
+from flask import Response, current_app, request, make_response
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+from app import db
+from app.models.user import User, MyUser
+from app.utils.coherence import register_cache, publish_change
+
+# Teacher display names kept across requests
+TEACHER_NAME_CACHE_SIZE = 2048
+
+class LRUCache:
+    """Thread-safe mapping that keeps the most recently used entries up to maxsize"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        """Return the cached entries among keys, counting hits and misses"""
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    found[key] = self._entries[key]
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def get(self, key, default=None):
+        return self.get_many([key]).get(key, default)
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._entries), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+teacher_name_cache = LRUCache(TEACHER_NAME_CACHE_SIZE)
+
+# Version of the catalog data (batches, subjects, forms, teachers) per instance. Writes to
+# one instance bump its version and the version of unfiltered requests; writes that may
+# touch any instance bump the epoch, which is part of every version.
+_data_epoch = 0
+_unfiltered_version = 0
+_instance_versions = {}
+_data_version_lock = threading.Lock()
+
+def data_version(instance_id=None):
+    """Version of the catalog data seen by a request filtered on the instance, or unfiltered"""
+    with _data_version_lock:
+        if instance_id is None:
+            return (_data_epoch, _unfiltered_version)
+        return (_data_epoch, _instance_versions.get(instance_id, 0))
+
+def _expire_data_versions(instance_ids):
+    global _data_epoch, _unfiltered_version
+    with _data_version_lock:
+        if not instance_ids:
+            _data_epoch += 1
+            return
+        for instance_id in instance_ids:
+            _instance_versions[instance_id] = _instance_versions.get(instance_id, 0) + 1
+        _unfiltered_version += 1
+
+def bump_data_version(*instance_ids):
+    """Invalidate cached responses after a write to the given instances, or to all when none are known"""
+    known = sorted({int(instance_id) for instance_id in instance_ids if instance_id})
+    _expire_data_versions(known)
+    for instance_id in known or [None]:
+        publish_change('catalog', instance_id)
+
+register_cache('catalog', lambda key, generation: _expire_data_versions([int(key)] if key else []))
+
+def get_response_cache():
+    """Return the response cache of the current application"""
+    cache = current_app.extensions.get('response_cache')
+    if cache is None:
+        cache = current_app.extensions['response_cache'] = LRUCache(current_app.config['RESPONSE_CACHE_SIZE'])
+    return cache
+
+def cached_response(f):
+    """Decorator caching successful JSON responses by endpoint, query args and data version"""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        cache = get_response_cache()
+        # The version is read first, so a response built during a write is never served after it
+        key = (
+            request.endpoint,
+            tuple(sorted(request.args.items(multi=True))),
+            tuple(sorted(kwargs.items())),
+            data_version(request.args.get('instance_id', type=int))
+        )
+        body = cache.get(key)
+        if body is not None:
+            response = Response(body, status=200, mimetype='application/json')
+            response.headers['X-Cache'] = 'HIT'
+            return response
+
+        response = make_response(f(*args, **kwargs))
+        if response.status_code == 200:
+            cache.set(key, response.get_data())
+        response.headers['X-Cache'] = 'MISS'
+        return response
+    return decorated
+
+def teacher_names(user_ids):
+    """Display names of the given users, loading the uncached ones with one IN query
+
+    Users without a profile are left out of the result.
+    """
+    user_ids = {int(user_id) for user_id in user_ids}
+    names = teacher_name_cache.get_many(list(user_ids))
+    missing = user_ids - names.keys()
+    if missing:
+        for user_id, name in db.session.execute(
+            select(MyUser.user_id, MyUser.name).where(MyUser.user_id.in_(missing))
+        ):
+            teacher_name_cache.set(user_id, name)
+            names[user_id] = name
+    return names
+
+def _forget_teacher_name(target):
+    # Evict now, and again after commit in case another request cached the old name meanwhile
+    teacher_name_cache.pop(target.user_id)
+    inspect(target).session.info.setdefault('changed_teacher_names', set()).add(target.user_id)
+
+@event.listens_for(MyUser, 'after_update')
+def _on_profile_update(mapper, connection, target):
+    if inspect(target).attrs.name.history.has_changes():
+        _forget_teacher_name(target)
+
+@event.listens_for(MyUser, 'after_delete')
+def _on_profile_delete(mapper, connection, target):
+    _forget_teacher_name(target)
+
+@event.listens_for(Session, 'after_commit')
+def _evict_changed_teacher_names(session):
+    changed = session.info.pop('changed_teacher_names', ())
+    for user_id in changed:
+        teacher_name_cache.pop(user_id)
+        publish_change('teacher_name', user_id)
+    # Teacher names appear in cached subject lists of any instance
+    if changed:
+        bump_data_version()
+
+register_cache('teacher_name', lambda key, generation: teacher_name_cache.pop(int(key)))
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_changed_teacher_names(session):
+    session.info.pop('changed_teacher_names', None)
+
+# The cached teacher email list changes with staff accounts
+def _note_staff_change(mapper, connection, target):
+    if target.is_staff:
+        inspect(target).session.info['staff_changed'] = True
+
+@event.listens_for(User, 'after_update')
+def _on_user_update(mapper, connection, target):
+    attrs = inspect(target).attrs
+    if attrs.is_staff.history.has_changes() or (target.is_staff and attrs.email.history.has_changes()):
+        inspect(target).session.info['staff_changed'] = True
+
+event.listen(User, 'after_insert', _note_staff_change)
+event.listen(User, 'after_delete', _note_staff_change)
+
+@event.listens_for(Session, 'after_commit')
+def _expire_staff_responses(session):
+    if session.info.pop('staff_changed', False):
+        bump_data_version()
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_staff_change(session):
+    session.info.pop('staff_changed', None)
@@ -0,0 +1,183 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from flask import current_app, has_app_context
+
+logger = logging.getLogger(__name__)
+
+# Worker-local caches by name, with the function expiring one of their keys
+_expire_handlers = {}
+
+def register_cache(name, expire):
+    """Expire a worker-local cache when another process publishes a change to it
+
+    expire is called with the changed key (None for the whole cache) and the
+    change's generation, which counts the changes published for that key.
+    """
+    _expire_handlers[name] = expire
+
+class SqliteCoherenceStore:
+    """Generation counters in a local SQLite file, shared by every gunicorn worker on the host
+
+    Every publish bumps the generation of one cache key and stamps it with a global
+    sequence number, so a worker finds all changes since its last check with one
+    indexed range query.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # Start from zero so a new worker also applies changes made before it started
+        self._seen = 0
+        self.started_at = time.time()
+        self.checks = 0
+        self.check_seconds = 0.0
+        self.published = 0
+        self.publish_failures = 0
+        self.applied = 0
+        self.latency_seconds = 0.0
+        self.latency_count = 0
+        self.max_latency_seconds = 0.0
+        self.last_latency_seconds = None
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS cache_generation (name TEXT PRIMARY KEY, generation INTEGER NOT NULL, seq INTEGER NOT NULL, bumped_at REAL NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_cache_generation_seq ON cache_generation (seq)")
+
+    def _connect(self):
+        """One connection per thread; sqlite3 connections cannot be shared across threads"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def publish(self, name):
+        """Bump the generation of a cache key; return the new generation"""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            seq = conn.execute("SELECT coalesce(max(seq), 0) + 1 FROM cache_generation").fetchone()[0]
+            generation = conn.execute(
+                "INSERT INTO cache_generation (name, generation, seq, bumped_at) VALUES (?, 1, ?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET generation = generation + 1, seq = excluded.seq, bumped_at = excluded.bumped_at "
+                "RETURNING generation",
+                (name, seq, time.time())
+            ).fetchone()[0]
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        with self._lock:
+            self.published += 1
+            # The publisher already expired its own cache; skip the change unless another was published first
+            if self._seen == seq - 1:
+                self._seen = seq
+        return generation
+
+    def changes(self):
+        """Changes published since the last call, as (name, generation, bumped_at) in order"""
+        started = time.perf_counter()
+        with self._lock:
+            seen = self._seen
+        rows = self._connect().execute(
+            "SELECT name, generation, seq, bumped_at FROM cache_generation WHERE seq > ? ORDER BY seq", (seen,)
+        ).fetchall()
+        with self._lock:
+            if rows:
+                self._seen = max(self._seen, rows[-1][2])
+            self.checks += 1
+            self.check_seconds += time.perf_counter() - started
+        return [(name, generation, bumped_at) for name, generation, _, bumped_at in rows]
+
+    def record_publish_failure(self):
+        with self._lock:
+            self.publish_failures += 1
+
+    def record_applied(self, bumped_at, now):
+        """Count an applied change and the time it took to reach this worker"""
+        with self._lock:
+            self.applied += 1
+            # Changes published before this worker started say nothing about latency
+            if bumped_at < self.started_at:
+                return
+            latency = max(0.0, now - bumped_at)
+            self.latency_seconds += latency
+            self.latency_count += 1
+            self.max_latency_seconds = max(self.max_latency_seconds, latency)
+            self.last_latency_seconds = latency
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": "sqlite",
+                "seen_seq": self._seen,
+                "checks": self.checks,
+                "avg_check_seconds": self.check_seconds / self.checks if self.checks else None,
+                "published": self.published,
+                "publish_failures": self.publish_failures,
+                "applied": self.applied,
+                "avg_latency_seconds": self.latency_seconds / self.latency_count if self.latency_count else None,
+                "max_latency_seconds": self.max_latency_seconds if self.latency_count else None,
+                "last_latency_seconds": self.last_latency_seconds
+            }
+
+def get_coherence_store():
+    """Return the coherence store of the current application, or None when it is disabled"""
+    if 'coherence_store' not in current_app.extensions:
+        store = None
+        if current_app.config['CACHE_COHERENCE_BACKEND'] == 'sqlite':
+            path = current_app.config['CACHE_COHERENCE_PATH']
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            store = SqliteCoherenceStore(path)
+        current_app.extensions['coherence_store'] = store
+    return current_app.extensions['coherence_store']
+
+def publish_change(name, key=None):
+    """Tell the other processes that a cache key changed; return its new generation
+
+    Returns None when there is no shared store, or when publishing failed; failures
+    are logged and counted in the store's stats.
+    """
+    if not has_app_context():
+        return None
+    store = get_coherence_store()
+    if store is None:
+        return None
+    try:
+        return store.publish(name if key is None else f"{name}:{key}")
+    except sqlite3.Error:
+        # The database write already committed; a failed publish must not fail the request
+        store.record_publish_failure()
+        logger.exception("Could not publish a change to cache %s", name)
+        return None
+
+def sync_caches():
+    """Expire the local caches changed by other processes since the last check"""
+    store = get_coherence_store()
+    if store is None:
+        return
+    try:
+        changes = store.changes()
+    except sqlite3.Error:
+        # Serve from the local caches rather than fail the request
+        logger.exception("Could not check for cache changes")
+        return
+    now = time.time()
+    for name, generation, bumped_at in changes:
+        scope, _, key = name.partition(':')
+        expire = _expire_handlers.get(scope)
+        if expire is not None:
+            expire(key or None, generation)
+        store.record_applied(bumped_at, now)
+
+def init_coherence(app):
+    """Check for changes published by other workers at the start of every request"""
+
+    @app.before_request
+    def check_cache_coherence():
+        sync_caches()
@@ -0,0 +1,176 @@
+from sqlalchemy import insert, select, delete, literal
+from app import db
+from app.models.feedback import FeedbackForm, FeedbackUserConnector, form_batch
+from app.models.user import User, MyUser
+from app.models.batch import Batch, batch_student_association
+
+def normalize_batch_ids(batch_list):
+    """Return the batch ids of a batch_list given either as a list or keyed by id"""
+    if not batch_list:
+        return []
+    return [int(batch_id) for batch_id in batch_list]
+
+def batch_students_query(batch_ids):
+    """Select the distinct user ids of every student in the given batches"""
+    return select(User.id).distinct().select_from(batch_student_association).join(
+        MyUser, MyUser.email == batch_student_association.c.myuser_email
+    ).join(
+        User, User.id == MyUser.user_id
+    ).where(batch_student_association.c.batch_id.in_(batch_ids))
+
+def create_form_connectors(form_id, batch_ids):
+    """Create connectors for all students of the batches with a single INSERT ... SELECT"""
+    batch_ids = normalize_batch_ids(batch_ids)
+    if not batch_ids:
+        return 0
+
+    students = batch_students_query(batch_ids).subquery()
+    stmt = insert(FeedbackUserConnector.__table__).from_select(
+        ['student_id', 'form_id', 'is_filled'],
+        select(students.c.id, literal(form_id), literal(False))
+    )
+
+    result = db.session.execute(stmt)
+    return result.rowcount
+
+def sync_form_connectors(form_id, batch_ids):
+    """Reconcile a form's connectors with the students of its batches
+
+    Returns the number of connectors added and removed. Students that stay
+    targeted keep their connector. Students no longer targeted lose it only
+    if they have not submitted the form yet; submitted feedback is kept, as
+    on_batch_membership_change does.
+    """
+    batch_ids = normalize_batch_ids(batch_ids)
+    target = set()
+    if batch_ids:
+        target = set(db.session.execute(batch_students_query(batch_ids)).scalars())
+
+    current = dict(db.session.execute(
+        select(FeedbackUserConnector.student_id, FeedbackUserConnector.is_filled).where(FeedbackUserConnector.form_id == form_id)
+    ).all())
+
+    to_add = target - current.keys()
+    to_remove = {student_id for student_id, is_filled in current.items() if not is_filled} - target
+
+    if to_add:
+        db.session.execute(
+            insert(FeedbackUserConnector.__table__),
+            [{"student_id": student_id, "form_id": form_id, "is_filled": False} for student_id in to_add]
+        )
+
+    if to_remove:
+        db.session.execute(
+            delete(FeedbackUserConnector.__table__).where(
+                FeedbackUserConnector.form_id == form_id,
+                FeedbackUserConnector.student_id.in_(to_remove),
+                FeedbackUserConnector.is_filled == False
+            )
+        )
+
+    return len(to_add), len(to_remove)
+
+def set_form_batches(form_id, batch_ids):
+    """Write the form_batch rows of a form to match its batch_list, changing only the difference"""
+    batch_ids = set(normalize_batch_ids(batch_ids))
+    if batch_ids:
+        # Ids of batches that no longer exist stay in batch_list but get no row
+        batch_ids = set(db.session.execute(select(Batch.id).where(Batch.id.in_(batch_ids))).scalars())
+
+    current = set(db.session.execute(
+        select(form_batch.c.batch_id).where(form_batch.c.form_id == form_id)
+    ).scalars())
+
+    if batch_ids - current:
+        db.session.execute(
+            insert(form_batch),
+            [{"form_id": form_id, "batch_id": batch_id} for batch_id in batch_ids - current]
+        )
+    if current - batch_ids:
+        db.session.execute(
+            delete(form_batch).where(form_batch.c.form_id == form_id, form_batch.c.batch_id.in_(current - batch_ids))
+        )
+
+def backfill_form_batches():
+    """Fill form_batch from the batch_list of forms that have no rows yet; safe to run on every start"""
+    forms = db.session.execute(
+        select(FeedbackForm.id, FeedbackForm.batch_list).where(
+            ~select(form_batch.c.form_id).where(form_batch.c.form_id == FeedbackForm.id).exists()
+        )
+    ).all()
+    for form_id, batch_list in forms:
+        if batch_list:
+            set_form_batches(form_id, batch_list)
+    db.session.commit()
+
+def live_forms_for_batch(batch_id):
+    """Live forms targeting the batch, each with the ids of all its batches, from form_batch"""
+    live_forms = select(form_batch.c.form_id).join(
+        FeedbackForm, FeedbackForm.id == form_batch.c.form_id
+    ).where(form_batch.c.batch_id == batch_id, FeedbackForm.is_alive == True)
+
+    forms = {}
+    for form_id, form_batch_id in db.session.execute(
+        select(form_batch.c.form_id, form_batch.c.batch_id).where(form_batch.c.form_id.in_(live_forms))
+    ):
+        forms.setdefault(form_id, set()).add(form_batch_id)
+    return forms
+
+def on_batch_membership_change(batch_id, added_emails, removed_emails):
+    """Update the connectors of the batch's live forms after students joined or left it
+
+    Added students get a connector on each form they are not already on. Removed
+    students lose their connector only when no other batch of the form still holds
+    them and they have not submitted the form yet; submitted feedback is kept.
+    Returns the number of connectors added and removed.
+    """
+    forms = live_forms_for_batch(batch_id)
+    if not forms or not (added_emails or removed_emails):
+        return 0, 0
+
+    emails = set(added_emails) | set(removed_emails)
+    user_ids = dict(db.session.execute(
+        select(MyUser.email, MyUser.user_id).where(MyUser.email.in_(emails))
+    ).all())
+    added_ids = {user_ids[email] for email in added_emails if email in user_ids}
+    removed_ids = {user_ids[email] for email in removed_emails if email in user_ids}
+
+    connected = set()
+    if added_ids:
+        connected = set(db.session.execute(
+            select(FeedbackUserConnector.form_id, FeedbackUserConnector.student_id).where(
+                FeedbackUserConnector.form_id.in_(forms),
+                FeedbackUserConnector.student_id.in_(added_ids)
+            )
+        ).all())
+
+    new_connectors = [
+        {"student_id": student_id, "form_id": form_id, "is_filled": False}
+        for form_id in forms for student_id in added_ids
+        if (form_id, student_id) not in connected
+    ]
+    if new_connectors:
+        db.session.execute(insert(FeedbackUserConnector.__table__), new_connectors)
+
+    removed = 0
+    for form_id, form_batch_ids in forms.items():
+        if not removed_ids:
+            break
+        # Students still in another batch of the form keep their connector
+        other_batches = form_batch_ids - {int(batch_id)}
+        still_targeted = set()
+        if other_batches:
+            still_targeted = set(db.session.execute(
+                batch_students_query(list(other_batches)).where(User.id.in_(removed_ids))
+            ).scalars())
+        dropped = removed_ids - still_targeted
+        if dropped:
+            removed += db.session.execute(
+                delete(FeedbackUserConnector.__table__).where(
+                    FeedbackUserConnector.form_id == form_id,
+                    FeedbackUserConnector.student_id.in_(dropped),
+                    FeedbackUserConnector.is_filled == False
+                )
+            ).rowcount
+
+    return len(new_connectors), removed
@@ -0,0 +1,136 @@
+import base64
+import json
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from flask import current_app
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+from app import db
+from app.models.user import User, MyUser
+from app.utils.coherence import register_cache, publish_change
+
+class UserDirectory:
+    """Users sorted by name, with sorted prefix indexes on name words, email and sapId"""
+
+    FIELDS = ('name', 'email', 'sapId')
+
+    def __init__(self, rows):
+        # Entries are kept in (name, email) order, so an entry's position is its sort rank
+        self.entries = sorted(
+            ({"id": user_id, "email": email, "name": name, "sapId": sap_id, "is_staff": bool(is_staff)}
+             for user_id, email, name, sap_id, is_staff in rows),
+            key=lambda entry: ((entry["name"] or '').lower(), entry["email"])
+        )
+        self.keys = [((entry["name"] or '').lower(), entry["email"]) for entry in self.entries]
+        self.indexes = {}
+        for field in self.FIELDS:
+            pairs = []
+            for rank, entry in enumerate(self.entries):
+                value = (entry[field] or '').lower()
+                if value:
+                    pairs.append((value, rank))
+                # Later words of a name are searchable too, e.g. a surname
+                if field == 'name':
+                    pairs.extend((word, rank) for word in value.split()[1:])
+            pairs.sort()
+            self.indexes[field] = ([value for value, _ in pairs], [rank for _, rank in pairs])
+        self.built_at = time.monotonic()
+
+    def _prefix_ranks(self, prefix):
+        """Ranks of the entries with a field starting with the prefix"""
+        ranks = set()
+        for values, field_ranks in self.indexes.values():
+            start = bisect_left(values, prefix)
+            end = bisect_right(values, prefix + '\uffff', start)
+            ranks.update(field_ranks[start:end])
+        return sorted(ranks)
+
+    def search(self, prefix=None, is_staff=None, after=None, limit=20):
+        """One page of entries matching the prefix, after the (name, email) cursor key"""
+        start = bisect_right(self.keys, after) if after else 0
+        ranks = self._prefix_ranks(prefix.lower()) if prefix else range(len(self.entries))
+
+        page = []
+        for rank in ranks[bisect_left(ranks, start):] if prefix else ranks[start:]:
+            if is_staff is not None and self.entries[rank]["is_staff"] != is_staff:
+                continue
+            page.append(rank)
+            if len(page) > limit:
+                break
+
+        next_key = self.keys[page[limit - 1]] if len(page) > limit else None
+        return [self.entries[rank] for rank in page[:limit]], next_key
+
+_directory = None
+_directory_generation = 0
+_directory_lock = threading.Lock()
+
+def _load_directory():
+    rows = db.session.execute(
+        select(User.id, User.email, MyUser.name, MyUser.sapId, User.is_staff).join(MyUser, MyUser.user_id == User.id)
+    ).all()
+    return UserDirectory(rows)
+
+def get_user_directory():
+    """The directory of this process, rebuilt after users change or once it is too old"""
+    global _directory
+    max_age = current_app.config['USER_DIRECTORY_MAX_AGE']
+    with _directory_lock:
+        directory, generation = _directory, _directory_generation
+    if directory is None or time.monotonic() - directory.built_at > max_age:
+        directory = _load_directory()
+        with _directory_lock:
+            # Keep it only if no change was committed while it was loading
+            if _directory_generation == generation:
+                _directory = directory
+    return directory
+
+def _expire_user_directory(key=None, generation=None):
+    global _directory, _directory_generation
+    with _directory_lock:
+        _directory = None
+        _directory_generation += 1
+
+def invalidate_user_directory():
+    """Rebuild the directory on next use; call after users are written with bulk statements"""
+    _expire_user_directory()
+    publish_change('user_directory')
+
+register_cache('user_directory', _expire_user_directory)
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode() if key else None
+
+def decode_cursor(cursor):
+    """Cursor key from a next_cursor value, or None if it is missing or malformed"""
+    try:
+        name, email = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return (name, email)
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+# Columns shown or searched in the directory; other updates leave it as is
+DIRECTORY_COLUMNS = {User: ('email', 'is_staff'), MyUser: ('email', 'name', 'sapId', 'user_id')}
+
+def _note_user_change(mapper, connection, target):
+    inspect(target).session.info['user_directory_changed'] = True
+
+def _note_user_update(mapper, connection, target):
+    attrs = inspect(target).attrs
+    if any(attrs[column].history.has_changes() for column in DIRECTORY_COLUMNS[mapper.class_]):
+        _note_user_change(mapper, connection, target)
+
+for model in DIRECTORY_COLUMNS:
+    event.listen(model, 'after_insert', _note_user_change)
+    event.listen(model, 'after_delete', _note_user_change)
+    event.listen(model, 'after_update', _note_user_update)
+
+@event.listens_for(Session, 'after_commit')
+def _rebuild_after_user_change(session):
+    if session.info.pop('user_directory_changed', False):
+        invalidate_user_directory()
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_user_change(session):
+    session.info.pop('user_directory_changed', None)
@@ -1,52 +1,110 @@
-from flask import render_template
+from flask import current_app
 from flask_mail import Message
-from app import mail
+from markupsafe import escape
+from app.utils.mailer import send_message, send_messages
 import os
 
+OTP_TEMPLATE = "email/otp_email.html"
+RESET_PASSWORD_TEMPLATE = "email/reset_password_email.html"
+REMINDER_TEMPLATE = "email/reminder_email.html"
+
+# Marks the per-recipient slots left in a pre-rendered template
+SLOT_MARKER = "\x00"
+
+class PersonalizedTemplate:
+    """Template rendered once with its shared values, leaving slots for per-recipient values"""
+
+    def __init__(self, template, fields, **shared):
+        markers = {field: f"{SLOT_MARKER}{field}{SLOT_MARKER}" for field in fields}
+        # Even parts are static HTML, odd parts are the names of per-recipient fields
+        self.parts = template.render(**shared, **markers).split(SLOT_MARKER)
+
+    def render(self, **values):
+        """Fill the per-recipient slots, escaping the values as Jinja would"""
+        return "".join(
+            part if index % 2 == 0 else str(escape(values.get(part, "")))
+            for index, part in enumerate(self.parts)
+        )
+
+def _common_values():
+    """Values shared by every email"""
+    return {
+        "dj_logo": os.environ.get("DJ_LOGO"),
+        "mail": os.environ.get("EMAIL_HOST_USER")
+    }
+
+def init_email_templates(app):
+    """Compile the email templates once and pre-render their shared parts"""
+    templates = {
+        name: app.jinja_env.get_template(name)
+        for name in (OTP_TEMPLATE, RESET_PASSWORD_TEMPLATE, REMINDER_TEMPLATE)
+    }
+    app.extensions['email_templates'] = templates
+    app.extensions['personalized_email_templates'] = {
+        OTP_TEMPLATE: PersonalizedTemplate(templates[OTP_TEMPLATE], ["otp"], **_common_values()),
+        RESET_PASSWORD_TEMPLATE: PersonalizedTemplate(templates[RESET_PASSWORD_TEMPLATE], ["url"], **_common_values())
+    }
+
 def send_email(to, subject, template, **kwargs):
     """Send an email to the recipients using the specified template"""
     msg = Message(subject, recipients=[to] if isinstance(to, str) else to)
-    msg.html = render_template(template, **kwargs)
-    mail.send(msg)
+    msg.html = current_app.extensions['email_templates'][template].render(**kwargs)
+    send_message(msg)
+
+def send_personalized_email(to, subject, template, **kwargs):
+    """Send an email built from the pre-rendered shared part of a template"""
+    msg = Message(subject, recipients=[to])
+    msg.html = current_app.extensions['personalized_email_templates'][template].render(**kwargs)
+    send_message(msg)
 
 def send_otp_email(email, otp):
     """Send OTP email to the user"""
-    return send_email(
+    return send_personalized_email(
         email,
         "OTP Verification - Feedback Portal",
-        "email/otp_email.html",
-        otp=otp,
-        dj_logo=os.environ.get("DJ_LOGO"),
-        mail=os.environ.get("EMAIL_HOST_USER")
+        OTP_TEMPLATE,
+        otp=otp
     )
 
 def send_reset_password_email(email, token):
     """Send reset password email to the user"""
-    return send_email(
+    return send_personalized_email(
         email,
         "Reset Password - Feedback Portal",
-        "email/reset_password_email.html",
-        token=token,
-        url=f"{os.environ.get('FRONT_END_LINK')}/resetPassword/{email}/{token}",
-        dj_logo=os.environ.get("DJ_LOGO"),
-        mail=os.environ.get("EMAIL_HOST_USER")
+        RESET_PASSWORD_TEMPLATE,
+        url=f"{os.environ.get('FRONT_END_LINK')}/resetPassword/{email}/{token}"
     )
 
-def send_feedback_reminder(emails, form):
-    """Send reminder email to students who haven't filled the feedback form"""
-    if not emails:
-        return
-    
+def feedback_reminder_template(form):
+    """Pre-render the parts of a form's reminder email shared by all its students"""
     subject_type = "Theory" if form.is_theory else "Practical"
-    
-    return send_email(
-        emails,
-        "REMINDER: Fill the feedback form - Feedback Portal",
-        "email/reminder_email.html",
-        dj_logo=os.environ.get("DJ_LOGO"),
+    teacher_profile = form.teacher.myuser
+
+    return PersonalizedTemplate(
+        current_app.extensions['email_templates'][REMINDER_TEMPLATE],
+        ["student_name", "url"],
         subject_name=form.subject.subject_name,
-        teacher_name=form.teacher.myuser.name,
+        teacher_name=teacher_profile.name if teacher_profile else form.teacher.username,
         subject_type=subject_type,
-        url=f"{os.environ.get('FRONT_END_LINK')}/feedBackForm/{form.id}",
-        mail=os.environ.get("EMAIL_HOST_USER")
-    ) 
\ No newline at end of file
+        **_common_values()
+    )
+
+def send_feedback_reminder(recipients, form, template=None):
+    """Send a personalised reminder to each (email, name) recipient who hasn't filled the form
+
+    Returns the error of each recipient, None for those sent. Raises SendInterrupted
+    when the connection fails part way through.
+    """
+    if not recipients:
+        return []
+
+    template = template or feedback_reminder_template(form)
+    url = f"{os.environ.get('FRONT_END_LINK')}/feedBackForm/{form.id}"
+
+    messages = []
+    for email, name in recipients:
+        msg = Message("REMINDER: Fill the feedback form - Feedback Portal", recipients=[email])
+        msg.html = template.render(student_name=name or "Student", url=url)
+        messages.append(msg)
+
+    return send_messages(messages)
@@ -0,0 +1,96 @@
+import csv
+import io
+import json
+from app import db
+from app.models.feedback import FeedbackForm, FeedbackUserConnector
+from app.models.user import User, MyUser
+
+# Rows fetched from the database cursor at a time while streaming an export
+EXPORT_YIELD_PER = 500
+
+BASE_COLUMNS = ["form_id", "subject", "teacher_email", "is_theory", "student", "student_name", "is_filled"]
+
+def question_columns(forms):
+    """Collect the question keys of the forms, in order of first appearance"""
+    columns = []
+    seen = set()
+    for form in forms:
+        for key in (form.form_field or {}):
+            if key not in seen:
+                seen.add(key)
+                columns.append(key)
+    return columns
+
+def export_rows(forms):
+    """Yield one dict per connector of the forms, streamed from the database cursor"""
+    form_info = {
+        form.id: {
+            "form_id": form.id,
+            "subject": form.subject.subject_name,
+            "teacher_email": form.teacher.username,
+            "is_theory": form.is_theory
+        }
+        for form in forms
+    }
+    if not form_info:
+        return
+
+    query = db.session.query(
+        FeedbackUserConnector.form_id,
+        FeedbackUserConnector.is_filled,
+        FeedbackUserConnector.user_feedback,
+        User.username,
+        MyUser.name
+    ).join(
+        User, User.id == FeedbackUserConnector.student_id
+    ).outerjoin(
+        MyUser, MyUser.user_id == User.id
+    ).filter(
+        FeedbackUserConnector.form_id.in_(form_info.keys())
+    ).order_by(
+        FeedbackUserConnector.form_id, FeedbackUserConnector.id
+    ).yield_per(EXPORT_YIELD_PER)
+
+    for form_id, is_filled, user_feedback, username, name in query:
+        row = dict(form_info[form_id])
+        row.update({
+            "student": username,
+            "student_name": name,
+            "is_filled": is_filled,
+            "user_feedback": user_feedback or {}
+        })
+        yield row
+
+def _csv_cell(value):
+    """Flatten nested answers so they fit in a single CSV cell"""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return value
+
+def generate_csv(forms):
+    """Stream the results of the forms as CSV with one column per question"""
+    questions = question_columns(forms)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        data = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+        return data
+
+    writer.writerow(BASE_COLUMNS + questions)
+    yield flush()
+
+    for row in export_rows(forms):
+        answers = row["user_feedback"]
+        writer.writerow(
+            [row[column] for column in BASE_COLUMNS] +
+            [_csv_cell(answers.get(question)) for question in questions]
+        )
+        yield flush()
+
+def generate_ndjson(forms):
+    """Stream the results of the forms as newline-delimited JSON"""
+    for row in export_rows(forms):
+        yield json.dumps(row) + "\n"
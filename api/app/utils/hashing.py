@@ -0,0 +1,120 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from flask import current_app, has_app_context
+from werkzeug.security import generate_password_hash, check_password_hash
+
+DEFAULT_PASSWORD_HASH_METHOD = 'pbkdf2:sha256:600000'
+
+# Stored for accounts without a password yet; no password ever matches it
+UNUSABLE_PASSWORD = '!'
+
+# Niceness of the bulk hashing processes, so login checks get the CPU first
+BULK_HASH_NICENESS = 10
+
+class HashingOverloaded(Exception):
+    """Raised when the hashing queue is full and the request should be retried later"""
+
+    def __init__(self, retry_after):
+        super().__init__("Password hashing queue is full")
+        self.retry_after = retry_after
+
+_executor = None
+_executor_pid = None
+_slots = None
+_bulk_executor = None
+_bulk_executor_pid = None
+_lock = threading.Lock()
+_method_prefixes = {}
+
+def configured_hash_method():
+    """Password hash method (algorithm and cost) configured for new hashes"""
+    if has_app_context():
+        return current_app.config.get('PASSWORD_HASH_METHOD', DEFAULT_PASSWORD_HASH_METHOD)
+    return DEFAULT_PASSWORD_HASH_METHOD
+
+def _executor_and_slots():
+    """Return the process pool of this process, creating it on first use or after a fork"""
+    global _executor, _executor_pid, _slots
+    with _lock:
+        if _executor is None or _executor_pid != os.getpid():
+            config = current_app.config
+            workers = config['PASSWORD_HASH_WORKERS'] or os.cpu_count() or 1
+            _executor = ProcessPoolExecutor(max_workers=workers)
+            _executor_pid = os.getpid()
+            _slots = threading.BoundedSemaphore(config['PASSWORD_HASH_QUEUE_SIZE'] or workers * 4)
+        return _executor, _slots
+
+def _lower_priority():
+    if hasattr(os, 'nice'):
+        os.nice(BULK_HASH_NICENESS)
+
+def _bulk_hash_executor():
+    """Return the low-priority process pool for bulk hashing of this process
+
+    It is separate from the login pool, so bulk jobs never queue ahead of login checks.
+    """
+    global _bulk_executor, _bulk_executor_pid
+    with _lock:
+        if _bulk_executor is None or _bulk_executor_pid != os.getpid():
+            workers = current_app.config['PASSWORD_HASH_BULK_WORKERS'] or max(1, (os.cpu_count() or 1) // 2)
+            _bulk_executor = ProcessPoolExecutor(max_workers=workers, initializer=_lower_priority)
+            _bulk_executor_pid = os.getpid()
+        return _bulk_executor
+
+def is_usable_password(password_hash):
+    """Whether a stored hash can match a password, unlike UNUSABLE_PASSWORD"""
+    return bool(password_hash) and '$' in password_hash
+
+def _run(fn, *args):
+    """Run a hashing function in the pool, rejecting it at once when the queue is full"""
+    config = current_app.config
+    executor, slots = _executor_and_slots()
+    if not slots.acquire(blocking=False):
+        raise HashingOverloaded(config['PASSWORD_HASH_RETRY_AFTER'])
+
+    try:
+        future = executor.submit(fn, *args)
+    except Exception:
+        slots.release()
+        raise
+    future.add_done_callback(lambda _: slots.release())
+
+    try:
+        return future.result(timeout=config['PASSWORD_HASH_TIMEOUT'])
+    except FutureTimeoutError:
+        raise HashingOverloaded(config['PASSWORD_HASH_RETRY_AFTER'])
+
+def verify_password(password_hash, password):
+    """Check a password against its stored hash in the hashing pool"""
+    if not is_usable_password(password_hash):
+        return False
+    return _run(check_password_hash, password_hash, password)
+
+def hash_password(password):
+    """Hash a password with the configured method in the hashing pool"""
+    return _run(generate_password_hash, password, configured_hash_method())
+
+def hash_passwords(passwords):
+    """Hash many passwords with the configured method in the low-priority bulk pool"""
+    if not passwords:
+        return []
+    method = configured_hash_method()
+    if multiprocessing.current_process().daemon:
+        # Daemonic processes cannot start a pool; hash in this thread instead
+        return [generate_password_hash(password, method) for password in passwords]
+    executor = _bulk_hash_executor()
+    workers = executor._max_workers
+    chunksize = max(1, len(passwords) // (workers * 4))
+    return list(executor.map(generate_password_hash, passwords, [method] * len(passwords), chunksize=chunksize))
+
+def needs_rehash(password_hash):
+    """Whether a stored hash was made with a different method or cost than configured"""
+    method = configured_hash_method()
+    prefix = _method_prefixes.get(method)
+    if prefix is None:
+        # Hash once to learn how werkzeug writes the configured method, defaults included
+        prefix = generate_password_hash('', method=method).split('$', 1)[0]
+        _method_prefixes[method] = prefix
+    return password_hash.split('$', 1)[0] != prefix
@@ -0,0 +1,183 @@
+import logging
+import time
+import traceback
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import update, or_, and_
+from app import db
+from app.models.job import Job
+
+logger = logging.getLogger(__name__)
+
+# Registered job handlers, keyed by job kind
+JOB_HANDLERS = {}
+
+# Payload keys cleared once a job of the kind is done or has failed for good, keyed by job kind
+JOB_SECRETS = {}
+
+class JobLockLost(Exception):
+    """Raised when another worker reclaimed a job this worker was running"""
+
+    def __init__(self, job_id):
+        super().__init__(f"Job {job_id} was reclaimed by another worker")
+        self.job_id = job_id
+
+def job_handler(kind, secrets=()):
+    """Register a function as the handler of a job kind
+
+    secrets names payload keys, such as passwords, that are cleared when the job
+    ends, whether it is done or has failed for good.
+    """
+    def register(f):
+        JOB_HANDLERS[kind] = f
+        JOB_SECRETS[kind] = tuple(secrets)
+        return f
+    return register
+
+def _final_payload(job):
+    """Values clearing the secrets of a job's payload as it ends"""
+    secrets = JOB_SECRETS.get(job.kind)
+    if not secrets:
+        return {}
+    return {"payload": dict(job.payload or {}, **{key: None for key in secrets})}
+
+def enqueue_job(kind, payload=None, max_attempts=None):
+    """Add a job to the queue; the caller commits the session"""
+    job = Job(
+        kind=kind,
+        payload=payload or {},
+        status='queued',
+        max_attempts=max_attempts or current_app.config['JOB_MAX_ATTEMPTS'],
+        run_after=datetime.utcnow()
+    )
+    db.session.add(job)
+    return job
+
+def job_status(job):
+    """Serialize the progress of a job"""
+    return {
+        "job_id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "attempts": job.attempts,
+        "progress": job.progress,
+        "total": job.total,
+        "last_error": job.last_error,
+        "result": (job.payload or {}).get("result"),
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None
+    }
+
+def claim_next_job():
+    """Atomically mark the next runnable job as running and return it"""
+    now = datetime.utcnow()
+    stale_before = now - timedelta(seconds=current_app.config['JOB_LOCK_TIMEOUT'])
+
+    # Queued jobs that are due, and running jobs whose worker died
+    runnable = or_(
+        and_(Job.status == 'queued', Job.run_after <= now),
+        and_(Job.status == 'running', Job.locked_at < stale_before)
+    )
+
+    candidates = db.session.query(Job.id, Job.status, Job.attempts).filter(runnable).order_by(Job.id).limit(10).all()
+    for job_id, status, attempts in candidates:
+        claimed = db.session.execute(
+            update(Job).where(Job.id == job_id, Job.status == status, Job.attempts == attempts, runnable).values(
+                status='running',
+                locked_at=now,
+                attempts=attempts + 1
+            )
+        ).rowcount
+        db.session.commit()
+        if claimed:
+            job = Job.query.get(job_id)
+            # Identifies this claim; a worker reclaiming the job increments attempts again
+            job.claimed_attempts = attempts + 1
+            return job
+    return None
+
+def _held_by_this_worker(job, **values):
+    """Update the job's row only while this worker's claim still holds; return whether it did
+
+    Each claim increments attempts, so a running job with the attempts count of this
+    worker's claim is still held by it. The lock is renewed with every update.
+    """
+    db.session.flush()
+    claimed_attempts = getattr(job, 'claimed_attempts', None) or job.attempts
+    return db.session.execute(
+        update(Job).where(Job.id == job.id, Job.status == 'running', Job.attempts == claimed_attempts).values(
+            locked_at=datetime.utcnow(), **values
+        ).execution_options(synchronize_session=False)
+    ).rowcount == 1
+
+def save_job_progress(job, progress):
+    """Commit a running job's progress and pending changes, renewing its lock
+
+    Raises JobLockLost, discarding the changes, when the job timed out and another
+    worker claimed it; the handler must then stop without doing more work.
+    """
+    if not _held_by_this_worker(job, progress=progress):
+        db.session.rollback()
+        raise JobLockLost(job.id)
+    db.session.commit()
+    db.session.refresh(job)
+
+def run_job(job):
+    """Run a claimed job, scheduling a retry with exponential backoff on failure"""
+    handler = JOB_HANDLERS.get(job.kind)
+    try:
+        if handler is None:
+            raise ValueError(f"No handler registered for job kind '{job.kind}'")
+        handler(job)
+        if not _held_by_this_worker(job, status='done', last_error=None, finished_at=datetime.utcnow(), **_final_payload(job)):
+            raise JobLockLost(job.id)
+        db.session.commit()
+        db.session.refresh(job)
+    except JobLockLost:
+        # The worker that reclaimed the job owns it now; leave its row alone
+        db.session.rollback()
+        logger.warning("Job %s (%s) was reclaimed by another worker; stopping", job.id, job.kind)
+        return Job.query.get(job.id)
+    except Exception:
+        last_error = traceback.format_exc(limit=5)
+        db.session.rollback()
+        attempts = getattr(job, 'claimed_attempts', None) or job.attempts
+        if attempts >= job.max_attempts:
+            values = {"status": 'failed', "finished_at": datetime.utcnow(), **_final_payload(job)}
+        else:
+            delay = min(
+                current_app.config['JOB_BACKOFF_SECONDS'] * 2 ** (attempts - 1),
+                current_app.config['JOB_MAX_BACKOFF_SECONDS']
+            )
+            values = {"status": 'queued', "run_after": datetime.utcnow() + timedelta(seconds=delay)}
+        if _held_by_this_worker(job, last_error=last_error, **values):
+            logger.exception("Job %s (%s) failed on attempt %s", job.id, job.kind, attempts)
+        else:
+            logger.exception("Job %s (%s) failed after another worker reclaimed it", job.id, job.kind)
+        db.session.commit()
+        db.session.refresh(job)
+    return job
+
+def run_pending_jobs():
+    """Run every job that is currently due and return how many were run"""
+    count = 0
+    while True:
+        job = claim_next_job()
+        if job is None:
+            return count
+        run_job(job)
+        db.session.remove()
+        count += 1
+
+def run_worker():
+    """Process jobs forever; must be called inside an application context"""
+    poll_interval = current_app.config['JOB_POLL_INTERVAL']
+    logger.info("Job worker started")
+    while True:
+        try:
+            if not run_pending_jobs():
+                time.sleep(poll_interval)
+        except Exception:
+            db.session.rollback()
+            logger.exception("Job worker loop error")
+            time.sleep(poll_interval)
@@ -0,0 +1,233 @@
+import smtplib
+import threading
+import time
+from flask import current_app
+from flask_mail import BadHeaderError, email_dispatched, sanitize_address, sanitize_addresses
+
+def _is_stale(error):
+    """Whether an error means the connection was dropped rather than the message refused"""
+    if isinstance(error, (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError)):
+        return True
+    # 421: the server is closing the transmission channel
+    return isinstance(error, smtplib.SMTPResponseException) and error.smtp_code == 421
+
+def _is_refused(error):
+    """Whether an error concerns a single message, leaving the connection usable for the next"""
+    if isinstance(error, (smtplib.SMTPRecipientsRefused, BadHeaderError, AssertionError)):
+        return True
+    return isinstance(error, smtplib.SMTPResponseException) and not _is_stale(error)
+
+class SendInterrupted(Exception):
+    """Raised when the SMTP connection fails part way through a batch of messages
+
+    results holds the outcome of the messages handled before the failure, in order;
+    the message that hit the failure and those after it were not sent.
+    """
+
+    def __init__(self, results, error):
+        super().__init__(str(error))
+        self.results = results
+        self.error = error
+
+class SMTPPool:
+    """Small pool of authenticated SMTP connections reused across messages"""
+
+    def __init__(self, state, size=2, idle_timeout=60, max_messages_per_connection=100, timeout=30):
+        self.state = state
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.max_messages_per_connection = max_messages_per_connection
+        self.timeout = timeout
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+        self._stats = {
+            "connections_opened": 0,
+            "reconnects": 0,
+            "messages_sent": 0,
+            "send_failures": 0,
+            "send_seconds": 0.0,
+            "max_send_seconds": 0.0
+        }
+
+    def _open(self):
+        """Open, secure and authenticate a new SMTP connection"""
+        state = self.state
+        if state.use_ssl:
+            host = smtplib.SMTP_SSL(state.server, state.port, timeout=self.timeout)
+        else:
+            host = smtplib.SMTP(state.server, state.port, timeout=self.timeout)
+        host.set_debuglevel(int(state.debug))
+        if state.use_tls:
+            host.starttls()
+        if state.username and state.password:
+            host.login(state.username, state.password)
+
+        with self._lock:
+            self._stats["connections_opened"] += 1
+        return {"host": host, "sent": 0, "last_used": time.monotonic()}
+
+    @staticmethod
+    def _close(connection):
+        """Close a connection, ignoring errors from an already dropped socket"""
+        try:
+            connection["host"].quit()
+        except Exception:
+            try:
+                connection["host"].close()
+            except Exception:
+                pass
+
+    def _acquire(self):
+        """Take an idle connection that is still fresh, or open a new one"""
+        self._slots.acquire()
+        try:
+            while True:
+                with self._lock:
+                    connection = self._idle.pop() if self._idle else None
+                if connection is None:
+                    return self._open()
+                if time.monotonic() - connection["last_used"] < self.idle_timeout:
+                    return connection
+                self._close(connection)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _release(self, connection):
+        """Return a connection to the pool, retiring it after enough messages"""
+        try:
+            if connection is None:
+                return
+            if connection["sent"] >= self.max_messages_per_connection:
+                self._close(connection)
+                return
+            connection["last_used"] = time.monotonic()
+            with self._lock:
+                self._idle.append(connection)
+        finally:
+            self._slots.release()
+
+    def _deliver(self, connection, message):
+        """Send one message on a connection"""
+        connection["host"].sendmail(
+            sanitize_address(message.sender),
+            list(sanitize_addresses(message.send_to)),
+            message.as_bytes(),
+            message.mail_options,
+            message.rcpt_options
+        )
+        connection["sent"] += 1
+
+    def send_messages(self, messages):
+        """Send messages back to back over one pooled connection
+
+        Returns the error of each message, or None for the messages sent. A message
+        the server refuses does not stop the others. When the connection itself
+        fails, raises SendInterrupted with the results of the messages before it.
+        """
+        results = []
+        try:
+            connection = self._acquire()
+        except Exception as e:
+            raise SendInterrupted(results, e) from e
+        try:
+            for message in messages:
+                started = time.perf_counter()
+                try:
+                    assert message.send_to, "No recipients have been added"
+                    assert message.sender, "The message does not specify a sender and a default sender has not been configured"
+                    if message.has_bad_headers():
+                        raise BadHeaderError
+                    if message.date is None:
+                        message.date = time.time()
+
+                    try:
+                        self._deliver(connection, message)
+                    except Exception as e:
+                        if not _is_stale(e):
+                            raise
+                        # The server dropped the connection; reconnect and retry once
+                        self._close(connection)
+                        connection = None
+                        with self._lock:
+                            self._stats["reconnects"] += 1
+                        connection = self._open()
+                        self._deliver(connection, message)
+                except Exception as e:
+                    with self._lock:
+                        self._stats["send_failures"] += 1
+                    if connection is None or not _is_refused(e):
+                        raise SendInterrupted(results, e) from e
+                    results.append(e)
+                    continue
+                elapsed = time.perf_counter() - started
+
+                with self._lock:
+                    self._stats["messages_sent"] += 1
+                    self._stats["send_seconds"] += elapsed
+                    self._stats["max_send_seconds"] = max(self._stats["max_send_seconds"], elapsed)
+                email_dispatched.send(message, app=current_app._get_current_object())
+                results.append(None)
+        except Exception:
+            if connection is not None:
+                self._close(connection)
+                connection = None
+            raise
+        finally:
+            self._release(connection)
+        return results
+
+    def close(self):
+        """Close every idle connection"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            self._close(connection)
+
+    def stats(self):
+        """Counters describing connection reuse and send latency"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["idle_connections"] = len(self._idle)
+        sent = stats["messages_sent"]
+        stats["messages_per_connection"] = sent / stats["connections_opened"] if stats["connections_opened"] else 0
+        stats["avg_send_seconds"] = stats["send_seconds"] / sent if sent else 0
+        return stats
+
+def get_smtp_pool():
+    """Return the SMTP pool of the current application, creating it on first use"""
+    pool = current_app.extensions.get('smtp_pool')
+    if pool is None:
+        config = current_app.config
+        pool = SMTPPool(
+            current_app.extensions['mail'],
+            size=config['MAIL_POOL_SIZE'],
+            idle_timeout=config['MAIL_POOL_IDLE_TIMEOUT'],
+            max_messages_per_connection=config['MAIL_MAX_MESSAGES_PER_CONNECTION'],
+            timeout=config['MAIL_TIMEOUT']
+        )
+        current_app.extensions['smtp_pool'] = pool
+    return pool
+
+def send_messages(messages):
+    """Send Flask-Mail messages through the pool, or record them when sending is suppressed
+
+    Returns the error of each message, None for those sent; see SMTPPool.send_messages.
+    """
+    state = current_app.extensions['mail']
+    if state.suppress:
+        with state.connect() as connection:
+            for message in messages:
+                connection.send(message)
+        return [None] * len(messages)
+    return get_smtp_pool().send_messages(messages)
+
+def send_message(message):
+    """Send one message, raising the error when it could not be sent"""
+    try:
+        error = send_messages([message])[0]
+    except SendInterrupted as e:
+        raise e.error
+    if error is not None:
+        raise error
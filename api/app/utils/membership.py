@@ -0,0 +1,51 @@
+from sqlalchemy import insert, select, delete
+from app import db
+from app.models.user import User, MyUser
+from app.models.batch import batch_student_association
+from app.utils.connectors import on_batch_membership_change
+
+def resolve_student_emails(emails):
+    """Look up the profiles of the given emails with one IN query
+
+    Returns the set of emails that have both a user and a profile, and the
+    emails that were not found, in the order given.
+    """
+    emails = list(dict.fromkeys(email for email in emails if email))
+    if not emails:
+        return set(), []
+
+    found = set(db.session.execute(
+        select(MyUser.email).join(User, User.id == MyUser.user_id).where(MyUser.email.in_(emails))
+    ).scalars())
+    return found, [email for email in emails if email not in found]
+
+def set_batch_members(batch_id, emails):
+    """Make the batch's students exactly the given emails, writing only the difference
+
+    Returns the emails added, the emails removed and the emails that were not found.
+    Emails without an account are ignored, as before. Live forms targeting the batch
+    get their connectors updated for the students that joined or left.
+    """
+    target, not_found = resolve_student_emails(emails)
+    current = set(db.session.execute(
+        select(batch_student_association.c.myuser_email).where(batch_student_association.c.batch_id == batch_id)
+    ).scalars())
+
+    added = target - current
+    removed = current - target
+
+    if added:
+        db.session.execute(
+            insert(batch_student_association),
+            [{"batch_id": batch_id, "myuser_email": email} for email in added]
+        )
+    if removed:
+        db.session.execute(
+            delete(batch_student_association).where(
+                batch_student_association.c.batch_id == batch_id,
+                batch_student_association.c.myuser_email.in_(removed)
+            )
+        )
+
+    on_batch_membership_change(batch_id, added, removed)
+    return added, removed, not_found
@@ -0,0 +1,108 @@
+import os
+from abc import ABC, abstractmethod
+import sqlite3
+import threading
+import time
+from flask import current_app
+
+class OtpStore(ABC):
+    """Storage for one-time passwords that expire after a time-to-live"""
+
+    @abstractmethod
+    def put(self, email, otp, ttl):
+        """Store the OTP of the email for ttl seconds, replacing any earlier one"""
+
+    @abstractmethod
+    def get(self, email):
+        """Return the OTP stored for the email, or None if there is none or it expired"""
+
+    @abstractmethod
+    def delete(self, email):
+        """Forget the OTP of the email"""
+
+class MemoryOtpStore(OtpStore):
+    """Process-local OTP store, for a single worker process"""
+
+    # Expired entries are swept at most this often
+    SWEEP_INTERVAL = 60
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._next_sweep = time.monotonic() + self.SWEEP_INTERVAL
+
+    def _sweep(self, now):
+        if now < self._next_sweep:
+            return
+        self._entries = {email: entry for email, entry in self._entries.items() if entry[1] > now}
+        self._next_sweep = now + self.SWEEP_INTERVAL
+
+    def put(self, email, otp, ttl):
+        now = time.monotonic()
+        with self._lock:
+            self._sweep(now)
+            self._entries[email] = (otp, now + ttl)
+
+    def get(self, email):
+        now = time.monotonic()
+        with self._lock:
+            self._sweep(now)
+            entry = self._entries.get(email)
+            if entry is None:
+                return None
+            if entry[1] <= now:
+                del self._entries[email]
+                return None
+            return entry[0]
+
+    def delete(self, email):
+        with self._lock:
+            self._entries.pop(email, None)
+
+class SqliteOtpStore(OtpStore):
+    """OTP store in a local SQLite file, shared by every gunicorn worker on the host"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS otp (email TEXT PRIMARY KEY, otp TEXT NOT NULL, expires_at REAL NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS otp_expires_at ON otp (expires_at)")
+
+    def _connect(self):
+        """One connection per thread; sqlite3 connections cannot be shared across threads"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def put(self, email, otp, ttl):
+        now = time.time()
+        conn = self._connect()
+        conn.execute("DELETE FROM otp WHERE expires_at <= ?", (now,))
+        conn.execute("INSERT OR REPLACE INTO otp (email, otp, expires_at) VALUES (?, ?, ?)", (email, otp, now + ttl))
+
+    def get(self, email):
+        row = self._connect().execute(
+            "SELECT otp FROM otp WHERE email = ? AND expires_at > ?", (email, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def delete(self, email):
+        self._connect().execute("DELETE FROM otp WHERE email = ?", (email,))
+
+def get_otp_store():
+    """Return the OTP store configured for the current application"""
+    store = current_app.extensions.get('otp_store')
+    if store is None:
+        if current_app.config['OTP_STORE'] == 'memory':
+            store = MemoryOtpStore()
+        else:
+            path = current_app.config['OTP_STORE_PATH']
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            store = SqliteOtpStore(path)
+        current_app.extensions['otp_store'] = store
+    return store
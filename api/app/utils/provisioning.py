@@ -0,0 +1,221 @@
+import csv
+import io
+from sqlalchemy import insert, select, or_
+from app import db
+from app.models.user import User, MyUser
+from app.models.batch import Batch, batch_student_association
+from app.utils.hashing import hash_passwords, UNUSABLE_PASSWORD
+from app.utils.connectors import on_batch_membership_change
+from app.utils.directory import invalidate_user_directory
+from app.utils.jobs import job_handler, enqueue_job, save_job_progress
+
+PROVISION_JOB = 'provision_students'
+
+# Students hashed and inserted per transaction
+PROVISION_CHUNK_SIZE = 1000
+
+def parse_roster(text):
+    """Read a CSV roster into row dicts; the header names the columns"""
+    reader = csv.DictReader(io.StringIO(text.lstrip('\ufeff')))
+    return [{key.strip(): (value or '').strip() for key, value in row.items() if key} for row in reader]
+
+def _resolve_batches(rows, instance_id):
+    """Map every batch reference in the roster, by id or by name, to its batch id with one query
+
+    A name shared by several batches maps to None, since the student's batch is unclear.
+    """
+    refs = {str(row['batch']).strip() for row in rows if row.get('batch') not in (None, '')}
+    if not refs:
+        return {}
+
+    ids = [int(ref) for ref in refs if ref.isdigit()]
+    query = db.session.query(Batch.id, Batch.batch_name).filter(
+        or_(Batch.id.in_(ids), Batch.batch_name.in_(refs))
+    )
+    if instance_id:
+        query = query.filter(Batch.instance_id == instance_id)
+
+    resolved, by_id = {}, {}
+    for batch_id, batch_name in query:
+        resolved[batch_name] = None if batch_name in resolved else batch_id
+        by_id[str(batch_id)] = batch_id
+    # Ids take precedence over names that happen to look like one
+    resolved.update(by_id)
+    return resolved
+
+def _validate(rows, instance_id):
+    """Split roster rows into valid students and per-row errors"""
+    batches = _resolve_batches(rows, instance_id)
+    emails = {str(row.get('email') or '').strip() for row in rows}
+    existing = set()
+    email_list = [email for email in emails if email]
+    for start in range(0, len(email_list), PROVISION_CHUNK_SIZE):
+        chunk = email_list[start:start + PROVISION_CHUNK_SIZE]
+        existing.update(db.session.execute(
+            select(User.email).where(or_(User.email.in_(chunk), User.username.in_(chunk)))
+        ).scalars())
+        existing.update(db.session.execute(select(MyUser.email).where(MyUser.email.in_(chunk))).scalars())
+
+    students, errors, seen = [], [], set()
+    for number, row in enumerate(rows, start=1):
+        email = str(row.get('email') or '').strip()
+        name = str(row.get('name') or '').strip()
+        error = None
+        year = row.get('year')
+        batch = str(row.get('batch') or '').strip()
+
+        if not email or '@' not in email:
+            error = "Invalid email"
+        elif not name:
+            error = "Missing name"
+        elif email in seen:
+            error = "Duplicate email in roster"
+        elif email in existing:
+            error = "User already exists"
+        elif year not in (None, '') and not str(year).strip().isdigit():
+            error = "Invalid year"
+        elif batch and batch not in batches:
+            error = "Batch not found"
+        elif batch and batches[batch] is None:
+            error = "Batch name matches several batches, give its ID or an instance_id"
+
+        if error:
+            errors.append({"row": number, "email": email or None, "error": error})
+            continue
+
+        seen.add(email)
+        students.append({
+            "row": number,
+            "email": email,
+            "name": name,
+            "sapId": str(row.get('sapId') or '').strip() or None,
+            "year": int(year) if year not in (None, '') else None,
+            "batch_id": batches.get(batch),
+            "password": str(row.get('password') or '')
+        })
+    return students, errors
+
+def _insert_chunk(chunk):
+    """Insert the users, profiles and batch memberships of one chunk with bulk statements"""
+    db.session.execute(insert(User.__table__), [
+        {
+            "username": student["email"],
+            "email": student["email"],
+            "password_hash": student["password_hash"],
+            "is_staff": False,
+            "is_superuser": False
+        }
+        for student in chunk
+    ])
+
+    user_ids = dict(db.session.execute(
+        select(User.email, User.id).where(User.email.in_([student["email"] for student in chunk]))
+    ).all())
+
+    db.session.execute(insert(MyUser.__table__), [
+        {
+            "email": student["email"],
+            "user_id": user_ids[student["email"]],
+            "name": student["name"],
+            "sapId": student["sapId"],
+            "year": student["year"],
+            "isActivated": False,
+            "isVerified": False,
+            "canCreateBatch": False,
+            "canCreateSubject": True,
+            "canCreateFeedbackForm": True
+        }
+        for student in chunk
+    ])
+
+    memberships = [
+        {"batch_id": student["batch_id"], "myuser_email": student["email"]}
+        for student in chunk if student["batch_id"]
+    ]
+    if memberships:
+        db.session.execute(insert(batch_student_association), memberships)
+
+    # New batch members join the live forms of their batch
+    batch_members = {}
+    for membership in memberships:
+        batch_members.setdefault(membership["batch_id"], []).append(membership["myuser_email"])
+    for batch_id, emails in batch_members.items():
+        on_batch_membership_change(batch_id, emails, ())
+    return len(memberships)
+
+def _hash_passwords(job, students, default_password):
+    """Replace each student's password with its hash, renewing the job's lock between chunks
+
+    Passwords come from the row, then default_password; students without one get an
+    unusable password and set their own through the reset password flow.
+    """
+    default_hash = hash_passwords([default_password])[0] if default_password else UNUSABLE_PASSWORD
+    for start in range(0, len(students), PROVISION_CHUNK_SIZE):
+        chunk = students[start:start + PROVISION_CHUNK_SIZE]
+        hashed = iter(hash_passwords([student["password"] for student in chunk if student["password"]]))
+        for student in chunk:
+            password = student.pop("password")
+            student["password_hash"] = next(hashed) if password else default_hash
+        save_job_progress(job, 0)
+
+def _insert_rows(chunk):
+    """Insert a chunk's students one at a time; return the number attached and the failed rows"""
+    attached, failed = 0, []
+    for student in chunk:
+        try:
+            with db.session.begin_nested():
+                attached += _insert_chunk([student])
+        except Exception as e:
+            failed.append({"row": student["row"], "email": student["email"], "error": str(e)})
+    return attached, failed
+
+def queue_provisioning(rows, instance_id=None, default_password=None):
+    """Queue a job creating students from roster rows; the caller commits the session"""
+    return enqueue_job(PROVISION_JOB, {
+        "rows": rows,
+        "instance_id": instance_id,
+        "default_password": default_password or None
+    })
+
+@job_handler(PROVISION_JOB, secrets=("rows", "default_password", "students"))
+def run_provision_students(job):
+    """Create the students of a queued roster in chunked transactions
+
+    The first attempt validates the rows and hashes every password in the low-priority
+    bulk pool, then stores only the hashes, so plaintext passwords leave the payload
+    before any student is created. Each chunk commits together with the job's progress,
+    so a retry resumes after the last chunk created; a chunk that fails is retried row
+    by row, so only the bad rows are reported. The result holds the number of students
+    created and attached to batches, and the per-row errors.
+    """
+    if job.payload.get("students") is None:
+        students, errors = _validate(job.payload["rows"], job.payload["instance_id"])
+        _hash_passwords(job, students, job.payload["default_password"])
+        job.payload["students"] = students
+        job.payload["rows"] = None
+        job.payload["default_password"] = None
+        job.payload["result"] = {"created": 0, "attached": 0, "errors": errors}
+        job.total = len(students)
+        save_job_progress(job, 0)
+
+    students = job.payload["students"]
+    while job.progress < len(students):
+        chunk = students[job.progress:job.progress + PROVISION_CHUNK_SIZE]
+        try:
+            attached = _insert_chunk(chunk)
+            failed = []
+        except Exception:
+            # The session is rolled back, so job attributes are read again below
+            db.session.rollback()
+            attached, failed = _insert_rows(chunk)
+        result = job.payload["result"]
+        job.payload["result"] = {
+            "created": result["created"] + len(chunk) - len(failed),
+            "attached": result["attached"] + attached,
+            "errors": result["errors"] + failed
+        }
+        save_job_progress(job, job.progress + len(chunk))
+        invalidate_user_directory()
+
+    result = job.payload["result"]
+    job.payload["result"] = dict(result, errors=sorted(result["errors"], key=lambda error: error["row"]))
@@ -0,0 +1,201 @@
+import math
+import os
+import sqlite3
+import threading
+import time
+from functools import wraps
+from flask import current_app, request, jsonify
+
+def _take_tokens(states, now, buckets):
+    """Take one token from each of several token buckets, or from none of them
+
+    Each bucket is (key, capacity, refill_seconds): it bursts up to capacity, then gains
+    one token every refill_seconds. states holds each bucket's (tokens, updated) or None.
+    Returns the new states, or None if any bucket is empty, and the seconds to wait.
+    """
+    levels = []
+    for state, (_, capacity, refill_seconds) in zip(states, buckets):
+        tokens, updated = state if state is not None else (capacity, now)
+        levels.append(min(capacity, tokens + (now - updated) / refill_seconds))
+
+    waits = [(1 - level) * refill_seconds for level, (_, _, refill_seconds) in zip(levels, buckets) if level < 1]
+    if waits:
+        return None, max(waits)
+    return [(level - 1, now) for level in levels], 0
+
+def parse_limit(limit):
+    """Parse a limit written as "count/seconds", e.g. "10/300"; empty disables the limit"""
+    if not limit:
+        return None
+    count, seconds = limit.split('/')
+    return int(count), float(seconds)
+
+def _sliding_window(state, now, limit, window):
+    """Count a hit against a sliding window approximated from the current and previous fixed windows
+
+    state is (window index, hits in that window, hits in the window before) or None.
+    Returns the new state, or None if the hit is refused, and the seconds to wait.
+    """
+    index = int(now // window)
+    current, previous = 0, 0
+    if state is not None:
+        if state[0] == index:
+            current, previous = state[1], state[2]
+        elif state[0] == index - 1:
+            previous = state[1]
+
+    elapsed = (now % window) / window
+    if previous * (1 - elapsed) + current < limit:
+        return (index, current + 1, previous), 0
+
+    # Wait until the previous window's share has decayed enough, or the current window ends
+    if current < limit and previous:
+        return None, ((1 - (limit - current) / previous) - elapsed) * window
+    return None, (1 - elapsed) * window
+
+class MemoryRateLimitBackend:
+    """Process-local sliding window counters and token buckets"""
+
+    # Counters of windows that have passed are dropped once this many keys are tracked
+    MAX_KEYS = 10000
+
+    def __init__(self):
+        self._windows = {}
+        # Token buckets by key, as ((tokens, updated), capacity, refill seconds)
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def hit(self, key, limit, window):
+        """Count a hit for the key; return 0 if allowed, or the seconds until it would be"""
+        now = time.time()
+        with self._lock:
+            state, retry_after = _sliding_window(self._windows.get(key), now, limit, window)
+            if state is not None:
+                if key not in self._windows and len(self._windows) >= self.MAX_KEYS:
+                    self._windows = {k: v for k, v in self._windows.items() if v[0] >= int(now // window) - 1}
+                self._windows[key] = state
+            return retry_after
+
+    def take_tokens(self, buckets):
+        """Take a token from every bucket if all have one; return 0, or the seconds until they would"""
+        now = time.time()
+        with self._lock:
+            states, retry_after = _take_tokens([self._buckets.get(key, (None,))[0] for key, _, _ in buckets], now, buckets)
+            if states is not None:
+                if len(self._buckets) >= self.MAX_KEYS:
+                    # A bucket that has refilled completely is the same as one never used
+                    self._buckets = {
+                        key: bucket for key, bucket in self._buckets.items()
+                        if bucket[0][0] + (now - bucket[0][1]) / bucket[2] < bucket[1]
+                    }
+                for (key, capacity, refill_seconds), state in zip(buckets, states):
+                    self._buckets[key] = (state, capacity, refill_seconds)
+            return retry_after
+
+class SqliteRateLimitBackend:
+    """Sliding window counters and token buckets in a local SQLite file, shared by every gunicorn worker on the host"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS rate_limit (key TEXT PRIMARY KEY, window INTEGER NOT NULL, current INTEGER NOT NULL, previous INTEGER NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS token_bucket (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)")
+
+    def _connect(self):
+        """One connection per thread; sqlite3 connections cannot be shared across threads"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def hit(self, key, limit, window):
+        """Count a hit for the key; return 0 if allowed, or the seconds until it would be"""
+        now = time.time()
+        conn = self._connect()
+        # Take the write lock up front so concurrent workers cannot both read the same count
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT window, current, previous FROM rate_limit WHERE key = ?", (key,)).fetchone()
+            state, retry_after = _sliding_window(row, now, limit, window)
+            if state is not None:
+                conn.execute("INSERT OR REPLACE INTO rate_limit (key, window, current, previous) VALUES (?, ?, ?, ?)", (key, *state))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return retry_after
+
+    def take_tokens(self, buckets):
+        """Take a token from every bucket if all have one; return 0, or the seconds until they would"""
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            stored = dict(
+                (key, (tokens, updated)) for key, tokens, updated in conn.execute(
+                    f"SELECT key, tokens, updated FROM token_bucket WHERE key IN ({','.join('?' * len(buckets))})",
+                    [key for key, _, _ in buckets]
+                )
+            )
+            states, retry_after = _take_tokens([stored.get(key) for key, _, _ in buckets], now, buckets)
+            if states is not None:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO token_bucket (key, tokens, updated) VALUES (?, ?, ?)",
+                    [(key, *state) for (key, _, _), state in zip(buckets, states)]
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return retry_after
+
+def get_rate_limit_backend():
+    """Return the rate limit backend configured for the current application"""
+    backend = current_app.extensions.get('rate_limit_backend')
+    if backend is None:
+        if current_app.config['RATE_LIMIT_BACKEND'] == 'sqlite':
+            path = current_app.config['RATE_LIMIT_PATH']
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            backend = SqliteRateLimitBackend(path)
+        else:
+            backend = MemoryRateLimitBackend()
+        current_app.extensions['rate_limit_backend'] = backend
+    return backend
+
+def rate_limit(scope):
+    """Decorator limiting a route per client IP and per email in the JSON body
+
+    Limits are read from the RATE_LIMIT_<SCOPE>_IP and RATE_LIMIT_<SCOPE>_EMAIL config keys.
+    Throttled requests are answered before the route runs.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            config = current_app.config
+            backend = get_rate_limit_backend()
+            data = request.get_json(silent=True)
+            email = data.get('email') if isinstance(data, dict) else None
+
+            checks = [('ip', request.remote_addr)]
+            if isinstance(email, str) and email:
+                checks.append(('email', email.lower()))
+            for kind, value in checks:
+                limit = parse_limit(config.get(f'RATE_LIMIT_{scope.upper()}_{kind.upper()}'))
+                if limit is None:
+                    continue
+                retry_after = backend.hit(f'{scope}:{kind}:{value}', *limit)
+                if retry_after:
+                    return rate_limited_response(retry_after)
+            return f(*args, **kwargs)
+        return decorated
+    return decorator
+
+def rate_limited_response(retry_after):
+    """429 response telling the client when it may try again"""
+    response = jsonify({"status_code": 429, "status_msg": "Too many requests, please try again later"})
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response, 429
@@ -0,0 +1,72 @@
+from sqlalchemy.orm import joinedload
+from app import db
+from app.models.feedback import FeedbackForm, FeedbackUserConnector
+from app.models.user import User, MyUser
+from app.utils.email import send_feedback_reminder, feedback_reminder_template
+from app.utils.mailer import SendInterrupted
+from app.utils.jobs import job_handler, enqueue_job, save_job_progress
+
+REMINDER_JOB = 'feedback_reminder'
+
+# Reminder emails sent per batch; progress is saved after each batch
+REMINDER_CHUNK_SIZE = 50
+
+def unfilled_recipients(form_id):
+    """Email and name of the students who have not filled the form yet"""
+    rows = db.session.query(User.email, MyUser.name).join(
+        FeedbackUserConnector, FeedbackUserConnector.student_id == User.id
+    ).outerjoin(
+        MyUser, MyUser.user_id == User.id
+    ).filter(
+        FeedbackUserConnector.form_id == form_id,
+        FeedbackUserConnector.is_filled == False
+    ).order_by(User.email).all()
+    return [[email, name] for email, name in rows]
+
+def queue_feedback_reminder(form):
+    """Queue a reminder job for the form; the caller commits the session"""
+    return enqueue_job(REMINDER_JOB, {"form_id": form.id})
+
+@job_handler(REMINDER_JOB)
+def run_feedback_reminder(job):
+    """Send the reminder emails of a form, resuming after the last recipient handled
+
+    Progress counts the recipients handled, sent or refused. Addresses the server
+    refuses are recorded in the job's result and skipped; when the connection fails,
+    the progress made so far is saved and the job is retried from there.
+    """
+    form = FeedbackForm.query.options(
+        joinedload(FeedbackForm.teacher).joinedload(User.myuser),
+        joinedload(FeedbackForm.subject)
+    ).filter_by(id=job.payload["form_id"]).first()
+    if not form:
+        raise ValueError("Feedback form not found")
+
+    # Fix the recipient list on the first attempt so retries resume where they stopped
+    if "recipients" not in job.payload:
+        job.payload["recipients"] = unfilled_recipients(form.id)
+        job.total = len(job.payload["recipients"])
+        save_job_progress(job, job.progress)
+
+    # The parts shared by every student are rendered once per run
+    template = feedback_reminder_template(form)
+
+    recipients = job.payload["recipients"]
+    while job.progress < len(recipients):
+        chunk = recipients[job.progress:job.progress + REMINDER_CHUNK_SIZE]
+        interrupted = None
+        try:
+            results = send_feedback_reminder(chunk, form, template)
+        except SendInterrupted as e:
+            results, interrupted = e.results, e
+
+        result = job.payload.get("result") or {"sent": 0, "failed": []}
+        failed = [{"email": email, "error": str(error)} for (email, _), error in zip(chunk, results) if error is not None]
+        job.payload["result"] = {
+            "sent": result["sent"] + len(results) - len(failed),
+            "failed": result["failed"] + failed
+        }
+        # Renews the lock too, so a long run is not reclaimed while it is still sending
+        save_job_progress(job, job.progress + len(results))
+        if interrupted:
+            raise interrupted.error
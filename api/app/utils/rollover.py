@@ -0,0 +1,103 @@
+from sqlalchemy import insert, select, literal, func, and_
+from app import db
+from app.models.batch import Batch, batch_student_association
+from app.models.subject import Subject, SubjectTheory, SubjectPractical
+
+def _numbered(columns, key, order, where):
+    """Select columns with a row number per natural key, so duplicate keys pair up in id order"""
+    return select(
+        *columns,
+        func.row_number().over(partition_by=key, order_by=order).label('rn')
+    ).where(*where)
+
+def _id_map(old, new, key_names):
+    """Subquery pairing old and new ids whose natural keys and row numbers match"""
+    return select(old.c.id.label('old_id'), new.c.id.label('new_id')).join(
+        new, and_(old.c.rn == new.c.rn, *(old.c[name] == new.c[name] for name in key_names))
+    ).subquery()
+
+def _batch_map(source_id, target_id, promote, max_year):
+    year = (Batch.year + promote).label('year')
+    where = [Batch.instance_id == source_id]
+    if max_year is not None:
+        where.append(Batch.year + promote <= max_year)
+    old = _numbered([Batch.id, Batch.batch_name, Batch.batch_division, year], [Batch.batch_name, Batch.batch_division, year], Batch.id, where).subquery()
+    new = _numbered([Batch.id, Batch.batch_name, Batch.batch_division, Batch.year], [Batch.batch_name, Batch.batch_division, Batch.year], Batch.id, [Batch.instance_id == target_id]).subquery()
+    return _id_map(old, new, ['batch_name', 'batch_division', 'year'])
+
+def _subject_map(source_id, target_id):
+    old = _numbered([Subject.id, Subject.subject_name], [Subject.subject_name], Subject.id, [Subject.instance_id == source_id]).subquery()
+    new = _numbered([Subject.id, Subject.subject_name], [Subject.subject_name], Subject.id, [Subject.instance_id == target_id]).subquery()
+    return _id_map(old, new, ['subject_name'])
+
+def _allocation_map(model, subject_map, batch_map, target_id):
+    """Pair old and new allocation rows by their mapped subject and batch"""
+    old = select(
+        model.id,
+        subject_map.c.new_id.label('subject_id'),
+        batch_map.c.new_id.label('batch_id'),
+        func.row_number().over(partition_by=[subject_map.c.new_id, batch_map.c.new_id], order_by=model.id).label('rn')
+    ).join(subject_map, subject_map.c.old_id == model.subject_id).join(batch_map, batch_map.c.old_id == model.batch_id).subquery()
+    new = _numbered(
+        [model.id, model.subject_id, model.batch_id], [model.subject_id, model.batch_id], model.id,
+        [model.subject_id.in_(select(Subject.id).where(Subject.instance_id == target_id))]
+    ).subquery()
+    return _id_map(old, new, ['subject_id', 'batch_id'])
+
+def _clone_allocations(model, teachers_column, subject_map, batch_map):
+    """Copy the allocations whose subject and batch were both cloned"""
+    teachers = getattr(model, teachers_column)
+    db.session.execute(insert(model.__table__).from_select(
+        ['subject_id', 'batch_id', teachers_column],
+        select(subject_map.c.new_id, batch_map.c.new_id, teachers).join(
+            subject_map, subject_map.c.old_id == model.subject_id
+        ).join(
+            batch_map, batch_map.c.old_id == model.batch_id
+        ).order_by(model.id)
+    ))
+
+def _mapping(id_map):
+    return {old_id: new_id for old_id, new_id in db.session.execute(select(id_map.c.old_id, id_map.c.new_id))}
+
+def clone_instance(source_id, target_id, promote_years=False, max_year=None):
+    """Copy the batches, memberships, subjects and allocations of one instance into another
+
+    Every copy is a set-based INSERT ... SELECT. With promote_years the copied batches
+    move up one year, and batches that would pass max_year are left behind along with
+    their memberships and allocations. Returns the old to new id mapping of each table
+    and the number of memberships copied. The caller commits the session.
+    """
+    promote = 1 if promote_years else 0
+    where = [Batch.instance_id == source_id]
+    if max_year is not None:
+        where.append(Batch.year + promote <= max_year)
+
+    db.session.execute(insert(Batch.__table__).from_select(
+        ['batch_name', 'batch_division', 'year', 'student_email', 'instance_id'],
+        select(Batch.batch_name, Batch.batch_division, Batch.year + promote, Batch.student_email, literal(target_id)).where(*where).order_by(Batch.id)
+    ))
+    batch_map = _batch_map(source_id, target_id, promote, max_year)
+
+    memberships = db.session.execute(insert(batch_student_association).from_select(
+        ['batch_id', 'myuser_email'],
+        select(batch_map.c.new_id, batch_student_association.c.myuser_email).join(
+            batch_map, batch_map.c.old_id == batch_student_association.c.batch_id
+        )
+    )).rowcount
+
+    db.session.execute(insert(Subject.__table__).from_select(
+        ['subject_name', 'instance_id'],
+        select(Subject.subject_name, literal(target_id)).where(Subject.instance_id == source_id).order_by(Subject.id)
+    ))
+    subject_map = _subject_map(source_id, target_id)
+
+    _clone_allocations(SubjectTheory, 'sub_teacher_email', subject_map, batch_map)
+    _clone_allocations(SubjectPractical, 'prac_teacher_email', subject_map, batch_map)
+
+    return {
+        "batches": _mapping(batch_map),
+        "subjects": _mapping(subject_map),
+        "theory_subjects": _mapping(_allocation_map(SubjectTheory, subject_map, batch_map, target_id)),
+        "practical_subjects": _mapping(_allocation_map(SubjectPractical, subject_map, batch_map, target_id)),
+        "memberships": memberships
+    }
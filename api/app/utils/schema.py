@@ -0,0 +1,61 @@
+import logging
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.schema import CreateColumn
+from app import db
+
+logger = logging.getLogger(__name__)
+
+# Tables of removed models, dropped at startup
+RETIRED_TABLES = [
+    'otp'  # OTPs now live in the OTP store, see app.utils.otp_store
+]
+
+def add_missing_columns():
+    """Add the model columns missing from tables created by an older version; safe to run on every start
+
+    db.create_all only creates missing tables. Added columns need a server default,
+    which fills them in for the rows already stored.
+    """
+    inspector = inspect(db.engine)
+    dialect = db.engine.dialect
+    with db.engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    conn.execute(text(
+                        f"ALTER TABLE {dialect.identifier_preparer.format_table(table)} "
+                        f"ADD COLUMN {CreateColumn(column).compile(dialect=dialect)}"
+                    ))
+
+def add_missing_indexes():
+    """Create the model indexes missing from tables created by an older version; safe to run on every start
+
+    A unique index the stored rows already break is skipped with a warning, and
+    created on a later start once the duplicates are merged.
+    """
+    inspector = inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            try:
+                with db.engine.begin() as conn:
+                    index.create(conn)
+            except IntegrityError:
+                logger.warning("Skipped unique index %s: table %s holds duplicate rows", index.name, table.name)
+
+def drop_retired_tables():
+    """Drop the tables of models that were removed; safe to run on every start"""
+    inspector = inspect(db.engine)
+    preparer = db.engine.dialect.identifier_preparer
+    with db.engine.begin() as conn:
+        for name in RETIRED_TABLES:
+            if inspector.has_table(name):
+                conn.execute(text(f"DROP TABLE {preparer.quote(name)}"))
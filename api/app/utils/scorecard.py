@@ -0,0 +1,194 @@
+import threading
+import time
+from itertools import groupby
+from operator import itemgetter
+from datetime import datetime
+import numpy as np
+from flask import current_app
+from sqlalchemy import select
+from app import db
+from app.models.feedback import FeedbackForm, FeedbackUserConnector
+from app.models.user import MyUser
+from app.utils.coherence import register_cache, publish_change
+
+# Rows fetched from the database cursor at a time while building a score matrix
+SCORECARD_YIELD_PER = 1000
+
+_scorecard_cache = {}
+_scorecard_generation = {}
+_scorecard_lock = threading.Lock()
+
+def _score(answer):
+    """Convert an answer to a numeric score, or NaN when it is not a rating"""
+    if isinstance(answer, bool):
+        return np.nan
+    if isinstance(answer, (int, float)):
+        return float(answer)
+    if isinstance(answer, str):
+        try:
+            return float(answer)
+        except ValueError:
+            return np.nan
+    return np.nan
+
+def instance_submissions(instance_id):
+    """Yield the form id and answers of every submission in the instance, ordered by form, with one query"""
+    return db.session.execute(
+        select(FeedbackUserConnector.form_id, FeedbackUserConnector.user_feedback).join(
+            FeedbackForm, FeedbackForm.id == FeedbackUserConnector.form_id
+        ).where(
+            FeedbackForm.instance_id == instance_id,
+            FeedbackUserConnector.is_filled == True
+        ).order_by(FeedbackUserConnector.form_id).execution_options(yield_per=SCORECARD_YIELD_PER)
+    )
+
+def score_matrix(submissions, questions):
+    """Build the dense students x questions score matrix of a form's submissions"""
+    submissions = [feedback or {} for feedback in submissions]
+    scores = np.fromiter(
+        (_score(feedback.get(question)) for feedback in submissions for question in questions),
+        dtype=float, count=len(submissions) * len(questions)
+    )
+    return scores.reshape(len(submissions), len(questions))
+
+def _group_medians(values, groups, counts):
+    """Median of values per group, given the group of each value and the group sizes"""
+    medians = np.full(counts.shape, np.nan)
+    if values.size == 0:
+        return medians
+    ordered = values[np.lexsort((values, groups))]
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    present = counts > 0
+    low = starts[present] + (counts[present] - 1) // 2
+    high = starts[present] + counts[present] // 2
+    medians[present] = (ordered[low] + ordered[high]) / 2
+    return medians
+
+def _group_means(values, groups, size):
+    """Count and mean of values per group"""
+    counts = np.bincount(groups, minlength=size)
+    sums = np.bincount(groups, weights=values, minlength=size)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = np.where(counts > 0, sums / counts, np.nan)
+    return counts, means
+
+def _as_number(value):
+    """Convert a NumPy scalar to a JSON friendly number"""
+    return None if np.isnan(value) else round(float(value), 4)
+
+def compute_scorecards(instance_id):
+    """Compute a scorecard for every teacher with forms in the instance"""
+    forms = db.session.query(
+        FeedbackForm.id, FeedbackForm.teacher_id, FeedbackForm.is_theory, FeedbackForm.form_field
+    ).filter(FeedbackForm.instance_id == instance_id).order_by(FeedbackForm.id).all()
+
+    teacher_ids = sorted({form.teacher_id for form in forms})
+    teacher_index = {teacher_id: index for index, teacher_id in enumerate(teacher_ids)}
+
+    score_parts, teacher_parts, theory_parts = [], [], []
+    form_details = {teacher_id: [] for teacher_id in teacher_ids}
+
+    submissions = {
+        form_id: [feedback for _, feedback in rows]
+        for form_id, rows in groupby(instance_submissions(instance_id), key=itemgetter(0))
+    }
+
+    for form in forms:
+        questions = list(form.form_field or {})
+        matrix = score_matrix(submissions.get(form.id, ()), questions)
+        answered = ~np.isnan(matrix)
+
+        # Per-question means of this form
+        question_counts = answered.sum(axis=0)
+        question_sums = np.where(answered, matrix, 0).sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            question_means = np.where(question_counts > 0, question_sums / question_counts, np.nan)
+
+        form_details[form.teacher_id].append({
+            "form_id": form.id,
+            "is_theory": form.is_theory,
+            "responses": int(matrix.shape[0]),
+            "question_means": {
+                question: _as_number(mean) for question, mean in zip(questions, question_means)
+            }
+        })
+
+        scores = matrix[answered]
+        score_parts.append(scores)
+        teacher_parts.append(np.full(scores.size, teacher_index[form.teacher_id], dtype=np.int64))
+        theory_parts.append(np.full(scores.size, bool(form.is_theory)))
+
+    size = len(teacher_ids)
+    scores = np.concatenate(score_parts) if score_parts else np.empty(0)
+    teachers = np.concatenate(teacher_parts) if teacher_parts else np.empty(0, dtype=np.int64)
+    theory = np.concatenate(theory_parts) if theory_parts else np.empty(0, dtype=bool)
+
+    counts, means = _group_means(scores, teachers, size)
+    # Sum squares around each teacher's mean; E[x^2] - E[x]^2 loses precision to cancellation
+    deviations = scores - means[teachers]
+    squares = np.bincount(teachers, weights=deviations * deviations, minlength=size)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        std_devs = np.where(counts > 0, np.sqrt(squares / counts), np.nan)
+    medians = _group_medians(scores, teachers, counts)
+    theory_counts, theory_means = _group_means(scores[theory], teachers[theory], size)
+    practical_counts, practical_means = _group_means(scores[~theory], teachers[~theory], size)
+
+    # Percentile of each teacher's mean among all teachers of the instance; forms carry no department
+    rated = counts > 0
+    percentiles = np.full(size, np.nan)
+    if rated.any():
+        peer_means = np.sort(means[rated])
+        percentiles[rated] = np.searchsorted(peer_means, means[rated], side='right') / peer_means.size * 100
+
+    names = dict(db.session.query(MyUser.user_id, MyUser.name).filter(MyUser.user_id.in_(teacher_ids)))
+
+    result = []
+    for index, teacher_id in enumerate(teacher_ids):
+        result.append({
+            "teacher_id": teacher_id,
+            "teacher_name": names.get(teacher_id),
+            "score_count": int(counts[index]),
+            "mean": _as_number(means[index]),
+            "median": _as_number(medians[index]),
+            "std_dev": _as_number(std_devs[index]),
+            "percentile": _as_number(percentiles[index]),
+            "theory": {"score_count": int(theory_counts[index]), "mean": _as_number(theory_means[index])},
+            "practical": {"score_count": int(practical_counts[index]), "mean": _as_number(practical_means[index])},
+            "forms": form_details[teacher_id]
+        })
+    return result
+
+def get_instance_scorecards(instance_id):
+    """Return the scorecards of an instance and when they were computed
+
+    Results are cached for SCORECARD_MAX_AGE seconds. Submissions do not expire
+    them, so a busy instance is recomputed at most once per period; changes to
+    its forms expire them at once.
+    """
+    now = time.monotonic()
+    with _scorecard_lock:
+        cached = _scorecard_cache.get(instance_id)
+        generation = _scorecard_generation.get(instance_id, 0)
+    if cached is not None and now - cached[2] < current_app.config['SCORECARD_MAX_AGE']:
+        return cached[0], cached[1]
+
+    scorecards = compute_scorecards(instance_id)
+    computed_at = datetime.utcnow()
+
+    # Only cache the result if no form change invalidated it while computing
+    with _scorecard_lock:
+        if _scorecard_generation.get(instance_id, 0) == generation:
+            _scorecard_cache[instance_id] = (scorecards, computed_at, now)
+    return scorecards, computed_at
+
+def _expire_scorecards(instance_id):
+    with _scorecard_lock:
+        _scorecard_cache.pop(instance_id, None)
+        _scorecard_generation[instance_id] = _scorecard_generation.get(instance_id, 0) + 1
+
+def invalidate_scorecards(instance_id):
+    """Drop the cached scorecards of an instance after its forms change, in this worker and the others"""
+    _expire_scorecards(instance_id)
+    publish_change('scorecards', instance_id)
+
+register_cache('scorecards', lambda key, generation: _expire_scorecards(int(key) if key else None))
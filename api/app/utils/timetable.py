@@ -0,0 +1,139 @@
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models.subject import Subject, SubjectTheory, SubjectPractical
+from app.models.batch import Batch
+from app.models.user import User
+
+ALLOCATION_TYPES = ('theory', 'practical')
+
+def _teacher_keys(teacher_ids):
+    """Teacher ids of an allocation given as a list of ids or a mapping keyed by id"""
+    if isinstance(teacher_ids, dict):
+        teacher_ids = list(teacher_ids)
+    if not isinstance(teacher_ids, list):
+        return None
+    try:
+        return [int(teacher_id) for teacher_id in teacher_ids]
+    except (TypeError, ValueError):
+        return None
+
+def _in_instance(column, instance_id):
+    """Condition matching the rows of an instance, or the rows of no instance"""
+    return column == instance_id if instance_id else column.is_(None)
+
+def _validate(rows, instance_id):
+    """Split timetable rows into valid allocations and per-row errors
+
+    Batches must belong to the instance the timetable is imported into.
+    """
+    batch_refs, teacher_refs = set(), set()
+    for row in rows:
+        if str(row.get('batch_id', '')).isdigit():
+            batch_refs.add(int(row['batch_id']))
+        teacher_refs.update(_teacher_keys(row.get('teacher_ids')) or ())
+
+    batches, foreign_batches = set(), set()
+    if batch_refs:
+        for found_id, in_instance in db.session.execute(
+            select(Batch.id, _in_instance(Batch.instance_id, instance_id)).where(Batch.id.in_(batch_refs))
+        ):
+            (batches if in_instance else foreign_batches).add(found_id)
+    teachers = {}
+    if teacher_refs:
+        teachers = dict(db.session.execute(
+            select(User.id, User.email).where(User.id.in_(teacher_refs), User.is_staff == True)
+        ).all())
+
+    allocations, errors = [], []
+    for number, row in enumerate(rows, start=1):
+        subject_name = str(row.get('subject_name') or '').strip()
+        kind = row.get('type', 'theory')
+        batch_id = row.get('batch_id')
+        teacher_ids = _teacher_keys(row.get('teacher_ids'))
+        error = None
+
+        if not subject_name:
+            error = "Missing subject name"
+        elif kind not in ALLOCATION_TYPES:
+            error = "Type must be theory or practical"
+        elif str(batch_id).isdigit() and int(batch_id) in foreign_batches:
+            error = "Batch belongs to another instance"
+        elif not str(batch_id).isdigit() or int(batch_id) not in batches:
+            error = "Batch not found"
+        elif not teacher_ids:
+            error = "Missing teacher ids"
+        elif any(teacher_id not in teachers for teacher_id in teacher_ids):
+            error = "Teacher not found"
+
+        if error:
+            errors.append({"row": number, "subject_name": subject_name or None, "error": error})
+            continue
+
+        # Lists of ids are stored keyed by id like the single-allocation endpoints expect
+        stored = row['teacher_ids'] if isinstance(row['teacher_ids'], dict) else {
+            str(teacher_id): teachers[teacher_id] for teacher_id in teacher_ids
+        }
+        allocations.append({
+            "subject_name": subject_name,
+            "type": kind,
+            "batch_id": int(batch_id),
+            "teacher_ids": stored
+        })
+    return allocations, errors
+
+def _subject_ids(names, instance_id):
+    """Ids of the instance's subjects by name"""
+    query = select(Subject.subject_name, Subject.id).where(Subject.subject_name.in_(names), _in_instance(Subject.instance_id, instance_id))
+    return dict(db.session.execute(query.order_by(Subject.id.desc())).all())
+
+def _create_subjects(names, instance_id):
+    """Create the instance's subjects missing by name; return the ids of all by name and how many were created
+
+    A concurrent import may commit some of the same subjects first. The unique
+    index on (instance_id, subject_name) then refuses the insert, and the missing
+    names are read and inserted again.
+    """
+    for _ in range(2):
+        subject_ids = _subject_ids(names, instance_id)
+        new_names = names - subject_ids.keys()
+        if not new_names:
+            return subject_ids, 0
+        try:
+            with db.session.begin_nested():
+                db.session.execute(insert(Subject.__table__), [
+                    {"subject_name": name, "instance_id": instance_id} for name in sorted(new_names)
+                ])
+        except IntegrityError:
+            continue
+        return _subject_ids(names, instance_id), len(new_names)
+    raise RuntimeError("Subjects kept being created concurrently, please retry the import")
+
+def import_timetable(rows, instance_id=None):
+    """Create the subjects and allocations of a timetable in one transaction
+
+    Subjects are matched by name within the instance and created when missing.
+    Returns the number of subjects created, theory and practical allocations
+    created, and the per-row errors. The caller commits the session.
+    """
+    allocations, errors = _validate(rows, instance_id)
+    if not allocations:
+        return 0, 0, 0, errors
+
+    names = {allocation["subject_name"] for allocation in allocations}
+    subject_ids, created = _create_subjects(names, instance_id)
+
+    theory = [
+        {"subject_id": subject_ids[allocation["subject_name"]], "batch_id": allocation["batch_id"], "sub_teacher_email": allocation["teacher_ids"]}
+        for allocation in allocations if allocation["type"] == 'theory'
+    ]
+    practical = [
+        {"subject_id": subject_ids[allocation["subject_name"]], "batch_id": allocation["batch_id"], "prac_teacher_email": allocation["teacher_ids"]}
+        for allocation in allocations if allocation["type"] == 'practical'
+    ]
+    if theory:
+        db.session.execute(insert(SubjectTheory.__table__), theory)
+    if practical:
+        db.session.execute(insert(SubjectPractical.__table__), practical)
+
+    return created, len(theory), len(practical), errors
@@ -1,8 +1,32 @@
 from app import create_app, db
+from app.utils.aggregates import backfill_form_aggregates
+from app.utils.connectors import backfill_form_batches
+from app.utils.schema import add_missing_columns, add_missing_indexes, drop_retired_tables
+from multiprocessing import Process
+import os
+import worker
 
 app = create_app()
 
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
-    app.run(debug=True, host='0.0.0.0') 
\ No newline at end of file
+        add_missing_columns()
+        add_missing_indexes()
+        drop_retired_tables()
+        backfill_form_batches()
+        backfill_form_aggregates()
+    
+    # Start the job worker once, not again in the reloader's child process. It is not
+    # a daemon process, since daemons cannot start the bulk password hashing pool.
+    worker_process = None
+    if not os.environ.get('WERKZEUG_RUN_MAIN'):
+        worker_process = Process(target=worker.main)
+        worker_process.start()
+    
+    try:
+        app.run(debug=True, host='0.0.0.0')
+    finally:
+        if worker_process is not None:
+            worker_process.terminate()
+            worker_process.join()
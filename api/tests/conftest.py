@@ -0,0 +1,97 @@
+import os
+import pytest
+from app import create_app, db
+from app.models.user import User, MyUser
+from app.models.batch import Batch
+from app.models.instance import FeedbackInstance
+from app.models.subject import Subject
+from app.routes.auth import get_tokens_for_user
+from app.utils.auth import _role_versions
+from app.utils.cache import teacher_name_cache
+from app.utils.directory import _expire_user_directory
+from app.utils.scorecard import _scorecard_cache
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """Application on a fresh SQLite database, with cheap password hashes, no shared cache file and no outbound mail"""
+    monkeypatch.setenv('SECRET_KEY', 'test-secret-key-of-a-reasonable-length')
+    monkeypatch.setenv('MONGODB_URI', 'sqlite:///' + os.path.join(tmp_path, 'test.sqlite'))
+    monkeypatch.setenv('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:1000')
+    monkeypatch.setenv('CACHE_COHERENCE_BACKEND', 'none')
+    monkeypatch.setenv('EMAIL_HOST_USER', 'portal@example.com')
+    monkeypatch.setenv('OTP_STORE_PATH', os.path.join(tmp_path, 'otp_store.sqlite'))
+    monkeypatch.setenv('RATE_LIMIT_PATH', os.path.join(tmp_path, 'rate_limit.sqlite'))
+    app = create_app()
+    app.config['TESTING'] = True
+    # Record outbound mail instead of connecting to a server
+    app.extensions['mail'].suppress = True
+    # Worker-local caches are module level and would carry ids over from the previous test's database
+    _role_versions.clear()
+    _scorecard_cache.clear()
+    _expire_user_directory()
+    teacher_name_cache.clear()
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def instance(app):
+    instance = FeedbackInstance(instance_name='Odd semester', is_latest=True, is_selected=True)
+    db.session.add(instance)
+    db.session.commit()
+    return instance
+
+@pytest.fixture
+def make_user(app):
+    """Create a user with a profile; the caller commits"""
+    def make_user(email, name=None, is_staff=False, is_superuser=False):
+        user = User(username=email, email=email, is_staff=is_staff, is_superuser=is_superuser)
+        user.set_password('password')
+        db.session.add(user)
+        db.session.flush()
+        db.session.add(MyUser(email=email, user=user, name=name or email, isVerified=True, year=2))
+        return user
+    return make_user
+
+@pytest.fixture
+def make_batch(instance):
+    """Create a batch of the instance holding the given users; the caller commits"""
+    def make_batch(name, students=(), division='A', year=2):
+        batch = Batch(batch_name=name, batch_division=division, year=year, student_email={}, instance=instance)
+        db.session.add(batch)
+        db.session.flush()
+        for student in students:
+            batch.student_email_mtm.append(student.myuser)
+        return batch
+    return make_batch
+
+@pytest.fixture
+def subject(instance):
+    subject = Subject(subject_name='Mathematics', instance=instance)
+    db.session.add(subject)
+    db.session.commit()
+    return subject
+
+@pytest.fixture
+def teacher(make_user):
+    teacher = make_user('teacher@example.com', 'Teacher', is_staff=True, is_superuser=True)
+    db.session.commit()
+    return teacher
+
+@pytest.fixture
+def students(make_user):
+    students = [make_user(f'student{index}@example.com', f'Student {index}') for index in range(6)]
+    db.session.commit()
+    return students
+
+@pytest.fixture
+def auth_header(app):
+    """Authorization header carrying a fresh access token of a user"""
+    def auth_header(user):
+        return {"Authorization": "Bearer " + get_tokens_for_user(user)['access']}
+    return auth_header
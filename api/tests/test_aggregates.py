@@ -0,0 +1,72 @@
+from app import db
+from app.models.feedback import FeedbackUserConnector, FeedbackOptionCount
+from app.utils.aggregates import backfill_form_aggregates, form_summary
+
+def _create_form(client, headers, subject, batch):
+    response = client.post('/api/createFeedbackForm', headers=headers, json={
+        'form_field': {'q1': 'Rate the course', 'q2': 'Pick topics'},
+        'subject_id': subject.id,
+        'due_date': '2030-01-01T00:00:00Z',
+        'year': 2,
+        'batch_list': {str(batch.id): batch.batch_name}
+    })
+    return response.json['form_id']
+
+def _submit(client, headers, form_id, answers):
+    response = client.post('/api/saveFeedbackFormResult', headers=headers, json={'data': {'form_id': form_id, 'form_data': answers}})
+    assert response.status_code == 200
+
+def _summary(form_id):
+    return {row["question"]: row for row in form_summary(form_id)}
+
+def test_resubmission_replaces_previous_answers(client, teacher, students, subject, make_batch, auth_header):
+    batch = make_batch('A1', students)
+    db.session.commit()
+    form_id = _create_form(client, auth_header(teacher), subject, batch)
+
+    _submit(client, auth_header(students[0]), form_id, {'q1': 5, 'q2': ['a', 'b']})
+    _submit(client, auth_header(students[1]), form_id, {'q1': '3', 'q2': 'a'})
+    _submit(client, auth_header(students[0]), form_id, {'q1': 4, 'q2': 'c'})
+
+    summary = _summary(form_id)
+    assert summary['q1']['responses'] == 2
+    assert summary['q1']['option_counts'] == {'3': 1, '4': 1}
+    assert summary['q1']['mean'] == 3.5
+    assert summary['q2']['option_counts'] == {'a': 1, 'c': 1}
+    # Emptied options are removed rather than left at zero
+    assert FeedbackOptionCount.query.filter_by(form_id=form_id, option='b').count() == 0
+
+def test_resubmitting_an_uncounted_answer_does_not_subtract_it(client, teacher, students, subject, make_batch, auth_header):
+    batch = make_batch('A1', students)
+    db.session.commit()
+    form_id = _create_form(client, auth_header(teacher), subject, batch)
+
+    # Answers stored before the aggregate tables existed
+    for student, rating in [(students[0], 5), (students[1], 3)]:
+        connector = FeedbackUserConnector.query.filter_by(form_id=form_id, student_id=student.id).one()
+        connector.user_feedback = {'q1': rating}
+        connector.is_filled = True
+    db.session.commit()
+
+    _submit(client, auth_header(students[0]), form_id, {'q1': 4})
+    assert _summary(form_id)['q1']['option_counts'] == {'4': 1}
+
+    backfill_form_aggregates()
+    assert _summary(form_id)['q1']['option_counts'] == {'3': 1, '4': 1}
+
+    _submit(client, auth_header(students[1]), form_id, {'q1': 4})
+    summary = _summary(form_id)
+    assert summary['q1']['option_counts'] == {'4': 2}
+    assert summary['q1']['responses'] == 2
+
+def test_rebuild_matches_incremental_totals(client, teacher, students, subject, make_batch, auth_header):
+    batch = make_batch('A1', students)
+    db.session.commit()
+    form_id = _create_form(client, auth_header(teacher), subject, batch)
+    for index, student in enumerate(students):
+        _submit(client, auth_header(student), form_id, {'q1': index % 5 + 1, 'q2': ['x', 'y'][index % 2]})
+    _submit(client, auth_header(students[0]), form_id, {'q1': 2})
+
+    incremental = form_summary(form_id)
+    response = client.get(f'/api/getFeedbackSummary?form_id={form_id}&rebuild=1', headers=auth_header(teacher))
+    assert response.json['data'] == incremental
@@ -0,0 +1,90 @@
+from flask import request, jsonify
+from sqlalchemy import event
+from app import db
+from app.models.user import User
+from app.utils.auth import basic_auth, superuser_auth, get_auth_counters
+
+class QueryCounter:
+    """Count the statements sent to the database while active"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __enter__(self):
+        event.listen(db.engine, 'before_cursor_execute', self._count)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(db.engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        self.count += 1
+
+def test_stacked_decorators_decode_once_and_load_user_once(app, client, teacher, auth_header):
+    @app.route('/test/stackedAuth')
+    @basic_auth
+    @superuser_auth
+    def stacked_auth():
+        # Reading the user twice must reuse the row loaded for the role check
+        assert request.current_admin is request.current_user
+        return jsonify({"email": request.current_user.email, "counters": get_auth_counters()})
+
+    headers = auth_header(teacher)
+    db.session.expunge_all()
+    with QueryCounter() as queries:
+        response = client.get('/test/stackedAuth', headers=headers)
+
+    assert response.status_code == 200
+    assert response.json["email"] == teacher.email
+    assert response.json["counters"]["jwt_decodes"] == 1
+    assert response.json["counters"]["identity_queries"] <= 1
+    assert queries.count <= 1
+
+def test_superuser_route_reports_counters(app, client, teacher, auth_header):
+    app.config['AUTH_DEBUG_COUNTERS'] = True
+    response = client.get('/api/mailStats', headers=auth_header(teacher))
+
+    assert response.status_code == 200
+    assert response.headers['X-Auth-JWT-Decodes'] == '1'
+    assert int(response.headers['X-Auth-Identity-Queries']) <= 1
+
+def test_stacked_decorators_reject_non_superuser(app, client, students, auth_header):
+    app.config['AUTH_DEBUG_COUNTERS'] = True
+    response = client.get('/api/mailStats', headers=auth_header(students[0]))
+
+    assert response.status_code == 400
+    assert response.headers['X-Auth-JWT-Decodes'] == '1'
+
+def test_role_change_revokes_existing_tokens(client, make_user, auth_header):
+    staff = make_user('staff@example.com', is_staff=True)
+    db.session.commit()
+    headers = auth_header(staff)
+    assert client.get('/api/getBatches', headers=headers).status_code == 200
+
+    staff.is_superuser = True
+    db.session.commit()
+
+    assert client.get('/api/getBatches', headers=headers).status_code == 403
+    assert client.get('/api/getBatches', headers=auth_header(db.session.get(User, staff.id))).status_code == 200
+
+def test_permission_flags_keep_tokens_valid(client, make_user, teacher, auth_header):
+    staff = make_user('staff@example.com', is_staff=True)
+    db.session.commit()
+    headers = auth_header(staff)
+
+    response = client.post('/api/tSettings', headers=auth_header(teacher), json={'user_id': staff.id, 'canCreateBatch': True})
+    assert response.status_code == 200
+
+    assert client.get('/api/getBatches', headers=headers).status_code == 200
+    assert db.session.get(User, staff.id).role_version == 0
+
+def test_role_version_survives_a_cold_cache(app, client, make_user, auth_header):
+    staff = make_user('staff@example.com', is_staff=True)
+    db.session.commit()
+    headers = auth_header(staff)
+    staff.is_staff = False
+    db.session.commit()
+
+    # A restarted worker, or one the change was never published to, reads the version from the row
+    app.config['ROLE_VERSION_CACHE_SECONDS'] = 0
+    assert client.get('/api/getBatches', headers=headers).status_code == 403
@@ -0,0 +1,67 @@
+from app import db
+from app.models.instance import FeedbackInstance
+
+def _get(client, headers, path, **args):
+    response = client.get(path, headers=headers, query_string=args)
+    assert response.status_code == 200
+    return response
+
+def _create_batch(client, headers, name, instance_id):
+    response = client.post('/api/bac', headers=headers, json={'batch_name': name, 'batch_division': 'A', 'year': 2, 'instance_id': instance_id})
+    assert response.status_code == 200
+
+def test_batch_list_is_served_from_cache_until_a_batch_is_added(client, teacher, instance, auth_header):
+    headers = auth_header(teacher)
+
+    assert _get(client, headers, '/api/getBatches').headers['X-Cache'] == 'MISS'
+    assert _get(client, headers, '/api/getBatches').headers['X-Cache'] == 'HIT'
+
+    _create_batch(client, headers, 'A1', instance.id)
+
+    response = _get(client, headers, '/api/getBatches')
+    assert response.headers['X-Cache'] == 'MISS'
+    assert [batch['label'] for batch in response.json['data']] == ['A1']
+
+def test_a_write_to_one_instance_keeps_the_others_cached(client, teacher, instance, auth_header):
+    other = FeedbackInstance(instance_name='Even semester')
+    db.session.add(other)
+    db.session.commit()
+    other_id = other.id
+    headers = auth_header(teacher)
+    for args in ({'instance_id': instance.id}, {'instance_id': other_id}, {}):
+        _get(client, headers, '/api/getBatches', **args)
+
+    _create_batch(client, headers, 'A1', instance.id)
+
+    assert _get(client, headers, '/api/getBatches', instance_id=instance.id).headers['X-Cache'] == 'MISS'
+    assert _get(client, headers, '/api/getBatches', instance_id=other_id).headers['X-Cache'] == 'HIT'
+    assert _get(client, headers, '/api/getBatches').headers['X-Cache'] == 'MISS'
+
+def test_renaming_a_teacher_refreshes_cached_subjects(client, teacher, subject, make_batch, auth_header):
+    batch = make_batch('A1')
+    db.session.commit()
+    headers = auth_header(teacher)
+    response = client.post('/api/addTheorySubject', headers=headers, json={
+        'subject_name': subject.subject_name, 'batch_id': batch.id, 'teacher_ids': {str(teacher.id): teacher.email}, 'instance_id': subject.instance_id
+    })
+    assert response.status_code == 200
+    assert _get(client, headers, '/api/getallsubjects').json['data'][0]['theory_subject'][0]['sub_teacher_name'] == ['Teacher']
+
+    teacher.myuser.name = 'Dr. Teacher'
+    db.session.commit()
+
+    response = _get(client, headers, '/api/getallsubjects')
+    assert response.headers['X-Cache'] == 'MISS'
+    assert response.json['data'][0]['theory_subject'][0]['sub_teacher_name'] == ['Dr. Teacher']
+
+def test_new_staff_account_refreshes_the_teacher_emails(client, teacher, make_user, auth_header):
+    headers = auth_header(teacher)
+    _get(client, headers, '/api/getAllTeacherMails')
+    assert _get(client, headers, '/api/getAllTeacherMails').headers['X-Cache'] == 'HIT'
+
+    make_user('lecturer@example.com', 'Lecturer', is_staff=True)
+    db.session.commit()
+
+    response = _get(client, headers, '/api/getAllTeacherMails')
+    assert response.headers['X-Cache'] == 'MISS'
+    assert 'lecturer@example.com' in response.get_data(as_text=True)
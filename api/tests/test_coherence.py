@@ -0,0 +1,63 @@
+import os
+import sqlite3
+import pytest
+from app import create_app
+from app.utils import coherence
+from app.utils.coherence import SqliteCoherenceStore, get_coherence_store, publish_change, sync_caches
+
+@pytest.fixture
+def workers(app, tmp_path, monkeypatch):
+    """Two applications sharing one coherence file, as two gunicorn workers do"""
+    monkeypatch.setenv('CACHE_COHERENCE_BACKEND', 'sqlite')
+    monkeypatch.setenv('CACHE_COHERENCE_PATH', os.path.join(tmp_path, 'cache_coherence.sqlite'))
+    return create_app(), create_app()
+
+@pytest.fixture
+def expired(monkeypatch):
+    """Keys expired in a test cache, with their generation"""
+    expired = []
+    monkeypatch.setitem(coherence._expire_handlers, 'test_cache', lambda key, generation: expired.append((key, generation)))
+    return expired
+
+def test_store_reports_each_change_once_to_the_other_workers(tmp_path):
+    path = os.path.join(tmp_path, 'cache_coherence.sqlite')
+    first, second = SqliteCoherenceStore(path), SqliteCoherenceStore(path)
+
+    first.publish('catalog:3')
+    assert first.publish('catalog:3') == 2
+    assert [(name, generation) for name, generation, _ in second.changes()] == [('catalog:3', 2)]
+
+    # The publisher has already expired its own cache
+    second.publish('user_directory')
+    assert [(name, generation) for name, generation, _ in first.changes()] == [('user_directory', 1)]
+    assert second.changes() == [] and first.changes() == []
+    # A worker started later applies what was published before it
+    assert [name for name, _, _ in SqliteCoherenceStore(path).changes()] == ['catalog:3', 'user_directory']
+
+def test_change_published_by_one_worker_expires_the_cache_of_another(workers, expired):
+    first, second = workers
+    with second.app_context():
+        sync_caches()
+
+    with first.app_context():
+        publish_change('test_cache', 7)
+        publish_change('test_cache')
+        sync_caches()
+    assert expired == []
+
+    with second.app_context():
+        sync_caches()
+        sync_caches()
+        assert get_coherence_store().stats()['applied'] == 2
+    assert expired == [('7', 1), (None, 1)]
+
+def test_failed_publish_is_counted_without_failing_the_caller(workers, monkeypatch):
+    first, _ = workers
+    with first.app_context():
+        store = get_coherence_store()
+        def locked(name):
+            raise sqlite3.OperationalError('database is locked')
+        monkeypatch.setattr(store, 'publish', locked)
+
+        assert publish_change('test_cache', 7) is None
+        assert store.stats()['publish_failures'] == 1
@@ -0,0 +1,76 @@
+from app import db
+from app.models.feedback import FeedbackUserConnector
+
+def _create_form(client, headers, subject, batch_ids):
+    response = client.post('/api/createFeedbackForm', headers=headers, json={
+        'form_field': {'q1': 'Rate the course'},
+        'subject_id': subject.id,
+        'due_date': '2030-01-01T00:00:00Z',
+        'year': 2,
+        'batch_list': {str(batch_id): 'batch' for batch_id in batch_ids}
+    })
+    assert response.status_code == 200
+    return response.json['form_id']
+
+def _connectors(form_id):
+    return {
+        connector.student_id: connector
+        for connector in FeedbackUserConnector.query.filter_by(form_id=form_id)
+    }
+
+def test_changing_batches_only_adds_and_removes_the_difference(client, teacher, students, subject, make_batch, auth_header):
+    first = make_batch('A1', students[:4])
+    second = make_batch('A2', students[2:])
+    db.session.commit()
+    headers = auth_header(teacher)
+    form_id = _create_form(client, headers, subject, [first.id])
+
+    before = _connectors(form_id)
+    assert set(before) == {student.id for student in students[:4]}
+    kept = before[students[2].id]
+    kept.is_filled = True
+    kept.user_feedback = {'q1': 5}
+    kept_id = kept.id
+    db.session.commit()
+
+    response = client.post('/api/updateFeedbackform', headers=headers, json={'form_id': form_id, 'batch_list': {str(second.id): 'A2'}})
+    assert response.status_code == 200
+
+    db.session.expire_all()
+    after = _connectors(form_id)
+    assert set(after) == {student.id for student in students[2:]}
+    # Students in both batches keep their connector and submitted answers
+    assert after[students[2].id].id == kept_id
+    assert after[students[2].id].user_feedback == {'q1': 5}
+    assert not after[students[5].id].is_filled
+
+def test_changing_batches_keeps_submitted_connectors(client, teacher, students, subject, make_batch, auth_header):
+    first = make_batch('A1', students[:2])
+    second = make_batch('A2', students[2:])
+    db.session.commit()
+    headers = auth_header(teacher)
+    form_id = _create_form(client, headers, subject, [first.id])
+    response = client.post('/api/saveFeedbackFormResult', headers=auth_header(students[0]), json={'data': {'form_id': form_id, 'form_data': {'q1': 4}}})
+    assert response.status_code == 200
+
+    response = client.post('/api/updateFeedbackform', headers=headers, json={'form_id': form_id, 'batch_list': {str(second.id): 'A2'}})
+    assert response.status_code == 200
+
+    db.session.expire_all()
+    after = _connectors(form_id)
+    # The student who submitted keeps the connector, and the summary still counts the answer
+    assert set(after) == {students[0].id} | {student.id for student in students[2:]}
+    assert after[students[0].id].user_feedback == {'q1': 4}
+    summary = client.get(f'/api/getFeedbackSummary?form_id={form_id}', headers=headers).json
+    assert summary['filled_count'] == 1
+    assert summary['data'][0]['option_counts'] == {'4': 1}
+
+def test_overlapping_batches_give_one_connector_per_student(client, teacher, students, subject, make_batch, auth_header):
+    first = make_batch('A1', students[:4])
+    second = make_batch('A2', students[2:])
+    db.session.commit()
+
+    form_id = _create_form(client, auth_header(teacher), subject, [first.id, second.id])
+
+    student_ids = [connector.student_id for connector in FeedbackUserConnector.query.filter_by(form_id=form_id)]
+    assert sorted(student_ids) == sorted(student.id for student in students)
@@ -0,0 +1,63 @@
+from app import db
+
+def _search(client, headers, **args):
+    response = client.get('/api/userDirectory', headers=headers, query_string=args)
+    assert response.status_code == 200
+    return response.json
+
+def _emails(page):
+    return [user['email'] for user in page['data']]
+
+def test_cursor_pages_through_every_user_in_name_order(client, teacher, students, auth_header):
+    headers = auth_header(teacher)
+
+    pages, cursor = [], None
+    while True:
+        page = _search(client, headers, limit=3, **({'cursor': cursor} if cursor else {}))
+        pages.append(_emails(page))
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+
+    assert pages == [
+        ['student0@example.com', 'student1@example.com', 'student2@example.com'],
+        ['student3@example.com', 'student4@example.com', 'student5@example.com'],
+        ['teacher@example.com']
+    ]
+
+def test_prefix_search_and_staff_filter(client, teacher, students, auth_header):
+    students[4].myuser.name = 'Asha Verma'
+    students[4].myuser.sapId = '60004200'
+    db.session.commit()
+    headers = auth_header(teacher)
+
+    assert _emails(_search(client, headers, q='verm')) == ['student4@example.com']
+    assert _emails(_search(client, headers, q='6000')) == ['student4@example.com']
+    assert _emails(_search(client, headers, q='TEACHER@')) == ['teacher@example.com']
+    assert _emails(_search(client, headers, q='student 1')) == ['student1@example.com']
+    assert _emails(_search(client, headers, is_staff='true')) == ['teacher@example.com']
+    assert len(_search(client, headers, is_staff='false')['data']) == 6
+
+def test_paging_a_search_continues_after_the_cursor(client, teacher, students, auth_header):
+    headers = auth_header(teacher)
+
+    first = _search(client, headers, q='stud', limit=4)
+    second = _search(client, headers, q='stud', limit=4, cursor=first['next_cursor'])
+
+    assert _emails(first) + _emails(second) == [student.email for student in students]
+    assert second['next_cursor'] is None
+
+def test_committed_changes_show_up_in_the_next_search(client, teacher, students, make_user, auth_header):
+    headers = auth_header(teacher)
+    assert _search(client, headers, q='zoe')['data'] == []
+
+    make_user('zoe@example.com', 'Zoe Kale')
+    db.session.commit()
+
+    assert _emails(_search(client, headers, q='kale')) == ['zoe@example.com']
+
+def test_bad_cursor_and_limit_are_refused(client, teacher, auth_header):
+    headers = auth_header(teacher)
+
+    assert client.get('/api/userDirectory', headers=headers, query_string={'cursor': 'not-a-cursor'}).status_code == 400
+    assert client.get('/api/userDirectory', headers=headers, query_string={'limit': 0}).status_code == 400
@@ -0,0 +1,67 @@
+import csv
+import io
+import json
+from app import db
+
+def _create_form(client, headers, subject, batch, form_field):
+    response = client.post('/api/createFeedbackForm', headers=headers, json={
+        'form_field': form_field,
+        'subject_id': subject.id,
+        'instance_id': subject.instance_id,
+        'due_date': '2030-01-01T00:00:00Z',
+        'year': 2,
+        'batch_list': {str(batch.id): batch.batch_name}
+    })
+    return response.json['form_id']
+
+def _submit(client, headers, form_id, answers):
+    response = client.post('/api/saveFeedbackFormResult', headers=headers, json={'data': {'form_id': form_id, 'form_data': answers}})
+    assert response.status_code == 200
+
+def _export(client, headers, **args):
+    response = client.get('/api/exportFeedbackData', headers=headers, query_string=args)
+    assert response.status_code == 200
+    return response
+
+def test_csv_has_one_column_per_question(client, teacher, students, subject, make_batch, auth_header):
+    batch = make_batch('A1', students[:2])
+    db.session.commit()
+    headers = auth_header(teacher)
+    form_id = _create_form(client, headers, subject, batch, {'q1': 'Rate the course', 'q2': 'Pick topics'})
+    _submit(client, auth_header(students[0]), form_id, {'q1': 5, 'q2': ['loops', 'lists']})
+
+    response = _export(client, headers, form_id=form_id)
+
+    assert response.mimetype == 'text/csv'
+    assert response.headers['Content-Disposition'] == f'attachment; filename=feedback_form_{form_id}.csv'
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert [row['student'] for row in rows] == ['student0@example.com', 'student1@example.com']
+    assert (rows[0]['is_filled'], rows[0]['q1'], json.loads(rows[0]['q2'])) == ('True', '5', ['loops', 'lists'])
+    assert (rows[1]['is_filled'], rows[1]['q1'], rows[1]['q2']) == ('False', '', '')
+    assert rows[0]['teacher_email'] == 'teacher@example.com'
+
+def test_ndjson_covers_every_form_of_the_instance(client, teacher, students, instance, subject, make_batch, auth_header):
+    batch = make_batch('A1', students[:2])
+    db.session.commit()
+    headers = auth_header(teacher)
+    first = _create_form(client, headers, subject, batch, {'q1': 'Rate the course'})
+    second = _create_form(client, headers, subject, batch, {'q1': 'Rate the lab'})
+    _submit(client, auth_header(students[1]), second, {'q1': 3})
+
+    response = _export(client, headers, instance_id=instance.id, format='ndjson')
+
+    assert response.mimetype == 'application/x-ndjson'
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [(row['form_id'], row['student']) for row in rows] == [
+        (first, 'student0@example.com'), (first, 'student1@example.com'),
+        (second, 'student0@example.com'), (second, 'student1@example.com')
+    ]
+    assert rows[3]['user_feedback'] == {'q1': 3}
+    assert rows[3]['student_name'] == 'Student 1'
+
+def test_unknown_format_and_missing_form_are_refused(client, teacher, auth_header):
+    headers = auth_header(teacher)
+
+    assert client.get('/api/exportFeedbackData', headers=headers, query_string={'form_id': 1, 'format': 'xlsx'}).status_code == 400
+    assert client.get('/api/exportFeedbackData', headers=headers).status_code == 400
+    assert client.get('/api/exportFeedbackData', headers=headers, query_string={'form_id': 999}).status_code == 404
@@ -0,0 +1,57 @@
+from sqlalchemy import event
+from app import db
+
+def _create_form(client, headers, subject, batch):
+    response = client.post('/api/createFeedbackForm', headers=headers, json={
+        'form_field': {'q1': 'Rate the course'},
+        'subject_id': subject.id,
+        'due_date': '2030-01-01T00:00:00Z',
+        'year': 2,
+        'batch_list': {str(batch.id): batch.batch_name}
+    })
+    return response.json['form_id']
+
+def _page(client, headers, form_id, **args):
+    response = client.get('/api/getFeedbackData', headers=headers, query_string={'form_id': form_id, **args})
+    assert response.status_code == 200
+    return response.json
+
+def test_pages_follow_on_without_gaps_or_repeats(client, teacher, students, subject, make_batch, auth_header):
+    batch = make_batch('A1', students)
+    db.session.commit()
+    headers = auth_header(teacher)
+    form_id = _create_form(client, headers, subject, batch)
+    response = client.post('/api/saveFeedbackFormResult', headers=auth_header(students[1]), json={'data': {'form_id': form_id, 'form_data': {'q1': 4}}})
+    assert response.status_code == 200
+
+    first = _page(client, headers, form_id, limit=4)
+    second = _page(client, headers, form_id, limit=4, after_id=first['next_after_id'])
+
+    assert first['next_after_id'] == first['data'][-1]['id']
+    assert second['next_after_id'] is None
+    rows = first['data'] + second['data']
+    assert [row['id'] for row in rows] == sorted({row['id'] for row in rows})
+    assert [row['student'] for row in rows] == [student.email for student in students]
+    assert rows[1]['student_name'] == 'Student 1'
+    assert (rows[1]['is_filled'], rows[1]['user_feedback']) == (True, {'q1': 4})
+    assert first['form']['teacher_name'] == 'Teacher'
+    assert first['form']['subject'] == 'Mathematics'
+
+def test_query_count_does_not_grow_with_the_page(client, teacher, students, subject, make_batch, auth_header):
+    batch = make_batch('A1', students)
+    db.session.commit()
+    headers = auth_header(teacher)
+    form_id = _create_form(client, headers, subject, batch)
+
+    statements = []
+    count = lambda *args: statements.append(args[2])
+    event.listen(db.engine, 'before_cursor_execute', count)
+    try:
+        _page(client, headers, form_id, limit=1)
+        small = len(statements)
+        statements.clear()
+        assert len(_page(client, headers, form_id, limit=6)['data']) == 6
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', count)
+
+    assert len(statements) == small
@@ -0,0 +1,33 @@
+import threading
+from werkzeug.security import generate_password_hash
+from app import db
+from app.utils import hashing
+
+def _login(client, email, password='password'):
+    return client.post('/api/login', json={'email': email, 'password': password})
+
+def test_login_is_refused_with_retry_after_while_the_queue_is_full(app, client, students, monkeypatch):
+    app.config['PASSWORD_HASH_RETRY_AFTER'] = 7
+    hashing._executor_and_slots()
+    slots = threading.BoundedSemaphore(1)
+    monkeypatch.setattr(hashing, '_slots', slots)
+
+    slots.acquire()
+    refused = _login(client, students[0].email)
+    slots.release()
+
+    assert refused.status_code == 503
+    assert refused.headers['Retry-After'] == '7'
+    assert _login(client, students[0].email).status_code == 200
+    assert _login(client, students[0].email, 'wrong').status_code == 401
+
+def test_login_is_refused_when_hashing_takes_too_long(app, client, students):
+    # A full-cost hash cannot be checked within the timeout
+    students[0].password_hash = generate_password_hash('password', 'pbkdf2:sha256:600000')
+    db.session.commit()
+    app.config['PASSWORD_HASH_TIMEOUT'] = 0.01
+
+    refused = _login(client, students[0].email)
+
+    assert refused.status_code == 503
+    assert refused.headers['Retry-After'] == str(app.config['PASSWORD_HASH_RETRY_AFTER'])
@@ -0,0 +1,65 @@
+from app import db
+from app.models.feedback import FeedbackUserConnector
+
+def _create_form(client, headers, subject, batches):
+    response = client.post('/api/createFeedbackForm', headers=headers, json={
+        'form_field': {'q1': 'Rate the course'},
+        'subject_id': subject.id,
+        'due_date': '2030-01-01T00:00:00Z',
+        'year': 2,
+        'batch_list': {str(batch.id): batch.batch_name for batch in batches}
+    })
+    assert response.status_code == 200
+    return response.json['form_id']
+
+def _update_members(client, headers, batch_id, students):
+    response = client.post('/api/bacUpdate', headers=headers, json={
+        'batch_id': batch_id,
+        'student_emails': [student if isinstance(student, str) else student.email for student in students]
+    })
+    assert response.status_code == 200
+    return response.json
+
+def _connected(form_id):
+    return {
+        connector.student_id: connector.is_filled
+        for connector in FeedbackUserConnector.query.filter_by(form_id=form_id)
+    }
+
+def test_membership_change_updates_only_the_affected_connectors(client, teacher, students, subject, make_batch, auth_header):
+    first = make_batch('A1', [students[0], students[1], students[2], students[3], students[5]])
+    second = make_batch('A2', [students[3]])
+    db.session.commit()
+    headers = auth_header(teacher)
+    form_id = _create_form(client, headers, subject, [first, second])
+    response = client.post('/api/saveFeedbackFormResult', headers=auth_header(students[0]), json={'data': {'form_id': form_id, 'form_data': {'q1': 4}}})
+    assert response.status_code == 200
+    untouched = {
+        connector.student_id: connector.id
+        for connector in FeedbackUserConnector.query.filter_by(form_id=form_id)
+    }
+    ids = [student.id for student in students]
+
+    result = _update_members(client, headers, first.id, [students[1], students[2], students[4], 'nobody@example.com'])
+
+    assert (result['added'], result['removed'], result['not_found']) == (1, 3, ['nobody@example.com'])
+    db.session.expire_all()
+    # The submitted student and the one still in A2 keep their connectors; the other leaver loses it
+    assert _connected(form_id) == {ids[0]: True, ids[1]: False, ids[2]: False, ids[3]: False, ids[4]: False}
+    for connector in FeedbackUserConnector.query.filter_by(form_id=form_id):
+        if connector.student_id in untouched:
+            assert connector.id == untouched[connector.student_id]
+
+def test_closed_forms_are_left_alone(client, teacher, students, subject, make_batch, auth_header):
+    batch = make_batch('A1', students[:2])
+    db.session.commit()
+    headers = auth_header(teacher)
+    form_id = _create_form(client, headers, subject, [batch])
+    response = client.post('/api/updateFeedbackform', headers=headers, json={'form_id': form_id, 'is_alive': False})
+    assert response.status_code == 200
+    ids = [student.id for student in students]
+
+    _update_members(client, headers, batch.id, students[1:3])
+
+    db.session.expire_all()
+    assert _connected(form_id) == {ids[0]: False, ids[1]: False}
@@ -0,0 +1,66 @@
+import pytest
+from sqlalchemy import inspect, text
+from app import create_app, db
+from app.utils.otp_store import OtpStore, MemoryOtpStore, SqliteOtpStore, get_otp_store
+from app.utils.schema import drop_retired_tables
+
+def _send(client, email, remote_addr='10.0.0.1'):
+    return client.post('/api/sendOtp', json={'email': email}, environ_base={'REMOTE_ADDR': remote_addr})
+
+def test_otp_sent_by_one_worker_verifies_on_another(app, client, students):
+    email = students[0].email
+    assert _send(client, email).status_code == 200
+    otp = get_otp_store().get(email)
+
+    # A second worker process builds its own app on the same instance files
+    other = create_app()
+    other.config['TESTING'] = True
+    response = other.test_client().post('/api/verifyOtp', json={'email': email, 'otp': otp})
+
+    assert response.status_code == 200
+    assert get_otp_store().get(email) is None
+
+@pytest.mark.parametrize('make_store', [MemoryOtpStore, lambda: SqliteOtpStore(':memory:')])
+def test_store_expires_and_deletes(make_store):
+    store = make_store()
+    store.put('a@example.com', '123456', 60)
+    store.put('b@example.com', '654321', -1)
+
+    assert store.get('a@example.com') == '123456'
+    assert store.get('b@example.com') is None
+    store.delete('a@example.com')
+    assert store.get('a@example.com') is None
+
+def test_store_interface_is_abstract():
+    with pytest.raises(TypeError):
+        OtpStore()
+
+def test_email_bucket_refuses_after_burst(app, client, students):
+    app.config['OTP_SEND_EMAIL_BURST'] = 2
+    email = students[0].email
+
+    codes = [_send(client, email).status_code for _ in range(3)]
+    refused = _send(client, email)
+
+    assert codes == [200, 200, 429]
+    assert refused.status_code == 429
+    assert int(refused.headers['Retry-After']) == app.config['OTP_SEND_EMAIL_REFILL_SECONDS']
+
+def test_refused_email_does_not_use_up_the_ip_bucket(app, client, students):
+    app.config['OTP_SEND_EMAIL_BURST'] = 1
+    app.config['OTP_SEND_IP_BURST'] = 4
+
+    assert _send(client, students[0].email).status_code == 200
+    assert _send(client, students[0].email).status_code == 429
+    assert [_send(client, student.email).status_code for student in students[1:5]] == [200, 200, 200, 429]
+    # Another client is not affected
+    assert _send(client, students[5].email, remote_addr='10.0.0.2').status_code == 200
+
+def test_retired_otp_table_is_dropped(app):
+    with db.engine.begin() as conn:
+        conn.execute(text("CREATE TABLE otp (id INTEGER PRIMARY KEY, Otp VARCHAR(100))"))
+
+    drop_retired_tables()
+    drop_retired_tables()
+
+    assert not inspect(db.engine).has_table('otp')
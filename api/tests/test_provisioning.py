@@ -0,0 +1,103 @@
+import io
+import multiprocessing
+import pytest
+from werkzeug.security import check_password_hash
+from app import db
+from app.models.job import Job
+from app.models.user import User
+from app.utils import provisioning
+from app.utils.hashing import hash_passwords, UNUSABLE_PASSWORD
+from app.utils.jobs import claim_next_job, run_job
+
+ROSTER = "email,name,password,batch\nana@example.com,Ana,secret-one,A1\nben@example.com,Ben,,A1\ncy@example.com,Cy,secret-two,\n"
+
+def _provision(client, headers, roster=ROSTER, **options):
+    response = client.post(
+        '/api/provisionStudents', headers=headers,
+        data={'file': (io.BytesIO(roster.encode()), 'roster.csv'), **options}
+    )
+    assert response.status_code == 202
+    return response.json['job_id']
+
+def _run_next_job():
+    job = run_job(claim_next_job())
+    return db.session.get(Job, job.id)
+
+def test_provisioning_stores_only_hashes_and_clears_them_when_done(client, teacher, make_batch, auth_header):
+    make_batch('A1')
+    db.session.commit()
+    job_id = _provision(client, auth_header(teacher), default_password='welcome')
+    hashed = []
+
+    # Inspect the payload committed once validation and hashing are done
+    insert_chunk = provisioning._insert_chunk
+    def capture(chunk):
+        payload = db.session.get(Job, job_id).payload
+        hashed.append((payload['rows'], payload['default_password'], payload['students']))
+        return insert_chunk(chunk)
+    provisioning._insert_chunk = capture
+    try:
+        job = _run_next_job()
+    finally:
+        provisioning._insert_chunk = insert_chunk
+
+    rows, default_password, students = hashed[0]
+    assert rows is None and default_password is None
+    assert all('password' not in student for student in students)
+    assert job.status == 'done'
+    assert job.payload['result'] == {'created': 3, 'attached': 2, 'errors': []}
+    assert job.payload['students'] is None
+
+    users = {user.email: user for user in User.query.filter(User.email.like('%@example.com'), User.is_staff == False)}
+    assert check_password_hash(users['ana@example.com'].password_hash, 'secret-one')
+    assert check_password_hash(users['ben@example.com'].password_hash, 'welcome')
+
+def test_passwordless_rows_get_an_unusable_password(client, teacher, auth_header):
+    _provision(client, auth_header(teacher), roster="email,name\nana@example.com,Ana\n")
+    _run_next_job()
+
+    assert User.query.filter_by(email='ana@example.com').one().password_hash == UNUSABLE_PASSWORD
+    response = client.post('/api/login', json={'email': 'ana@example.com', 'password': UNUSABLE_PASSWORD})
+    assert response.status_code == 401
+
+def test_failed_job_clears_plaintext_passwords(app, client, teacher, auth_header, monkeypatch):
+    app.config['JOB_MAX_ATTEMPTS'] = 1
+    job_id = _provision(client, auth_header(teacher), default_password='welcome')
+    monkeypatch.setattr(provisioning, '_validate', lambda rows, instance_id: 1 / 0)
+
+    job = _run_next_job()
+
+    assert job.id == job_id
+    assert job.status == 'failed'
+    assert job.payload['rows'] is None
+    assert job.payload['default_password'] is None
+
+def test_failing_chunk_reports_only_the_bad_rows(client, teacher, make_user, make_batch, auth_header, monkeypatch):
+    make_batch('A1')
+    db.session.commit()
+    _provision(client, auth_header(teacher))
+
+    # Another request creates one of the accounts after the roster was validated
+    validate = provisioning._validate
+    def validate_then_conflict(rows, instance_id):
+        result = validate(rows, instance_id)
+        make_user('ben@example.com')
+        return result
+    monkeypatch.setattr(provisioning, '_validate', validate_then_conflict)
+
+    job = _run_next_job()
+
+    assert job.status == 'done'
+    assert job.payload['result']['created'] == 2
+    assert job.payload['result']['attached'] == 1
+    assert [error['email'] for error in job.payload['result']['errors']] == ['ben@example.com']
+    assert User.query.filter(User.email.in_(['ana@example.com', 'cy@example.com'])).count() == 2
+
+def test_daemon_process_hashes_in_thread(app, monkeypatch):
+    monkeypatch.setitem(multiprocessing.current_process()._config, 'daemon', True)
+    monkeypatch.setattr('app.utils.hashing._bulk_hash_executor', lambda: pytest.fail("daemon started a pool"))
+
+    hashes = hash_passwords(['one', 'two'])
+
+    assert check_password_hash(hashes[0], 'one')
+    assert check_password_hash(hashes[1], 'two')
@@ -0,0 +1,46 @@
+import pytest
+from app import create_app
+
+def _login(client, email, **kwargs):
+    return client.post('/api/login', json={'email': email, 'password': 'wrong'}, **kwargs)
+
+def test_login_is_throttled_per_email(app, client):
+    app.config['RATE_LIMIT_LOGIN_EMAIL'] = '2/300'
+
+    codes = [_login(client, 'Someone@example.com').status_code for _ in range(2)]
+    refused = _login(client, 'someone@example.com')
+
+    assert codes == [401, 401]
+    assert refused.status_code == 429
+    assert 1 <= int(refused.headers['Retry-After']) <= 300
+    assert _login(client, 'other@example.com').status_code == 401
+
+def test_per_ip_limits_are_off_by_default(app, client, students):
+    # Clients behind one NAT or an unconfigured proxy share an address
+    assert not app.config['RATE_LIMIT_LOGIN_IP']
+    assert [_login(client, f'user{i}@example.com').status_code for i in range(20)] == [401] * 20
+    assert [client.post('/api/sendOtp', json={'email': student.email}).status_code for student in students] == [200] * 6
+
+def test_per_ip_limit_ignores_forwarded_for_without_proxy_fix(app, client):
+    app.config['RATE_LIMIT_LOGIN_IP'] = '1/300'
+
+    assert _login(client, 'a@example.com', headers={'X-Forwarded-For': '203.0.113.1'}).status_code == 401
+    assert _login(client, 'b@example.com', headers={'X-Forwarded-For': '203.0.113.2'}).status_code == 429
+
+@pytest.fixture
+def proxied_app(app, monkeypatch):
+    monkeypatch.setenv('PROXY_FIX_X_FOR', '1')
+    proxied_app = create_app()
+    proxied_app.config['TESTING'] = True
+    proxied_app.config['RATE_LIMIT_BACKEND'] = 'memory'
+    proxied_app.config['RATE_LIMIT_LOGIN_IP'] = '1/300'
+    return proxied_app
+
+def test_per_ip_limit_keys_on_forwarded_for_behind_proxy(proxied_app):
+    client = proxied_app.test_client()
+    # The proxy appends the address it saw; anything before it came from the client
+    forwarded = lambda address: {'headers': {'X-Forwarded-For': f'198.51.100.7, {address}'}}
+
+    assert _login(client, 'a@example.com', **forwarded('203.0.113.1')).status_code == 401
+    assert _login(client, 'b@example.com', **forwarded('203.0.113.2')).status_code == 401
+    assert _login(client, 'c@example.com', **forwarded('203.0.113.1')).status_code == 429
@@ -0,0 +1,153 @@
+import smtplib
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import update
+from app import db
+from app.models.job import Job
+from app.utils import reminders
+from app.utils.jobs import claim_next_job, run_job, run_pending_jobs
+from app.utils.mailer import SendInterrupted
+
+# Recipients the server accepts, in the order reminders are sent
+STUDENT_EMAILS = [f'student{index}@example.com' for index in range(6)]
+
+class StubPool:
+    """Stands in for SMTPPool: refuses addresses containing 'bad' and can drop the connection"""
+
+    def __init__(self):
+        self.sent = []
+        # Number of messages accepted in all before the connection drops once
+        self.disconnect_after = None
+        # Number of messages accepted in all before the worker process dies
+        self.crash_after = None
+
+    def send_messages(self, messages):
+        results = []
+        for message in messages:
+            if len(self.sent) == self.disconnect_after:
+                self.disconnect_after = None
+                raise SendInterrupted(results, smtplib.SMTPServerDisconnected('Connection unexpectedly closed'))
+            if len(self.sent) == self.crash_after:
+                self.crash_after = None
+                raise WorkerCrashed()
+            email = message.recipients[0]
+            if 'bad' in email:
+                results.append(smtplib.SMTPRecipientsRefused({email: (550, b'No such user')}))
+            else:
+                self.sent.append(email)
+                results.append(None)
+        return results
+
+class WorkerCrashed(BaseException):
+    """Ends a run the way a killed worker would, without the job handler noticing"""
+
+@pytest.fixture
+def pool(app):
+    pool = StubPool()
+    app.extensions['mail'].suppress = False
+    app.extensions['smtp_pool'] = pool
+    return pool
+
+@pytest.fixture
+def reminder_job(client, teacher, students, make_user, subject, make_batch, auth_header, monkeypatch):
+    """Queue the reminders of a form whose seven students include one address the server refuses"""
+    monkeypatch.setattr(reminders, 'REMINDER_CHUNK_SIZE', 2)
+    refused = make_user('bad.address@example.com', 'Bad Address')
+    batch = make_batch('A1', [refused, *students])
+    db.session.commit()
+    headers = auth_header(teacher)
+    response = client.post('/api/createFeedbackForm', headers=headers, json={
+        'form_field': {'q1': 'Rate the course'},
+        'subject_id': subject.id,
+        'due_date': '2030-01-01T00:00:00Z',
+        'year': 2,
+        'batch_list': {str(batch.id): 'A1'}
+    })
+    assert response.status_code == 200
+
+    response = client.post('/api/sendReminder', headers=headers, json={'data': {'form_id': response.json['form_id']}})
+    assert response.status_code == 202
+    return response.json['job_id']
+
+@pytest.fixture
+def job_status(client, teacher, auth_header):
+    """Read a job's progress through the API, as the teacher's page polls it"""
+    # Running jobs removes the session, detaching the teacher
+    headers = auth_header(teacher)
+    def job_status(job_id):
+        response = client.get(f'/api/getJobStatus?job_id={job_id}', headers=headers)
+        assert response.status_code == 200
+        return response.json['data']
+    return job_status
+
+def _make_due(job_id):
+    db.session.execute(update(Job).where(Job.id == job_id).values(run_after=datetime.utcnow()))
+    db.session.commit()
+
+def test_refused_recipient_is_recorded_and_the_rest_are_sent(pool, reminder_job, job_status):
+    assert job_status(reminder_job)['status'] == 'queued'
+
+    assert run_pending_jobs() == 1
+
+    status = job_status(reminder_job)
+    assert status['status'] == 'done'
+    assert status['progress'] == status['total'] == 7
+    assert status['result']['sent'] == 6
+    assert [failure['email'] for failure in status['result']['failed']] == ['bad.address@example.com']
+    assert '550' in status['result']['failed'][0]['error']
+    assert pool.sent == STUDENT_EMAILS
+
+def test_dropped_connection_is_retried_with_backoff_from_the_saved_progress(app, pool, reminder_job, job_status):
+    pool.disconnect_after = 3
+    run_pending_jobs()
+
+    # The refused address and three students were handled before the drop
+    status = job_status(reminder_job)
+    assert (status['status'], status['attempts'], status['progress'], status['total']) == ('queued', 1, 4, 7)
+    assert 'SMTPServerDisconnected' in status['last_error']
+    delay = db.session.get(Job, reminder_job).run_after - datetime.utcnow()
+    assert timedelta(seconds=app.config['JOB_BACKOFF_SECONDS'] - 5) < delay <= timedelta(seconds=app.config['JOB_BACKOFF_SECONDS'])
+    assert run_pending_jobs() == 0
+
+    # A second failure waits twice as long
+    pool.disconnect_after = 4
+    _make_due(reminder_job)
+    run_pending_jobs()
+    status = job_status(reminder_job)
+    assert (status['attempts'], status['progress']) == (2, 5)
+    delay = db.session.get(Job, reminder_job).run_after - datetime.utcnow()
+    assert delay > timedelta(seconds=2 * app.config['JOB_BACKOFF_SECONDS'] - 5)
+
+    _make_due(reminder_job)
+    run_pending_jobs()
+    status = job_status(reminder_job)
+    assert (status['status'], status['attempts'], status['progress']) == ('done', 3, 7)
+    assert status['result']['sent'] == 6
+    assert pool.sent == STUDENT_EMAILS
+
+def test_saved_progress_renews_the_lock_and_a_crashed_run_resumes(app, pool, reminder_job, job_status):
+    job = claim_next_job()
+    # Backdate the claim so only the progress saves keep the job from looking abandoned
+    lock_timeout = timedelta(seconds=app.config['JOB_LOCK_TIMEOUT'])
+    db.session.execute(update(Job).where(Job.id == job.id).values(locked_at=datetime.utcnow() - lock_timeout))
+    db.session.commit()
+
+    pool.crash_after = 3
+    with pytest.raises(WorkerCrashed):
+        run_job(job)
+    db.session.rollback()
+    db.session.remove()
+
+    status = job_status(reminder_job)
+    assert (status['status'], status['progress']) == ('running', 4)
+    assert claim_next_job() is None
+
+    # Once the lock times out another worker picks the job up where it stopped
+    db.session.execute(update(Job).where(Job.id == reminder_job).values(locked_at=datetime.utcnow() - lock_timeout))
+    db.session.commit()
+    assert run_pending_jobs() == 1
+
+    status = job_status(reminder_job)
+    assert (status['status'], status['attempts'], status['progress']) == ('done', 2, 7)
+    assert status['result']['sent'] == 6
+    assert pool.sent == STUDENT_EMAILS
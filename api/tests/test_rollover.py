@@ -0,0 +1,64 @@
+from app import db
+from app.models.batch import Batch
+from app.models.instance import FeedbackInstance
+from app.models.subject import Subject, SubjectTheory, SubjectPractical
+from app.utils.rollover import clone_instance
+
+def _allocate(subject, batch, teacher):
+    db.session.add(SubjectTheory(subject=subject, batch=batch, sub_teacher_email={str(teacher.id): teacher.email}))
+    db.session.add(SubjectPractical(subject=subject, batch=batch, prac_teacher_email={str(teacher.id): teacher.email}))
+
+def _members(batch):
+    return sorted(member.email for member in batch.student_email_mtm)
+
+def test_clone_maps_every_row_to_its_copy(instance, teacher, students, subject, make_batch):
+    # Two batches share a natural key; they must still map to distinct copies in id order
+    first = make_batch('A1', students[:2])
+    twin = make_batch('A1', students[2:4])
+    other = make_batch('B1', students[4:], division='B', year=3)
+    for batch in (first, twin, other):
+        _allocate(subject, batch, teacher)
+    target = FeedbackInstance(instance_name='Even semester')
+    db.session.add(target)
+    db.session.commit()
+
+    mapping = clone_instance(instance.id, target.id, promote_years=True)
+    db.session.commit()
+
+    assert set(mapping["batches"]) == {first.id, twin.id, other.id}
+    assert len(set(mapping["batches"].values())) == 3
+    assert mapping["batches"][first.id] < mapping["batches"][twin.id]
+    for old_id, new_id in mapping["batches"].items():
+        old, new = db.session.get(Batch, old_id), db.session.get(Batch, new_id)
+        assert new.instance_id == target.id
+        assert (new.batch_name, new.batch_division, new.year) == (old.batch_name, old.batch_division, old.year + 1)
+        assert _members(new) == _members(old)
+    assert mapping["memberships"] == len(students)
+
+    new_subject = db.session.get(Subject, mapping["subjects"][subject.id])
+    assert new_subject.instance_id == target.id
+    assert new_subject.subject_name == subject.subject_name
+
+    for model, key in ((SubjectTheory, "theory_subjects"), (SubjectPractical, "practical_subjects")):
+        assert len(mapping[key]) == 3
+        for old_id, new_id in mapping[key].items():
+            old, new = db.session.get(model, old_id), db.session.get(model, new_id)
+            assert new.subject_id == mapping["subjects"][old.subject_id]
+            assert new.batch_id == mapping["batches"][old.batch_id]
+
+def test_clone_leaves_batches_past_max_year_behind(instance, teacher, students, subject, make_batch):
+    staying = make_batch('A1', students[:3], year=3)
+    graduating = make_batch('F1', students[3:], division='F', year=4)
+    for batch in (staying, graduating):
+        _allocate(subject, batch, teacher)
+    target = FeedbackInstance(instance_name='Next year')
+    db.session.add(target)
+    db.session.commit()
+
+    mapping = clone_instance(instance.id, target.id, promote_years=True, max_year=4)
+    db.session.commit()
+
+    assert set(mapping["batches"]) == {staying.id}
+    assert mapping["memberships"] == 3
+    assert [db.session.get(SubjectTheory, old_id).batch_id for old_id in mapping["theory_subjects"]] == [staying.id]
+    assert Batch.query.filter_by(instance_id=target.id).count() == 1
@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+from app import db
+from app.models.feedback import FeedbackUserConnector
+from app.utils.scorecard import compute_scorecards
+
+def _create_form(client, headers, subject, instance, batch, is_theory=True):
+    response = client.post('/api/createFeedbackForm', headers=headers, json={
+        'form_field': {'q1': 'Rate the course', 'q2': 'Rate the teacher', 'q3': 'Comments'},
+        'subject_id': subject.id,
+        'instance_id': instance.id,
+        'due_date': '2030-01-01T00:00:00Z',
+        'year': 2,
+        'batch_list': {str(batch.id): batch.batch_name},
+        'is_theory': is_theory
+    })
+    return response.json['form_id']
+
+def _fill(form_id, answers):
+    """Store answers for the form's connectors in student order; returns the numeric scores"""
+    scores = []
+    connectors = FeedbackUserConnector.query.filter_by(form_id=form_id).order_by(FeedbackUserConnector.student_id)
+    for connector, (q1, q2) in zip(connectors, answers):
+        connector.is_filled = True
+        connector.user_feedback = {'q1': q1, 'q2': q2, 'q3': 'fine'}
+        scores += [float(value) for value in (q1, q2) if value is not None]
+    db.session.commit()
+    return scores
+
+@pytest.fixture
+def scored_instance(client, instance, subject, make_user, make_batch, students, auth_header):
+    first = make_user('first@example.com', 'First', is_staff=True)
+    second = make_user('second@example.com', 'Second', is_staff=True)
+    batch = make_batch('A1', students)
+    db.session.commit()
+
+    theory = _create_form(client, auth_header(first), subject, instance, batch)
+    practical = _create_form(client, auth_header(first), subject, instance, batch, is_theory=False)
+    other = _create_form(client, auth_header(second), subject, instance, batch)
+    scores = {
+        'theory': _fill(theory, [(5, '4'), (3, 2), (4, None), (1, 5), (2, 2), (5, 5)]),
+        'practical': _fill(practical, [(2, 3), (4, 4)]),
+        'other': _fill(other, [(1, 2), (2, 1), (3, '1')])
+    }
+    return first, second, scores
+
+def test_scorecard_statistics_match_numpy(instance, scored_instance):
+    first, second, scores = scored_instance
+    cards = {card['teacher_id']: card for card in compute_scorecards(instance.id)}
+
+    first_scores = np.array(scores['theory'] + scores['practical'])
+    card = cards[first.id]
+    assert card['score_count'] == first_scores.size
+    assert card['mean'] == pytest.approx(first_scores.mean(), abs=1e-4)
+    assert card['median'] == pytest.approx(np.median(first_scores))
+    assert card['std_dev'] == pytest.approx(first_scores.std(), abs=1e-4)
+    assert card['theory'] == {'score_count': len(scores['theory']), 'mean': pytest.approx(np.mean(scores['theory']), abs=1e-4)}
+    assert card['practical'] == {'score_count': len(scores['practical']), 'mean': pytest.approx(np.mean(scores['practical']), abs=1e-4)}
+    assert [form['responses'] for form in card['forms']] == [6, 2]
+    assert card['forms'][0]['question_means']['q3'] is None
+
+    # Percentiles rank the teachers' means across the whole instance
+    assert card['percentile'] == 100.0
+    assert cards[second.id]['percentile'] == 50.0
+    assert cards[second.id]['practical'] == {'score_count': 0, 'mean': None}
+
+def test_std_dev_is_stable_for_large_scores(client, instance, subject, teacher, students, make_batch, auth_header):
+    batch = make_batch('A1', students[:3])
+    db.session.commit()
+    form_id = _create_form(client, auth_header(teacher), subject, instance, batch)
+    values = _fill(form_id, [(1e9 + 1, None), (1e9 + 2, None), (1e9 + 3, None)])
+
+    card = compute_scorecards(instance.id)[0]
+    assert card['std_dev'] == pytest.approx(np.std(values), abs=1e-4)
+
+def test_submissions_reach_cached_scorecards_after_max_age(app, client, instance, subject, teacher, students, make_batch, auth_header):
+    batch = make_batch('A1', students)
+    db.session.commit()
+    form_id = _create_form(client, auth_header(teacher), subject, instance, batch)
+    url = f'/api/getTeacherScorecard?instance_id={instance.id}'
+
+    first = client.get(url, headers=auth_header(teacher)).json
+    assert first['percentile_scope'] == 'instance'
+    assert first['data'][0]['score_count'] == 0
+
+    response = client.post('/api/saveFeedbackFormResult', headers=auth_header(students[0]), json={'data': {'form_id': form_id, 'form_data': {'q1': 4}}})
+    assert response.status_code == 200
+    cached = client.get(url, headers=auth_header(teacher)).json
+    assert cached['computed_at'] == first['computed_at']
+    assert cached['data'][0]['score_count'] == 0
+
+    app.config['SCORECARD_MAX_AGE'] = 0
+    assert client.get(url, headers=auth_header(teacher)).json['data'][0]['score_count'] == 1
@@ -0,0 +1,72 @@
+from sqlalchemy import inspect, insert, text
+from app import db
+from app.models.instance import FeedbackInstance
+from app.models.subject import Subject, SubjectTheory
+from app.utils import timetable
+from app.utils.schema import add_missing_indexes
+
+def _import(client, headers, instance, allocations):
+    response = client.post('/api/importTimetable', headers=headers, json={'instance_id': instance.id, 'allocations': allocations})
+    assert response.status_code == 200
+    return response.json
+
+def test_batches_of_other_instances_are_reported_per_row(client, teacher, instance, make_batch, auth_header):
+    own = make_batch('A1')
+    other_instance = FeedbackInstance(instance_name='Even semester')
+    db.session.add(other_instance)
+    db.session.flush()
+    foreign = make_batch('B1')
+    foreign.instance = other_instance
+    db.session.commit()
+
+    result = _import(client, auth_header(teacher), instance, [
+        {'subject_name': 'Physics', 'batch_id': own.id, 'teacher_ids': [teacher.id]},
+        {'subject_name': 'Physics', 'batch_id': foreign.id, 'teacher_ids': [teacher.id]},
+        {'subject_name': 'Physics', 'batch_id': 9999, 'teacher_ids': [teacher.id]}
+    ])
+
+    assert (result['created_subjects'], result['theory_created']) == (1, 1)
+    assert result['errors'] == [
+        {'row': 2, 'subject_name': 'Physics', 'error': 'Batch belongs to another instance'},
+        {'row': 3, 'subject_name': 'Physics', 'error': 'Batch not found'}
+    ]
+    assert SubjectTheory.query.filter_by(batch_id=foreign.id).count() == 0
+
+def test_subject_created_by_a_concurrent_import_is_reused(client, teacher, instance, make_batch, auth_header, monkeypatch):
+    batch = make_batch('A1')
+    db.session.commit()
+    instance_id = instance.id
+
+    # Another import commits Physics right after this one found it missing
+    subject_ids = timetable._subject_ids
+    def racing_subject_ids(names, instance_id):
+        monkeypatch.setattr(timetable, '_subject_ids', subject_ids)
+        found = subject_ids(names, instance_id)
+        with db.engine.begin() as conn:
+            conn.execute(insert(Subject.__table__).values(subject_name='Physics', instance_id=instance_id))
+        return found
+    monkeypatch.setattr(timetable, '_subject_ids', racing_subject_ids)
+
+    result = _import(client, auth_header(teacher), instance, [
+        {'subject_name': 'Physics', 'batch_id': batch.id, 'teacher_ids': [teacher.id]},
+        {'subject_name': 'Chemistry', 'batch_id': batch.id, 'teacher_ids': [teacher.id]}
+    ])
+
+    assert (result['created_subjects'], result['theory_created'], result['errors']) == (1, 2, [])
+    subjects = Subject.query.filter_by(instance_id=instance_id).all()
+    assert sorted(subject.subject_name for subject in subjects) == ['Chemistry', 'Physics']
+    assert {theory.subject_id for theory in SubjectTheory.query} == {subject.id for subject in subjects}
+
+def test_unique_subject_index_waits_for_duplicates_to_be_merged(app, instance):
+    index = 'ix_subject_instance_id_subject_name'
+    with db.engine.begin() as conn:
+        conn.execute(text(f"DROP INDEX {index}"))
+        conn.execute(insert(Subject.__table__), [{'subject_name': 'Physics', 'instance_id': instance.id}] * 2)
+
+    add_missing_indexes()
+    assert index not in {found['name'] for found in inspect(db.engine).get_indexes('subject')}
+
+    with db.engine.begin() as conn:
+        conn.execute(text("DELETE FROM subject WHERE id > (SELECT MIN(id) FROM subject)"))
+    add_missing_indexes()
+    assert index in {found['name'] for found in inspect(db.engine).get_indexes('subject')}
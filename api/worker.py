@@ -0,0 +1,22 @@
+from app import create_app, db
+from app.utils.aggregates import backfill_form_aggregates
+from app.utils.connectors import backfill_form_batches
+from app.utils.schema import add_missing_columns, add_missing_indexes, drop_retired_tables
+from app.utils.jobs import run_worker
+import logging
+
+def main():
+    """Run the background job worker"""
+    logging.basicConfig(level=logging.INFO)
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        add_missing_columns()
+        add_missing_indexes()
+        drop_retired_tables()
+        backfill_form_batches()
+        backfill_form_aggregates()
+        run_worker()
+
+if __name__ == '__main__':
+    main()